@@ -24,13 +24,35 @@ def create_app(config_class=DevelopmentConfig):
 
     app.config.update(
         UPLOAD_FOLDER = os.path.join(app.instance_path, 'uploads'),
-        QR_FOLDER = os.path.join(app.instance_path, 'qr_codes')
+        QR_FOLDER = os.path.join(app.instance_path, 'qr_codes'),
+        AUDIT_ARCHIVE_FOLDER = os.path.join(app.instance_path, 'audit_archive')
     )
 
     db.init_app(app)
     login_manager.init_app(app)
     migrate.init_app(app, db)
 
+    from .jobs import job_runner
+    job_runner.init_app(app)
+
+    from .qr_cache import qr_cache
+    qr_cache.init_app(app)
+
+    from .profiling import request_profiler
+    request_profiler.init_app(app)
+
+    from .metrics import metrics
+    metrics.init_app(app)
+
+    from .route_cache import route_cache
+    route_cache.init_app(app)
+
+    from .reference_cache import reference_cache
+    reference_cache.init_app(app)
+
+    from .audit import audit_writer
+    audit_writer.init_app(app)
+
     with app.app_context():
         if not os.path.exists(app.config['UPLOAD_FOLDER']):
             os.makedirs(app.config['UPLOAD_FOLDER'])
@@ -42,8 +64,8 @@ def create_app(config_class=DevelopmentConfig):
     @app.context_processor
     def utility_processor():
         def get_stages_for_template():
-            stages_objects = get_stages_query()
-            return [{'id': stage.id, 'name': stage.name} for stage in stages_objects]
+            # Кэшированный кортеж записей (id, name); в шаблонах доступны stage.id и stage.name
+            return get_stages_query()
         return dict(
             to_safe_key=to_safe_key,
             get_stages=get_stages_for_template
@@ -60,5 +82,15 @@ def create_app(config_class=DevelopmentConfig):
 
     from .admin.routes import admin as admin_blueprint
     app.register_blueprint(admin_blueprint, url_prefix='/admin')
+
+    from .progress import rebuild_progress_command, verify_part_progress_command
+    app.cli.add_command(rebuild_progress_command)
+    app.cli.add_command(verify_part_progress_command)
+
+    from .audit_archive import archive_audit_command
+    app.cli.add_command(archive_audit_command)
+
+    from .daily_stats import rebuild_daily_stats_command
+    app.cli.add_command(rebuild_daily_stats_command)
         
     return app
\ No newline at end of file
@@ -1,20 +1,22 @@
 from flask_wtf import FlaskForm
 from wtforms import (StringField, PasswordField, BooleanField, SubmitField, 
-                     SelectMultipleField)
+                     SelectMultipleField, SelectField, TextAreaField, IntegerField)
 from wtforms.validators import DataRequired, Optional, Length, ValidationError
 from flask_wtf.file import FileField, FileAllowed, FileRequired
-from app.models.models import RouteTemplate, Stage
+from app.models.models import RouteTemplate
+from app.progress import MAX_ROUTE_STAGES
+from app.reference_cache import reference_cache
 from wtforms_sqlalchemy.fields import QuerySelectField
 
 # --- Фабрики для полей QuerySelectField ---
 
 def get_route_templates():
-    """Возвращает все шаблоны маршрутов для выпадающего списка."""
-    return RouteTemplate.query.order_by(RouteTemplate.name).all()
+    """Возвращает все шаблоны маршрутов для выпадающего списка (из кэша справочников)."""
+    return reference_cache.route_templates()
 
 def get_stages():
-    """Возвращает все этапы из справочника для выпадающего списка."""
-    return Stage.query.order_by(Stage.name).all()
+    """Возвращает все этапы из справочника для выпадающего списка (из кэша справочников)."""
+    return reference_cache.stages()
 
 # --- Стандартные формы (без изменений) ---
 
@@ -31,6 +33,7 @@ class PartForm(FlaskForm):
     route_template = QuerySelectField(
         'Технологический маршрут', 
         query_factory=get_route_templates, 
+        get_pk=lambda route: route.id,
         get_label='name', 
         allow_blank=False
     )
@@ -42,13 +45,29 @@ class EditPartForm(FlaskForm):
     submit = SubmitField('Сохранить изменения')
 
 class FileUploadForm(FlaskForm):
-    """Форма для загрузки файла Excel."""
-    file = FileField('Excel-файл', validators=[
+    """Форма для загрузки файла Excel или CSV."""
+    file = FileField('Файл Excel или CSV', validators=[
         FileRequired(),
-        FileAllowed(['xlsx', 'xls'], 'Только файлы Excel (.xlsx, .xls)!')
+        FileAllowed(['xlsx', 'xls', 'csv'], 'Только файлы Excel (.xlsx, .xls) или CSV (.csv)!')
     ])
     submit = SubmitField('Загрузить и импортировать')
 
+class QrBatchForm(FlaskForm):
+    """Форма для пакетной генерации QR-кодов по изделию, заданию импорта или списку деталей."""
+    product = StringField('Изделие (Номенклатура)', validators=[Optional()])
+    job_id = IntegerField('Номер задания импорта', validators=[Optional()])
+    part_ids = TextAreaField('Список деталей (по одной в строке)', validators=[Optional()])
+    output_format = SelectField('Формат', choices=[('zip', 'ZIP-архив с PNG'), ('pdf', 'PDF с листами наклеек')])
+    submit = SubmitField('Сгенерировать')
+
+    def validate(self, extra_validators=None):
+        if not super().validate(extra_validators):
+            return False
+        if not (self.product.data or self.job_id.data or (self.part_ids.data or '').strip()):
+            self.part_ids.errors.append('Укажите изделие, задание импорта или список деталей.')
+            return False
+        return True
+
 class StageDictionaryForm(FlaskForm):
     """Форма для добавления этапа в справочник."""
     name = StringField('Название этапа', validators=[DataRequired()])
@@ -79,7 +98,7 @@ class RouteTemplateForm(FlaskForm):
         для поля 'stages' из базы данных.
         """
         super(RouteTemplateForm, self).__init__(*args, **kwargs)
-        self.stages.choices = [(s.id, s.name) for s in Stage.query.order_by('name').all()]
+        self.stages.choices = [(s.id, s.name) for s in get_stages()]
 
     def validate_name(self, name):
         """Проверяет уникальность имени шаблона маршрута."""
@@ -93,6 +112,11 @@ class RouteTemplateForm(FlaskForm):
         elif not (hasattr(self, 'obj') and self.obj) and template:
             raise ValidationError('Шаблон с таким названием уже существует.')
 
+    def validate_stages(self, stages):
+        """Ограничивает длину маршрута размером маски пройденных этапов."""
+        if len(stages.data or []) > MAX_ROUTE_STAGES:
+            raise ValidationError(f'В маршруте может быть не больше {MAX_ROUTE_STAGES} этапов.')
+
 # --- Формы для пользователей (без изменений) ---
 
 class UserBaseForm(FlaskForm):
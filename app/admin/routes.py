@@ -1,16 +1,34 @@
 from flask import (Blueprint, render_template, request, flash, redirect, url_for, 
-                   current_app, send_file, abort)
-from app.models.models import db, Part, StatusHistory, User, AuditLog, RouteTemplate, RouteStage, Stage
-from app.utils import generate_qr_code, create_safe_file_name
+                   current_app, send_file, abort, jsonify, Response)
+from app.models.models import db, Part, StatusHistory, User, RouteTemplate, RouteStage, Stage, ImportJob, AuditLog, AuditArchiveIndex
+from app.utils import create_safe_file_name, build_scan_url
+from app.qr_cache import qr_cache, QrCache
+from app.qr_batch import iter_qr_pngs, stream_zip, stream_label_pdf
+from app.progress import (adjust_progress, add_part_to_progress, route_stage_count, refresh_route,
+                          recompute_parts, stage_bit)
+from app.jobs import job_runner
+from app.profiling import request_profiler
+from app.metrics import metrics
+from app.reference_cache import reference_cache, invalidate_reference_data
+from app.audit import (audit_writer, audit_log_page, audit_filter_conditions, approximate_count, AUDIT_ACTIONS,
+                       AUDIT_PAGE_SIZE, AUDIT_PAGE_MAX, encode_cursor as encode_audit_cursor,
+                       decode_cursor as decode_audit_cursor)
+from app.timeline import parse_date
+from app.reports import (stage_duration_report, format_duration, operator_performance, stage_throughput,
+                         daily_output)
+from app.daily_stats import adjust_daily_stats, history_counts, stage_key
+from app.route_cache import route_cache
+from app.scanning import routes_for_write
 from flask_login import login_user, logout_user, login_required, current_user
 import functools
 import os
+import uuid
+from io import BytesIO
 from sqlalchemy.exc import IntegrityError
-import pandas as pd
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import delete
 from .forms import (LoginForm, PartForm, EditPartForm, FileUploadForm, AddUserForm, 
-                    EditUserForm, RouteTemplateForm, StageDictionaryForm)
+                    EditUserForm, RouteTemplateForm, StageDictionaryForm, QrBatchForm)
 
 admin = Blueprint('admin', __name__)
 
@@ -37,7 +55,7 @@ def admin_page():
         return redirect(url_for('main.dashboard'))
     
     part_form = PartForm()
-    if RouteTemplate.query.first() is None:
+    if not reference_cache.route_templates():
         part_form.route_template.choices = []
     
     upload_form = FileUploadForm()
@@ -49,9 +67,29 @@ def audit_log():
     if not current_user.can_view_audit_log:
         flash('У вас нет прав для просмотра журнала аудита.', 'error')
         return redirect(url_for('admin.admin_page'))
-    page = request.args.get('page', 1, type=int)
-    logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).paginate(page=page, per_page=25)
-    return render_template('audit_log.html', logs=logs)
+    filters = {
+        'user_id': request.args.get('user_id', type=int),
+        'action': request.args.get('action', '').strip(),
+        'part_id': request.args.get('part_id', '').strip(),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+    }
+    conditions = audit_filter_conditions(
+        user_id=filters['user_id'], action=filters['action'], part_id=filters['part_id'],
+        date_from=parse_date(filters['date_from']), date_to=parse_date(filters['date_to']))
+    limit = max(1, min(request.args.get('limit', AUDIT_PAGE_SIZE, type=int), AUDIT_PAGE_MAX))
+    logs, has_newer, has_older = audit_log_page(
+        conditions, before=decode_audit_cursor(request.args.get('before')),
+        after=decode_audit_cursor(request.args.get('after')), limit=limit)
+    total, total_is_exact = approximate_count(conditions)
+    # Параметры фильтров, которые сохраняются в ссылках на соседние страницы
+    filter_args = {key: value for key, value in filters.items() if value}
+    users = db.session.query(User.id, User.username).order_by(User.username).all()
+    return render_template('audit_log.html', logs=logs, has_newer=has_newer, has_older=has_older,
+                           newer_cursor=encode_audit_cursor(logs[0]) if logs else None,
+                           older_cursor=encode_audit_cursor(logs[-1]) if logs else None,
+                           total=total, total_is_exact=total_is_exact, filters=filters,
+                           filter_args=filter_args, users=users, actions=AUDIT_ACTIONS)
 
 # --- РАЗДЕЛ ОТЧЕТОВ ---
 
@@ -70,25 +108,24 @@ def report_operator_performance():
         flash('У вас нет прав для просмотра отчетов.', 'error')
         return redirect(url_for('admin.admin_page'))
     
-    date_from_str = request.args.get('date_from')
-    date_to_str = request.args.get('date_to')
-    
-    query = db.session.query(
-        StatusHistory.operator_name,
-        func.count(StatusHistory.id).label('stages_completed')
-    ).group_by(StatusHistory.operator_name).order_by(func.count(StatusHistory.id).desc())
-    
-    if date_from_str:
-        date_from = datetime.strptime(date_from_str, '%Y-%m-%d')
-        query = query.filter(StatusHistory.timestamp >= date_from)
-    if date_to_str:
-        date_to = datetime.strptime(date_to_str, '%Y-%m-%d')
-        query = query.filter(StatusHistory.timestamp <= date_to)
-        
-    data = query.all()
-    
+    date_from_str = request.args.get('date_from', '')
+    date_to_str = request.args.get('date_to', '')
+    # Отчет строится по дневной сводке (app/daily_stats.py), а не по всей истории этапов
+    data = operator_performance(parse_date(date_from_str), parse_date(date_to_str))
     return render_template('reports/operator_performance.html', data=data, date_from=date_from_str, date_to=date_to_str)
 
+@admin.route('/reports/stage_throughput')
+@login_required
+def report_stage_throughput():
+    if not current_user.can_view_reports:
+        flash('У вас нет прав для просмотра отчетов.', 'error')
+        return redirect(url_for('admin.admin_page'))
+    date_from_str = request.args.get('date_from', '')
+    date_to_str = request.args.get('date_to', '')
+    date_from, date_to = parse_date(date_from_str), parse_date(date_to_str)
+    return render_template('reports/stage_throughput.html', stages=stage_throughput(date_from, date_to),
+                           days=daily_output(date_from, date_to), date_from=date_from_str, date_to=date_to_str)
+
 @admin.route('/reports/stage_duration')
 @login_required
 def report_stage_duration():
@@ -96,8 +133,16 @@ def report_stage_duration():
         flash('У вас нет прав для просмотра отчетов.', 'error')
         return redirect(url_for('admin.admin_page'))
 
-    flash('Отчет по длительности этапов находится в разработке.', 'info')
-    return redirect(url_for('admin.reports_index'))
+    filters = {
+        'route_id': request.args.get('route_id', type=int),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+    }
+    data = stage_duration_report(route_template_id=filters['route_id'],
+                                 date_from=parse_date(filters['date_from']),
+                                 date_to=parse_date(filters['date_to']))
+    return render_template('reports/stage_duration.html', data=data, filters=filters,
+                           routes=reference_cache.route_templates(), format_duration=format_duration)
 
 # --- РАЗДЕЛ АУТЕНТИФИКАЦИИ ---
 
@@ -110,9 +155,7 @@ def login():
         user = User.query.filter_by(username=form.username.data).first()
         if user and user.check_password(form.password.data):
             login_user(user)
-            log_entry = AuditLog(user_id=user.id, action="Вход в систему", details=f"Пользователь '{user.username}' вошел в систему.")
-            db.session.add(log_entry)
-            db.session.commit()
+            audit_writer.record(user.id, "Вход в систему", f"Пользователь '{user.username}' вошел в систему.")
             flash('Вы успешно вошли в систему!', 'success')
             return redirect(url_for('main.dashboard'))
         else:
@@ -122,9 +165,7 @@ def login():
 @admin.route('/logout')
 @login_required
 def logout():
-    log_entry = AuditLog(user_id=current_user.id, action="Выход из системы", details=f"Пользователь '{current_user.username}' вышел из системы.")
-    db.session.add(log_entry)
-    db.session.commit()
+    audit_writer.record(current_user.id, "Выход из системы", f"Пользователь '{current_user.username}' вышел из системы.")
     logout_user()
     flash('Вы вышли из системы.', 'success')
     return redirect(url_for('admin.login'))
@@ -155,6 +196,7 @@ def add_stage():
             new_stage = Stage(name=stage_name)
             db.session.add(new_stage)
             db.session.commit()
+            invalidate_reference_data()
             flash(f'Этап "{stage_name}" успешно добавлен в справочник.', 'success')
     else:
         for field, errors in form.errors.items():
@@ -177,6 +219,7 @@ def delete_stage(stage_id):
         stage_name = stage.name
         db.session.delete(stage)
         db.session.commit()
+        invalidate_reference_data()
         flash(f'Этап "{stage_name}" удален из справочника.', 'success')
     return redirect(url_for('admin.list_stages'))
 
@@ -206,9 +249,8 @@ def add_route():
             route_stage = RouteStage(template=new_template, stage_id=stage_id, order=i)
             db.session.add(route_stage)
         db.session.commit()
-        log_entry = AuditLog(user_id=current_user.id, action="Управление маршрутами", details=f"Создан новый маршрут '{new_template.name}'.")
-        db.session.add(log_entry)
-        db.session.commit()
+        invalidate_reference_data()
+        audit_writer.record(current_user.id, "Управление маршрутами", f"Создан новый маршрут '{new_template.name}'.")
         flash('Новый технологический маршрут успешно создан.', 'success')
         return redirect(url_for('admin.list_routes'))
     return render_template('route_form.html', form=form, title='Создать новый маршрут')
@@ -233,9 +275,16 @@ def edit_route(route_id):
         for i, stage_id in enumerate(form.stages.data):
             route_stage = RouteStage(template=template, stage_id=stage_id, order=i)
             db.session.add(route_stage)
-        log_entry = AuditLog(user_id=current_user.id, action="Управление маршрутами", details=f"Изменен маршрут '{template.name}'.")
-        db.session.add(log_entry)
+        db.session.flush()
+        refresh_route(template.id)
+        # Позиции этапов изменились - маски пройденных этапов деталей пересчитываются
+        # по новым этапам в той же транзакции, кэш сбрасывается после фиксации
+        recompute_parts(template_id=template.id, route=route_cache.load(template.id))
+        route_cache.stamp()
         db.session.commit()
+        reference_cache.invalidate()
+        route_cache.invalidate(bump=False)
+        audit_writer.record(current_user.id, "Управление маршрутами", f"Изменен маршрут '{template.name}'.")
         flash('Маршрут успешно обновлен.', 'success')
         return redirect(url_for('admin.list_routes'))
     form.stages.data = [stage.stage_id for stage in template.stages.order_by('order')]
@@ -258,9 +307,8 @@ def delete_route(route_id):
     template_name = template.name
     db.session.delete(template)
     db.session.commit()
-    log_entry = AuditLog(user_id=current_user.id, action="Управление маршрутами", details=f"Удален маршрут '{template_name}'.")
-    db.session.add(log_entry)
-    db.session.commit()
+    invalidate_reference_data()
+    audit_writer.record(current_user.id, "Управление маршрутами", f"Удален маршрут '{template_name}'.")
     flash(f'Маршрут "{template_name}" успешно удален.', 'success')
     return redirect(url_for('admin.list_routes'))
 
@@ -278,9 +326,9 @@ def add_single_part():
         try:
             new_part = Part(part_id=part_id, product_designation=product, route_template_id=route_template.id)
             db.session.add(new_part)
-            log_entry = AuditLog(part_id=part_id, user_id=current_user.id, action="Создание", details="Деталь создана вручную.")
-            db.session.add(log_entry)
+            adjust_progress(product, parts=1, possible=route_stage_count(route_template.id))
             db.session.commit()
+            audit_writer.record(current_user.id, "Создание", "Деталь создана вручную.", part_id=part_id)
             flash(f"Успешно добавлена деталь: {part_id}", 'success')
             return redirect(url_for('admin.ask_to_generate_qr', part_id=part_id))
         except IntegrityError:
@@ -300,47 +348,41 @@ def upload_excel():
         return redirect(url_for('main.dashboard'))
     form = FileUploadForm()
     if form.validate_on_submit():
-        default_route = RouteTemplate.query.filter_by(is_default=True).first()
+        default_route = reference_cache.default_route_template()
         if not default_route:
             flash('Ошибка: Невозможно выполнить импорт, так как не задан технологический маршрут по умолчанию.', 'error')
             return redirect(url_for('admin.admin_page'))
         file = form.file.data
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], file.filename)
+        # Уникальное имя файла, чтобы параллельные загрузки не перезаписывали друг друга
+        stored_name = f"{uuid.uuid4().hex}_{create_safe_file_name(file.filename)}"
+        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], stored_name)
         file.save(filepath)
-        PART_ID_COLUMN, PRODUCT_NAME_COLUMN = 'Артикул', 'Номенклатура'
-        added, skipped = 0, 0
-        try:
-            df = pd.read_excel(filepath)
-            if PART_ID_COLUMN not in df.columns or PRODUCT_NAME_COLUMN not in df.columns:
-                flash(f"Ошибка: В файле отсутствуют колонки '{PART_ID_COLUMN}' и/или '{PRODUCT_NAME_COLUMN}'.", 'error')
-                return redirect(url_for('admin.admin_page'))
-            for index, row in df.iterrows():
-                part_id = str(row[PART_ID_COLUMN]).strip()
-                product = str(row[PRODUCT_NAME_COLUMN]).strip()
-                if not part_id or not product or part_id.lower() == 'nan':
-                    continue
-                if db.session.get(Part, part_id):
-                    skipped += 1
-                    continue
-                new_part = Part(part_id=part_id, product_designation=product, route_template_id=default_route.id)
-                db.session.add(new_part)
-                log_entry = AuditLog(part_id=part_id, user_id=current_user.id, action="Создание", details=f"Деталь импортирована из файла {file.filename}.")
-                db.session.add(log_entry)
-                added += 1
-            db.session.commit()
-            flash(f"Импорт завершен. Добавлено: {added}, пропущено дубликатов: {skipped}.", 'success')
-        except Exception as e:
-            db.session.rollback()
-            flash(f"Произошла ошибка при обработке файла: {e}", 'error')
-        finally:
-            if os.path.exists(filepath):
-                os.remove(filepath)
+        job = ImportJob(filename=file.filename, filepath=filepath, user_id=current_user.id,
+                        route_template_id=default_route.id)
+        db.session.add(job)
+        db.session.commit()
+        job_runner.submit_import(job.id)
+        flash(f"Файл {file.filename} поставлен в очередь на импорт (задание #{job.id}).", 'success')
+        return redirect(url_for('admin.job_status', job_id=job.id))
     else:
         for field, errors in form.errors.items():
             for error in errors:
                 flash(error, 'error')
     return redirect(url_for('admin.admin_page'))
 
+@admin.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    if not current_user.can_add_parts:
+        flash('У вас нет прав на просмотр заданий импорта.', 'error')
+        return redirect(url_for('main.dashboard'))
+    job = db.session.get(ImportJob, job_id)
+    if not job:
+        abort(404)
+    if request.args.get('format') == 'json':
+        return jsonify(job.to_dict())
+    return render_template('job_status.html', job=job)
+
 @admin.route('/edit/<string:part_id>', methods=['GET', 'POST'])
 @login_required
 def edit_part(part_id):
@@ -355,11 +397,13 @@ def edit_part(part_id):
         old_designation = part_to_edit.product_designation
         new_designation = form.product_designation.data
         if old_designation != new_designation:
+            add_part_to_progress(part_to_edit, sign=-1)
             part_to_edit.product_designation = new_designation
-            log_details = f"Поле 'Название изделия' изменено с '{old_designation}' на '{new_designation}'."
-            log_entry = AuditLog(part_id=part_id, user_id=current_user.id, action="Редактирование", details=log_details)
-            db.session.add(log_entry)
+            add_part_to_progress(part_to_edit, sign=1)
             db.session.commit()
+            audit_writer.record(current_user.id, "Редактирование",
+                                f"Поле 'Название изделия' изменено с '{old_designation}' на '{new_designation}'.",
+                                part_id=part_id)
             flash(f"Данные для детали {part_id} успешно обновлены.", 'success')
         else:
             flash("Изменений не было.", "info")
@@ -376,10 +420,15 @@ def delete_part(part_id):
     if not part_to_delete:
         abort(404)
     try:
-        log_entry = AuditLog(part_id=part_id, user_id=current_user.id, action="Удаление", details=f"Деталь '{part_id}' и вся ее история были удалены.")
-        db.session.add(log_entry)
+        add_part_to_progress(part_to_delete, sign=-1)
+        adjust_daily_stats({key: -count for key, count in history_counts(StatusHistory.part_id == part_id).items()})
+        # Журнал детали и указатель ее архива удаляются одним запросом, а не через загрузку коллекции audit_logs
+        db.session.execute(delete(AuditLog).where(AuditLog.part_id == part_id))
+        db.session.execute(delete(AuditArchiveIndex).where(AuditArchiveIndex.part_id == part_id))
         db.session.delete(part_to_delete)
         db.session.commit()
+        # Запись не ссылается на удаленную деталь (внешний ключ), номер указан в описании
+        audit_writer.record(current_user.id, "Удаление", f"Деталь '{part_id}' и вся ее история были удалены.")
         flash(f"Деталь {part_id} и вся ее история удалены.", 'success')
     except Exception as e:
         db.session.rollback()
@@ -400,20 +449,82 @@ def generate_single_qr(part_id):
     if not (current_user.can_add_parts or current_user.can_generate_qr):
         flash('У вас нет прав на генерацию QR-кодов.', 'error')
         return redirect(url_for('main.dashboard'))
-    qr_img_bytes = generate_qr_code(part_id)
-    if qr_img_bytes:
+    # ETag зависит только от закодированного URL, поэтому повторная загрузка
+    # того же кода проверяется без обращения к кэшу и к базе данных.
+    etag = QrCache.make_key(build_scan_url(part_id))
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'})
+    try:
+        png, etag = qr_cache.get_png(part_id)
+    except Exception as e:
+        current_app.logger.error(f"Ошибка создания QR-кода для {part_id}: {e}")
+        png = None
+    if png:
         part = db.session.get(Part, part_id)
-        log_action = "Генерация QR" if not part or not part.history else "Перегенерация QR"
+        log_action = "Генерация QR" if not part or not part.completed_count else "Перегенерация QR"
         log_details = f"{'Создан' if log_action == 'Генерация QR' else 'Пересоздан'} QR-код для детали '{part_id}'."
-        log_entry = AuditLog(part_id=part_id, user_id=current_user.id, action=log_action, details=log_details)
-        db.session.add(log_entry)
-        db.session.commit()
+        audit_writer.record(current_user.id, log_action, log_details, part_id=part_id)
         safe_filename = create_safe_file_name(f"part_{part_id}_qr.png")
-        return send_file(qr_img_bytes, mimetype='image/png', as_attachment=True, download_name=safe_filename)
+        response = send_file(BytesIO(png), mimetype='image/png', as_attachment=True,
+                             download_name=safe_filename, etag=etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
     else:
         flash(f'Не удалось создать QR-код для детали {part_id}.', 'error')
         return redirect(url_for('main.dashboard'))
 
+@admin.route('/generate_qr/batch', methods=['GET', 'POST'])
+@login_required
+def generate_qr_batch():
+    if not (current_user.can_add_parts or current_user.can_generate_qr):
+        flash('У вас нет прав на генерацию QR-кодов.', 'error')
+        return redirect(url_for('main.dashboard'))
+    form = QrBatchForm()
+    if not form.is_submitted():
+        # Форму можно открыть с уже заполненным изделием или заданием импорта
+        form.product.data = request.args.get('product')
+        form.job_id.data = request.args.get('job_id', type=int)
+    if form.validate_on_submit():
+        if form.product.data:
+            source = f"изделия '{form.product.data}'"
+            part_ids = [row[0] for row in db.session.query(Part.part_id)
+                        .filter_by(product_designation=form.product.data).order_by(Part.part_id)]
+        elif form.job_id.data:
+            source = f"задания импорта #{form.job_id.data}"
+            part_ids = [row[0] for row in db.session.query(Part.part_id)
+                        .filter_by(import_job_id=form.job_id.data).order_by(Part.part_id)]
+        else:
+            source = "списка деталей"
+            # Порядок сохраняется, повторы отбрасываются
+            part_ids = list(dict.fromkeys(line.strip() for line in form.part_ids.data.splitlines() if line.strip()))
+
+        if not part_ids:
+            flash('Не найдено ни одной детали для генерации QR-кодов.', 'error')
+            return render_template('qr_batch.html', form=form)
+        max_parts = current_app.config['QR_BATCH_MAX_PARTS']
+        if len(part_ids) > max_parts:
+            flash(f'Слишком много деталей в одном пакете: {len(part_ids)} (максимум {max_parts}).', 'error')
+            return render_template('qr_batch.html', form=form)
+
+        audit_writer.record(current_user.id, "Пакетная генерация QR",
+                            f"Сгенерировано QR-кодов: {len(part_ids)} для {source}.")
+
+        # URL вычисляются заранее, поэтому генератору ответа не нужен контекст приложения
+        pngs = iter_qr_pngs([build_scan_url(part_id) for part_id in part_ids],
+                            current_app.config['QR_BATCH_WORKERS'])
+        metrics.qr_rendered('batch', len(part_ids))
+        if form.output_format.data == 'pdf':
+            body, mimetype, extension = stream_label_pdf(part_ids, pngs), 'application/pdf', 'pdf'
+        else:
+            body, mimetype, extension = stream_zip(part_ids, pngs), 'application/zip', 'zip'
+        download_name = create_safe_file_name(f"qr_{datetime.utcnow():%Y%m%d_%H%M%S}.{extension}")
+        return Response(body, mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename="{download_name}"'})
+    for field, errors in form.errors.items():
+        for error in errors:
+            flash(error, 'error')
+    return render_template('qr_batch.html', form=form)
+
 @admin.route('/cancel_stage/<int:history_id>', methods=['POST'])
 @login_required
 def cancel_stage(history_id):
@@ -425,14 +536,20 @@ def cancel_stage(history_id):
         abort(404)
     part_id = history_entry.part.part_id
     status_to_be_deleted = history_entry.status
-    log_details = f"Отменен этап производства: '{status_to_be_deleted}'."
-    log_entry = AuditLog(part_id=part_id, user_id=current_user.id, action="Отмена этапа", details=log_details)
-    db.session.add(log_entry)
+    adjust_progress(history_entry.part.product_designation, completed=-1)
+    adjust_daily_stats({stage_key(history_entry.timestamp, history_entry.operator_name, status_to_be_deleted): -1})
     db.session.delete(history_entry)
     part_to_update = db.session.get(Part, part_id)
+    part_to_update.completed_count = max(part_to_update.completed_count - 1, 0)
+    bit = stage_bit(routes_for_write().get(part_to_update.route_template_id), status_to_be_deleted)
+    if bit and not StatusHistory.query.filter(StatusHistory.part_id == part_id, StatusHistory.status == status_to_be_deleted,
+                                              StatusHistory.id != history_id).first():
+        part_to_update.completed_mask &= ~bit
     new_last_history = StatusHistory.query.filter_by(part_id=part_id).order_by(StatusHistory.timestamp.desc()).first()
     part_to_update.current_status = new_last_history.status if new_last_history else 'На складе'
     db.session.commit()
+    audit_writer.record(current_user.id, "Отмена этапа", f"Отменен этап производства: '{status_to_be_deleted}'.",
+                        part_id=part_id)
     flash(f"Этап '{status_to_be_deleted}' для детали {part_id} был успешно отменен.", 'success')
     return redirect(url_for('main.history', part_id=part_id))
 
@@ -465,9 +582,7 @@ def add_user():
         new_user.set_password(form.password.data)
         db.session.add(new_user)
         db.session.commit()
-        log_entry = AuditLog(user_id=current_user.id, action="Управление пользователями", details=f"Создан новый пользователь '{new_user.username}'.")
-        db.session.add(log_entry)
-        db.session.commit()
+        audit_writer.record(current_user.id, "Управление пользователями", f"Создан новый пользователь '{new_user.username}'.")
         flash(f'Пользователь {new_user.username} успешно создан.', 'success')
         return redirect(url_for('admin.list_users'))
     return render_template('add_user.html', form=form)
@@ -510,8 +625,21 @@ def delete_user(user_id):
     username_deleted = user.username
     db.session.delete(user)
     db.session.commit()
-    log_entry = AuditLog(user_id=current_user.id, action="Управление пользователями", details=f"Удален пользователь '{username_deleted}'.")
-    db.session.add(log_entry)
-    db.session.commit()
+    audit_writer.record(current_user.id, "Управление пользователями", f"Удален пользователь '{username_deleted}'.")
     flash(f'Пользователь {username_deleted} удален.', 'success')
-    return redirect(url_for('admin.list_users'))
\ No newline at end of file
+    return redirect(url_for('admin.list_users'))
+
+# --- РАЗДЕЛ МЕТРИК ПРОИЗВОДИТЕЛЬНОСТИ ---
+
+@admin.route('/metrics')
+@admin_required
+def performance_metrics():
+    return render_template('metrics.html', endpoints=request_profiler.snapshot(),
+                           default_budget=current_app.config.get('QUERY_BUDGET'))
+
+@admin.route('/metrics/reset', methods=['POST'])
+@admin_required
+def reset_metrics():
+    request_profiler.reset()
+    flash('Статистика запросов сброшена.', 'success')
+    return redirect(url_for('admin.performance_metrics'))
@@ -0,0 +1,224 @@
+# file: app/audit.py
+import atexit
+import queue
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select, insert, func, or_
+from sqlalchemy.orm import joinedload
+from app import db
+from app.models.models import AuditLog
+
+AUDIT_PAGE_SIZE = 25
+AUDIT_PAGE_MAX = 200
+# Точный подсчет записей с фильтрами ограничивается этим числом
+AUDIT_COUNT_CAP = 10000
+
+# Действия, которые записываются в журнал (для фильтра на странице журнала)
+AUDIT_ACTIONS = ('Вход в систему', 'Выход из системы', 'Создание', 'Редактирование', 'Удаление',
+                 'Отмена этапа', 'Генерация QR', 'Перегенерация QR', 'Пакетная генерация QR',
+                 'Управление маршрутами', 'Управление пользователями')
+
+
+class AuditQueue:
+    """
+    Очередь записей журнала одного приложения и ее фоновый поток. Поток
+    записывает накопленные строки одной вставкой не реже раза в
+    AUDIT_FLUSH_INTERVAL секунд или по набору AUDIT_BATCH_SIZE строк. Если
+    очередь заполнена, строка записывается сразу в потоке запроса. Остаток
+    очереди записывается при завершении процесса; после shutdown() строки
+    записываются сразу.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.synchronous = app.config.get('AUDIT_SYNCHRONOUS', False)
+        self.batch_size = app.config.get('AUDIT_BATCH_SIZE', 200)
+        self.flush_interval = app.config.get('AUDIT_FLUSH_INTERVAL', 0.5)
+        self.queue = queue.Queue(maxsize=app.config.get('AUDIT_QUEUE_SIZE', 10000))
+        self.thread = None
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def put(self, row):
+        if self.synchronous or self.stopping.is_set():
+            self.write([row])
+            return
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            # Переполнение очереди тормозит запрос, но не теряет записи
+            self.write([row])
+            return
+        # Остановка началась после проверки выше: строку могла не застать итоговая запись очереди
+        if self.stopping.is_set():
+            self.flush()
+
+    def flush(self):
+        """Записывает все строки, накопленные в очереди, в текущем потоке."""
+        while True:
+            rows = self._drain(self.batch_size)
+            if not rows:
+                return
+            self.write(rows)
+
+    def shutdown(self):
+        """Останавливает фоновый поток и записывает остаток очереди."""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.flush()
+
+    def _ensure_started(self):
+        # Поток запускается при первой записи: команды CLI и миграции его не создают
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self.thread.start()
+                atexit.register(self.shutdown)
+
+    def _drain(self, limit, timeout=None):
+        rows = []
+        try:
+            rows.append(self.queue.get(timeout=timeout) if timeout else self.queue.get_nowait())
+            while len(rows) < limit:
+                rows.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return rows
+
+    def _run(self):
+        while not self.stopping.is_set():
+            rows = self._drain(self.batch_size, timeout=self.flush_interval)
+            if rows:
+                self.write(rows)
+
+    def write(self, rows):
+        """Записывает строки одной вставкой в отдельной сессии."""
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(AuditLog), rows)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self._write_one_by_one(rows)
+            finally:
+                db.session.remove()
+
+    def _write_one_by_one(self, rows):
+        # Ошибочная строка не должна уносить с собой весь пакет
+        for row in rows:
+            try:
+                db.session.execute(insert(AuditLog), [row])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception(f"Не удалось записать в журнал аудита: {row}")
+
+
+class AuditWriter:
+    """
+    Запись журнала аудита вне транзакции запроса: record() ставит строку в
+    очередь текущего приложения (AuditQueue), и запрос не ждет записи в базу.
+    В синхронном режиме (AUDIT_SYNCHRONOUS, тесты) строка записывается сразу.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['audit_writer'] = AuditQueue(app)
+
+    @staticmethod
+    def _queue():
+        return current_app.extensions['audit_writer']
+
+    def record(self, user_id, action, details=None, part_id=None):
+        """Добавляет запись в журнал аудита. Вызывается после фиксации основной операции."""
+        self._queue().put({'user_id': user_id, 'action': action, 'details': details, 'part_id': part_id,
+                           'timestamp': datetime.utcnow()})
+
+    def flush(self):
+        self._queue().flush()
+
+
+audit_writer = AuditWriter()
+
+
+def encode_cursor(log):
+    """Курсор keyset-пагинации журнала: (timestamp, id) записи."""
+    return f"{log.timestamp.isoformat()}|{log.id}"
+
+
+def decode_cursor(value):
+    """Разбирает курсор в (timestamp, id) или возвращает None."""
+    try:
+        timestamp, log_id = value.split('|')
+        return datetime.fromisoformat(timestamp), int(log_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def audit_filter_conditions(user_id=None, action=None, part_id=None, date_from=None, date_to=None):
+    """
+    Условия фильтров журнала. Каждому фильтру соответствует индекс вида
+    (колонка, timestamp), поэтому выборка страницы идет по индексу в порядке сортировки.
+    """
+    conditions = []
+    if user_id:
+        conditions.append(AuditLog.user_id == user_id)
+    if action:
+        conditions.append(AuditLog.action == action)
+    if part_id:
+        conditions.append(AuditLog.part_id == part_id)
+    if date_from:
+        conditions.append(AuditLog.timestamp >= date_from)
+    if date_to:
+        # Дата "по" включается в период целиком
+        conditions.append(AuditLog.timestamp < date_to + timedelta(days=1))
+    return conditions
+
+
+def audit_log_page(conditions, before=None, after=None, limit=AUDIT_PAGE_SIZE):
+    """
+    Страница журнала от новых записей к старым по курсору: before - записи
+    старее курсора, after - новее (переход назад). Без курсора - самые новые.
+    Возвращает (записи с загруженным пользователем, есть ли новее, есть ли старее).
+    """
+    query = AuditLog.query.options(joinedload(AuditLog.user)).filter(*conditions)
+    if after:
+        timestamp, log_id = after
+        query = query.filter(AuditLog.timestamp >= timestamp,
+                             or_(AuditLog.timestamp > timestamp, AuditLog.id > log_id))
+        logs = query.order_by(AuditLog.timestamp.asc(), AuditLog.id.asc()).limit(limit + 1).all()
+        has_newer = len(logs) > limit
+        return list(reversed(logs[:limit])), has_newer, True
+    if before:
+        timestamp, log_id = before
+        # Отдельное условие на timestamp - диапазон по индексу; OR уточняет
+        # позицию среди записей с тем же временем
+        query = query.filter(AuditLog.timestamp <= timestamp,
+                             or_(AuditLog.timestamp < timestamp, AuditLog.id < log_id))
+    logs = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit + 1).all()
+    return logs[:limit], before is not None, len(logs) > limit
+
+
+def approximate_count(conditions):
+    """
+    Примерное число записей журнала: без фильтров - по диапазону id (чтение
+    двух концов первичного ключа), с фильтрами - подсчет не более
+    AUDIT_COUNT_CAP записей. Возвращает (число, точно ли оно).
+    """
+    if not conditions:
+        # Отдельные подзапросы: SQLite читает min/max по индексу, только если агрегат в запросе один
+        low, high = db.session.execute(select(select(func.min(AuditLog.id)).scalar_subquery(),
+                                              select(func.max(AuditLog.id)).scalar_subquery())).one()
+        return (high - low + 1 if high is not None else 0), False
+    capped = select(AuditLog.id).where(*conditions).limit(AUDIT_COUNT_CAP + 1).subquery()
+    count = db.session.execute(select(func.count()).select_from(capped)).scalar()
+    return min(count, AUDIT_COUNT_CAP), count <= AUDIT_COUNT_CAP
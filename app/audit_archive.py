@@ -0,0 +1,178 @@
+# file: app/audit_archive.py
+import os
+import gzip
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from sqlalchemy import select, delete, update, bindparam, func, or_
+from app import db
+from app.models.models import AuditLog, AuditArchiveIndex, User
+from app.timeline import TimelineEntry, AUDIT
+
+# Сколько записей переносится в архив за одну транзакцию
+ARCHIVE_CHUNK_SIZE = 1000
+
+# Ключ указателя архива для записей, не относящихся к детали
+NO_PART = ''
+
+
+def archive_path(month):
+    """Путь к месячному файлу архива журнала (месяц в формате ГГГГ-ММ)."""
+    return os.path.join(current_app.config['AUDIT_ARCHIVE_FOLDER'], f"audit-{month}.jsonl.gz")
+
+
+def _pending_path():
+    return os.path.join(current_app.config['AUDIT_ARCHIVE_FOLDER'], 'pending.json')
+
+
+def _row_key(row):
+    return row.timestamp, row.id
+
+
+def _read_pending():
+    """
+    Диапазон ((timestamp, id) первой и последней записи) порции, дописанной в
+    файлы архива, но еще не удаленной из таблицы, или None.
+    """
+    try:
+        with open(_pending_path(), encoding='utf-8') as f:
+            first, last = json.load(f)
+    except FileNotFoundError:
+        return None
+    return ((datetime.fromisoformat(first[0]), first[1]), (datetime.fromisoformat(last[0]), last[1]))
+
+
+def _write_pending(first, last):
+    path = _pending_path()
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump([[timestamp.isoformat(), log_id] for timestamp, log_id in (first, last)], f)
+    os.replace(path + '.tmp', path)
+
+
+def _archive_record(row):
+    # Имя пользователя сохраняется в архиве: запись читается без обращения к таблице Users
+    return {'id': row.id, 'timestamp': row.timestamp.isoformat(), 'user_id': row.user_id,
+            'username': row.username, 'action': row.action, 'part_id': row.part_id, 'details': row.details}
+
+
+def _add_to_index(counts):
+    """Увеличивает счетчики указателя архива: counts - Counter по (part_id, месяц)."""
+    months = {month for _, month in counts}
+    part_ids = {part_id for part_id, _ in counts}
+    existing = set(db.session.execute(
+        select(AuditArchiveIndex.part_id, AuditArchiveIndex.month)
+        .where(AuditArchiveIndex.month.in_(months), AuditArchiveIndex.part_id.in_(part_ids))).all())
+    updates = [{'b_part_id': part_id, 'b_month': month, 'b_entries': entries}
+               for (part_id, month), entries in counts.items() if (part_id, month) in existing]
+    if updates:
+        db.session.execute(
+            update(AuditArchiveIndex.__table__)
+            .where(AuditArchiveIndex.part_id == bindparam('b_part_id'),
+                   AuditArchiveIndex.month == bindparam('b_month'))
+            .values(entries=AuditArchiveIndex.entries + bindparam('b_entries')),
+            updates
+        )
+    db.session.add_all([AuditArchiveIndex(part_id=part_id, month=month, entries=entries)
+                        for (part_id, month), entries in counts.items() if (part_id, month) not in existing])
+
+
+def archive_audit_logs(before, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """
+    Переносит записи журнала аудита старше before в сжатые месячные файлы
+    JSONL (AUDIT_ARCHIVE_FOLDER) и удаляет их из таблицы AuditLogs. Для
+    поиска по детали ведется указатель AuditArchiveIndex (деталь, месяц, число
+    записей). Каждая порция - отдельная транзакция: файл дописывается до
+    удаления строк, поэтому прерванный перенос не теряет записей. Диапазон
+    дописанной порции запоминается до фиксации (pending.json), и повторный
+    запуск после сбоя не дописывает ее записи в файлы второй раз.
+    Возвращает число перенесенных записей.
+    """
+    os.makedirs(current_app.config['AUDIT_ARCHIVE_FOLDER'], exist_ok=True)
+    query = select(AuditLog.id, AuditLog.timestamp, AuditLog.user_id, User.username.label('username'),
+                   AuditLog.action, AuditLog.part_id, AuditLog.details)\
+        .outerjoin(User, User.id == AuditLog.user_id)\
+        .where(AuditLog.timestamp < before)\
+        .order_by(AuditLog.timestamp, AuditLog.id)
+    total = 0
+    pending = _read_pending()
+    while True:
+        rows = db.session.execute(query.limit(chunk_size)).all()
+        if not rows:
+            break
+        by_month, counts = {}, Counter()
+        for row in rows:
+            month = row.timestamp.strftime('%Y-%m')
+            # Указатель не был зафиксирован вместе с прерванной порцией, поэтому считаются все строки
+            counts[(row.part_id or NO_PART, month)] += 1
+            if pending is None or not pending[0] <= _row_key(row) <= pending[1]:
+                by_month.setdefault(month, []).append(row)
+        for month, month_rows in by_month.items():
+            # Дозапись в gzip добавляет новый поток в конец файла; gzip.open читает их подряд
+            with gzip.open(archive_path(month), 'at', encoding='utf-8') as f:
+                for row in month_rows:
+                    f.write(json.dumps(_archive_record(row), ensure_ascii=False) + '\n')
+        # Остаток прерванной порции может попасть и в следующие порции, поэтому диапазоны объединяются
+        chunk_first, chunk_last = _row_key(rows[0]), _row_key(rows[-1])
+        pending = (chunk_first, chunk_last) if pending is None else (pending[0], max(pending[1], chunk_last))
+        _write_pending(*pending)
+        _add_to_index(counts)
+        # Порция - первые записи в порядке (timestamp, id), поэтому удаляется диапазоном до последней из них
+        last = rows[-1]
+        db.session.execute(delete(AuditLog).where(
+            AuditLog.timestamp < before, AuditLog.timestamp <= last.timestamp,
+            or_(AuditLog.timestamp < last.timestamp, AuditLog.id <= last.id)))
+        db.session.commit()
+        total += len(rows)
+    if pending is not None:
+        os.remove(_pending_path())
+    return total
+
+
+def archived_count_subquery(part_id):
+    """
+    Подзапрос числа записей журнала детали, перенесенных в архив: добавляется
+    к выборке детали, чтобы страница истории не делала отдельного запроса.
+    """
+    return select(func.coalesce(func.sum(AuditArchiveIndex.entries), 0))\
+        .where(AuditArchiveIndex.part_id == part_id).scalar_subquery()
+
+
+def archived_entry_count(part_id):
+    """Число записей журнала детали, перенесенных в архив."""
+    return db.session.execute(select(archived_count_subquery(part_id))).scalar()
+
+
+def archived_entries(part_id):
+    """
+    Архивные записи журнала детали от новых к старым (TimelineEntry). Читаются
+    только месячные файлы, в которых по указателю есть записи детали.
+    """
+    months = db.session.execute(
+        select(AuditArchiveIndex.month).where(AuditArchiveIndex.part_id == part_id)).scalars().all()
+    entries = []
+    for month in months:
+        path = archive_path(month)
+        if not os.path.exists(path):
+            current_app.logger.warning(f"Файл архива журнала аудита не найден: {path}")
+            continue
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line)
+                if record['part_id'] == part_id:
+                    entries.append(TimelineEntry(AUDIT, record['id'], datetime.fromisoformat(record['timestamp']),
+                                                 record['action'], record['details'], record['username']))
+    entries.sort(key=lambda entry: (entry.timestamp, entry.id), reverse=True)
+    return entries
+
+
+@click.command('archive-audit')
+@click.option('--older-than-days', type=int, default=None,
+              help='Возраст записей в днях (по умолчанию AUDIT_RETENTION_DAYS).')
+def archive_audit_command(older_than_days):
+    """Переносит старые записи журнала аудита в месячные архивные файлы."""
+    days = older_than_days if older_than_days is not None else current_app.config['AUDIT_RETENTION_DAYS']
+    before = datetime.utcnow() - timedelta(days=days)
+    count = archive_audit_logs(before)
+    click.echo(f"Перенесено в архив записей журнала аудита: {count} (старше {before:%Y-%m-%d}).")
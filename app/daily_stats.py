@@ -0,0 +1,78 @@
+# file: app/daily_stats.py
+from collections import Counter
+from datetime import date
+import click
+from sqlalchemy import select, insert, update, delete, exists, bindparam, func
+from app import db
+from app.models.models import StatusHistory, DailyStageStats
+
+
+def stage_key(timestamp, operator_name, stage):
+    """Ключ дневной сводки для записи истории: (день, оператор, этап)."""
+    return timestamp.date(), operator_name, stage
+
+
+def history_counts(*conditions):
+    """Число записей истории по ключам дневной сводки (Counter) для заданного условия."""
+    day = func.date(StatusHistory.timestamp)
+    return Counter({
+        (date.fromisoformat(day_value), operator_name, stage): count
+        for day_value, operator_name, stage, count in db.session.execute(
+            select(day, StatusHistory.operator_name, StatusHistory.status, func.count())
+            .where(*conditions).group_by(day, StatusHistory.operator_name, StatusHistory.status))
+    })
+
+
+def adjust_daily_stats(counts):
+    """
+    Изменяет счетчики дневной сводки на приращения counts
+    ({(день, оператор, этап): n}). Не больше двух операторов на любое число
+    ключей: UPDATE существующих строк и вставка недостающих через executemany.
+    Изменения фиксируются вместе с основной операцией вызывающего кода;
+    строки с нулевым счетчиком удаляются.
+    """
+    params = [{'b_day': day, 'b_operator': operator_name, 'b_stage': stage, 'b_count': count}
+              for (day, operator_name, stage), count in counts.items() if count]
+    if not params:
+        return
+    same_key = (DailyStageStats.day == bindparam('b_day'),
+                DailyStageStats.operator_name == bindparam('b_operator'),
+                DailyStageStats.stage == bindparam('b_stage'))
+    updated = db.session.execute(
+        update(DailyStageStats.__table__).where(*same_key)
+        .values(completed=DailyStageStats.completed + bindparam('b_count')),
+        params
+    ).rowcount
+    additions = [row for row in params if row['b_count'] > 0]
+    # Обычно строки за день уже есть: если обновлены все ключи, вставка не нужна
+    if additions and updated < len(params):
+        db.session.execute(
+            insert(DailyStageStats.__table__).from_select(
+                ['day', 'operator_name', 'stage', 'completed'],
+                select(bindparam('b_day', type_=db.Date), bindparam('b_operator', type_=db.String),
+                       bindparam('b_stage', type_=db.String), bindparam('b_count', type_=db.Integer))
+                .where(~exists().where(*same_key))),
+            additions
+        )
+    if len(additions) < len(params):
+        db.session.execute(delete(DailyStageStats).where(
+            DailyStageStats.day.in_({row['b_day'] for row in params}), DailyStageStats.completed <= 0))
+
+
+def rebuild_daily_stats():
+    """Полностью перестраивает дневную сводку по истории этапов. Возвращает число строк."""
+    db.session.execute(delete(DailyStageStats))
+    day = func.date(StatusHistory.timestamp)
+    db.session.execute(insert(DailyStageStats).from_select(
+        ['day', 'operator_name', 'stage', 'completed'],
+        select(day, StatusHistory.operator_name, StatusHistory.status, func.count())
+        .group_by(day, StatusHistory.operator_name, StatusHistory.status)))
+    db.session.commit()
+    return db.session.execute(select(func.count()).select_from(DailyStageStats)).scalar()
+
+
+@click.command('rebuild-daily-stats')
+def rebuild_daily_stats_command():
+    """Перестраивает дневную сводку этапов по операторам по истории этапов."""
+    count = rebuild_daily_stats()
+    click.echo(f"Дневная сводка этапов перестроена: {count} строк.")
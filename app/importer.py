@@ -0,0 +1,209 @@
+# file: app/importer.py
+import os
+import csv
+import time
+import itertools
+import pandas as pd
+from openpyxl import load_workbook
+from sqlalchemy import insert
+from app import db
+from app.models.models import Part, AuditLog
+from app.progress import adjust_progress, route_stage_count
+
+PART_ID_COLUMN, PRODUCT_NAME_COLUMN = 'Артикул', 'Номенклатура'
+
+# Размер порции для запросов вида IN (...): SQLite ограничивает число параметров
+LOOKUP_CHUNK_SIZE = 500
+# Количество деталей, вставляемых и фиксируемых в одной транзакции
+INSERT_BATCH_SIZE = 1000
+# Количество строк файла, читаемых за один раз при потоковом импорте.
+# Пиковое потребление памяти определяется этим числом, а не размером файла.
+READ_CHUNK_SIZE = 5000
+
+
+class ImportFileError(Exception):
+    """Ошибка структуры импортируемого файла (например, нет нужных колонок)."""
+
+
+class ImportResult:
+    """Итоги импорта: количество прочитанных, добавленных, пропущенных и ошибочных строк."""
+
+    def __init__(self):
+        self.rows_read = 0
+        self.added = 0
+        self.skipped = 0
+        self.errors = 0
+        self.started_at = time.perf_counter()
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_sec(self):
+        return self.rows_read / self.elapsed if self.elapsed > 0 else 0.0
+
+
+def _missing_columns_error():
+    return ImportFileError(
+        f"В файле отсутствуют колонки '{PART_ID_COLUMN}' и/или '{PRODUCT_NAME_COLUMN}'."
+    )
+
+
+def read_excel_frames(filepath):
+    """
+    Читает из Excel-файла только две нужные колонки как строки.
+    Возвращает список DataFrame, совместимый с import_parts().
+    Используется для старого формата .xls, который нельзя читать потоково.
+    """
+    try:
+        frame = pd.read_excel(filepath, usecols=[PART_ID_COLUMN, PRODUCT_NAME_COLUMN], dtype=str)
+    except ValueError as e:
+        # pandas сообщает об отсутствующих колонках из usecols через ValueError
+        raise _missing_columns_error() from e
+    return [frame]
+
+
+def iter_xlsx_frames(filepath, chunk_size=READ_CHUNK_SIZE):
+    """
+    Потоково читает .xlsx в режиме read-only openpyxl и выдает порции
+    по chunk_size строк в виде DataFrame с двумя нужными колонками.
+    """
+    workbook = load_workbook(filepath, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        header = [str(cell).strip() if cell is not None else '' for cell in header]
+        if PART_ID_COLUMN not in header or PRODUCT_NAME_COLUMN not in header:
+            raise _missing_columns_error()
+        part_idx, product_idx = header.index(PART_ID_COLUMN), header.index(PRODUCT_NAME_COLUMN)
+
+        def cell_value(row, idx):
+            value = row[idx] if idx < len(row) else None
+            return None if value is None else str(value)
+
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            yield pd.DataFrame({
+                PART_ID_COLUMN: [cell_value(row, part_idx) for row in chunk],
+                PRODUCT_NAME_COLUMN: [cell_value(row, product_idx) for row in chunk],
+            })
+    finally:
+        workbook.close()
+
+
+def iter_csv_frames(filepath, chunk_size=READ_CHUNK_SIZE, encoding='utf-8-sig'):
+    """
+    Потоково читает CSV порциями по chunk_size строк (pandas chunksize).
+    Разделитель (',' или ';') определяется по первой строке файла.
+    """
+    with open(filepath, encoding=encoding, newline='') as f:
+        first_line = f.readline()
+    try:
+        delimiter = csv.Sniffer().sniff(first_line, delimiters=',;\t').delimiter
+    except csv.Error:
+        delimiter = ','
+    try:
+        reader = pd.read_csv(filepath, usecols=[PART_ID_COLUMN, PRODUCT_NAME_COLUMN], dtype=str,
+                             sep=delimiter, encoding=encoding, chunksize=chunk_size)
+    except ValueError as e:
+        raise _missing_columns_error() from e
+    with reader:
+        yield from reader
+
+
+def read_import_frames(filepath, chunk_size=READ_CHUNK_SIZE):
+    """
+    Возвращает итератор порций файла импорта в зависимости от его расширения:
+    .xlsx и .csv читаются потоково, .xls - целиком.
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension == '.xlsx':
+        return iter_xlsx_frames(filepath, chunk_size)
+    if extension == '.csv':
+        return iter_csv_frames(filepath, chunk_size)
+    return read_excel_frames(filepath)
+
+
+def normalize_frame(frame):
+    """
+    Векторно нормализует порцию строк: обрезает пробелы и отбрасывает строки
+    без артикула или изделия. Возвращает DataFrame с колонками part_id, product.
+    """
+    part_ids = frame[PART_ID_COLUMN].astype(str).str.strip()
+    products = frame[PRODUCT_NAME_COLUMN].astype(str).str.strip()
+    mask = frame[PART_ID_COLUMN].notna() & frame[PRODUCT_NAME_COLUMN].notna() & \
+           (part_ids != '') & (products != '') & (part_ids.str.lower() != 'nan')
+    return pd.DataFrame({'part_id': part_ids[mask], 'product': products[mask]})
+
+
+def find_existing_part_ids(part_ids):
+    """Возвращает множество артикулов, уже существующих в базе (порциями по IN)."""
+    part_ids = list(part_ids)
+    existing = set()
+    for start in range(0, len(part_ids), LOOKUP_CHUNK_SIZE):
+        chunk = part_ids[start:start + LOOKUP_CHUNK_SIZE]
+        existing.update(row[0] for row in db.session.query(Part.part_id).filter(Part.part_id.in_(chunk)))
+    return existing
+
+
+def _insert_batch(batch, route_template_id, stage_count, user_id, source_name, import_job_id):
+    """Вставляет порцию деталей и записей аудита одной транзакцией."""
+    db.session.execute(insert(Part), [
+        {'part_id': part_id, 'product_designation': product,
+         'route_template_id': route_template_id, 'import_job_id': import_job_id}
+        for part_id, product in batch
+    ])
+    db.session.execute(insert(AuditLog), [
+        {'part_id': part_id, 'user_id': user_id, 'action': "Создание",
+         'details': f"Деталь импортирована из файла {source_name}."}
+        for part_id, _ in batch
+    ])
+    per_product = {}
+    for _, product in batch:
+        per_product[product] = per_product.get(product, 0) + 1
+    for product, count in per_product.items():
+        adjust_progress(product, parts=count, possible=count * stage_count)
+    db.session.commit()
+
+
+def import_parts(frames, route_template_id, user_id, source_name, progress_callback=None,
+                 import_job_id=None):
+    """
+    Импортирует детали из последовательности DataFrame (порций файла).
+    Дубликаты ищутся одним IN-запросом на порцию, вставка выполняется
+    пакетно через core insert() с фиксацией каждые INSERT_BATCH_SIZE строк.
+    progress_callback(result), если задан, вызывается после каждой порции.
+    import_job_id сохраняется в созданных деталях для последующей выборки по заданию.
+    """
+    result = ImportResult()
+    stage_count = route_stage_count(route_template_id)
+
+    for frame in frames:
+        result.rows_read += len(frame)
+        rows = normalize_frame(frame)
+        # Строки без артикула или изделия считаются ошибочными
+        result.errors += len(frame) - len(rows)
+
+        # Дубликаты внутри порции пропускаются; детали из предыдущих порций
+        # к этому моменту уже зафиксированы и находятся запросом к базе.
+        in_chunk_duplicates = rows['part_id'].duplicated()
+        result.skipped += int(in_chunk_duplicates.sum())
+        rows = rows[~in_chunk_duplicates]
+
+        existing = find_existing_part_ids(rows['part_id'])
+        if existing:
+            result.skipped += len(existing)
+            rows = rows[~rows['part_id'].isin(existing)]
+
+        pending = list(rows.itertuples(index=False, name=None))
+        for start in range(0, len(pending), INSERT_BATCH_SIZE):
+            batch = pending[start:start + INSERT_BATCH_SIZE]
+            _insert_batch(batch, route_template_id, stage_count, user_id, source_name, import_job_id)
+            result.added += len(batch)
+
+        result.elapsed = time.perf_counter() - result.started_at
+        if progress_callback:
+            progress_callback(result)
+
+    result.elapsed = time.perf_counter() - result.started_at
+    return result
@@ -0,0 +1,141 @@
+# file: app/jobs.py
+import os
+import time
+import atexit
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import select, update
+from app import db
+from app.models.models import ImportJob
+from app.importer import read_import_frames, import_parts, ImportFileError
+from app.metrics import metrics
+
+
+class JobRunner:
+    """
+    Локальная очередь фоновых заданий импорта на пуле потоков.
+    Состояние и прогресс заданий хранятся в таблице ImportJobs той же базы,
+    поэтому их можно опрашивать из любого потока waitress.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        # Момент запуска процесса: recover() трогает только задания и файлы, появившиеся раньше
+        self.booted_at = datetime.utcnow()
+        self.booted_at_epoch = time.time()
+        self.synchronous = app.config.get('IMPORT_JOBS_SYNCHRONOUS', False)
+        if not self.synchronous:
+            self.executor = ThreadPoolExecutor(
+                max_workers=app.config.get('IMPORT_JOB_WORKERS', 1),
+                thread_name_prefix='import-job'
+            )
+            atexit.register(self.executor.shutdown, wait=True)
+        app.extensions['job_runner'] = self
+
+    def submit_import(self, job_id):
+        """Ставит задание в очередь (или выполняет сразу в синхронном режиме)."""
+        if self.synchronous:
+            run_import_job(job_id)
+        else:
+            self.executor.submit(self._run_in_context, job_id)
+
+    def recover(self):
+        """
+        Восстанавливает очередь после перезапуска процесса. Учитываются только
+        задания и файлы, появившиеся до запуска этого процесса: задания в
+        очереди ставятся заново (задание забирает тот, кто первым сменит его
+        статус, см. run_import_job), выполнявшиеся задания помечаются
+        ошибочными (их порции уже могли быть зафиксированы), а их файлы и файлы
+        без задания удаляются из UPLOAD_FOLDER. Вызывается при запуске сервера
+        до приема запросов. Возвращает (поставлено заново, прервано).
+        """
+        with self.app.app_context():
+            try:
+                interrupted = db.session.scalars(
+                    select(ImportJob).where(ImportJob.status == 'running', ImportJob.started_at < self.booted_at)).all()
+                for job in interrupted:
+                    job.status = 'failed'
+                    job.errors += 1
+                    job.message = "Задание прервано перезапуском сервера. Загрузите файл повторно."
+                    job.finished_at = datetime.utcnow()
+                db.session.commit()
+                queued = db.session.scalars(
+                    select(ImportJob.id).where(ImportJob.status == 'queued', ImportJob.created_at < self.booted_at)
+                    .order_by(ImportJob.id)).all()
+                # Файлы заданий, которые еще могут выполняться, не трогаются
+                keep = {os.path.abspath(filepath) for filepath in db.session.scalars(
+                    select(ImportJob.filepath).where(ImportJob.status.in_(('queued', 'running'))))}
+                upload_folder = self.app.config['UPLOAD_FOLDER']
+                for name in os.listdir(upload_folder):
+                    path = os.path.abspath(os.path.join(upload_folder, name))
+                    if path not in keep and os.path.isfile(path) and os.path.getmtime(path) < self.booted_at_epoch:
+                        os.remove(path)
+                for job_id in queued:
+                    self.submit_import(job_id)
+            finally:
+                db.session.remove()
+        return len(queued), len(interrupted)
+
+    def _run_in_context(self, job_id):
+        with self.app.app_context():
+            try:
+                run_import_job(job_id)
+            finally:
+                db.session.remove()
+
+
+job_runner = JobRunner()
+
+
+def run_import_job(job_id):
+    """Выполняет задание импорта, записывая прогресс в строку задания."""
+    # Задание забирается условным обновлением: поставленное дважды (recover()
+    # в другом процессе) выполняется один раз
+    claimed = db.session.execute(
+        update(ImportJob).where(ImportJob.id == job_id, ImportJob.status == 'queued')
+        .values(status='running', started_at=datetime.utcnow())
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return
+    job = db.session.get(ImportJob, job_id)
+
+    def report_progress(result):
+        # Прогресс фиксируется после каждой порции вместе с пакетами данных
+        job.rows_read, job.added, job.skipped, job.errors = \
+            result.rows_read, result.added, result.skipped, result.errors
+        db.session.commit()
+
+    try:
+        frames = read_import_frames(job.filepath)
+        result = import_parts(frames, job.route_template_id, job.user_id, job.filename,
+                              progress_callback=report_progress, import_job_id=job.id)
+        report_progress(result)
+        metrics.import_finished(result)
+        job.status = 'done'
+        job.message = (f"Импорт завершен. Добавлено: {result.added}, пропущено дубликатов: {result.skipped}. "
+                       f"Скорость: {result.rows_per_sec:.0f} строк/с.")
+    except ImportFileError as e:
+        db.session.rollback()
+        job.status = 'failed'
+        job.errors += 1
+        job.message = f"Ошибка: {e}"
+    except Exception as e:
+        db.session.rollback()
+        job.status = 'failed'
+        job.errors += 1
+        job.message = f"Произошла ошибка при обработке файла: {e}"
+        if job_runner.app is not None:
+            job_runner.app.logger.error(f"Задание импорта #{job_id} завершилось с ошибкой:\n{traceback.format_exc()}")
+    finally:
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        if os.path.exists(job.filepath):
+            os.remove(job.filepath)
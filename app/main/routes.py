@@ -1,68 +1,120 @@
 # file: app/main/routes.py
-from flask import Blueprint, render_template, jsonify, request, redirect, url_for, flash
-from app.models.models import db, Part, StatusHistory, AuditLog, RouteTemplate, RouteStage
+from flask import (Blueprint, render_template, jsonify, request, redirect, url_for, flash,
+                   Response, stream_with_context, abort, current_app)
+from app.models.models import db, Part, AuditLog, RouteTemplate, RouteStage, ProductProgress
+from app.scanning import (get_scan_info, confirm_part_stage, confirm_stages_batch, CONFIRMED, PART_NOT_FOUND,
+                          NO_ROUTE, STAGE_NOT_IN_ROUTE, ALREADY_COMPLETED)
+from app.search import search_products, SEARCH_DEFAULT_LIMIT
+from app.timeline import (history_page, parse_date, decode_cursor, EVENT_TYPES,
+                          HISTORY_PAGE_SIZE, HISTORY_PAGE_MAX)
+from app.audit_archive import archived_count_subquery, archived_entries
 from app.utils import to_safe_key
-from datetime import datetime
+import json
 from flask_login import current_user
-from sqlalchemy import distinct, func
+from sqlalchemy import func, select
 
 main = Blueprint('main', __name__)
 
+# Сколько изделий выводится на панели без поиска; остальные находятся через /api/search
+DASHBOARD_PRODUCTS_LIMIT = 200
+
+
 @main.route('/')
 def dashboard():
-    # --- ИЗМЕНЕНИЕ: Полностью переработанный запрос для корректного подсчета прогресса ---
+    # Прогресс по изделиям читается из сводной таблицы ProductProgress,
+    # которая поддерживается инкрементально (см. app/progress.py).
+    products = ProductProgress.query.order_by(ProductProgress.product_designation)\
+        .limit(DASHBOARD_PRODUCTS_LIMIT).all()
+    total_products = len(products)
+    if total_products == DASHBOARD_PRODUCTS_LIMIT:
+        total_products = ProductProgress.query.count()
+    return render_template('dashboard.html', products=products, total_products=total_products)
+
+
+@main.route('/api/search')
+def api_search():
+    """
+    Поиск изделий по обозначению и номерам деталей: ?q=<строка>&limit=N.
+    Совпадение - по началу слов после нормализации (транслитерация to_safe_key).
+    """
+    query = request.args.get('q', '')
+    limit = request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int)
+    return jsonify({'query': query, 'products': search_products(query, limit=limit)})
+
+
+PARTS_PAGE_SIZE = 100
+PARTS_PAGE_MAX = 1000
+
+
+def _parts_progress_query(product_designation, after=None):
+    """
+    Строит запрос (part_id, current_status, date_added, completed_stages, total_stages)
+    по деталям изделия, упорядоченный по part_id. Параметр after задает курсор
+    keyset-пагинации: возвращаются только детали с part_id строго больше него.
+    """
+    # Один запрос вместо N+1: кол-во пройденных этапов хранится в самой детали
+    # (completed_count), а кол-во этапов маршрута - группировкой этапов по шаблону.
+    part_filters = [Part.product_designation == product_designation]
+    if after:
+        part_filters.append(Part.part_id > after)
 
-    # Шаг 1: Создаем подзапрос, который считает кол-во этапов в каждом шаблоне маршрута.
-    # Результат: (template_id, total_stages_in_route)
     stages_in_route_subquery = db.session.query(
-        RouteTemplate.id.label('template_id'),
-        func.count(RouteStage.id).label('total_stages_in_route')
-    ).join(RouteStage).group_by(RouteTemplate.id).subquery()
-
-    # Шаг 2: Создаем подзапрос, который для каждого изделия считает СУММУ всех возможных этапов
-    # путем соединения деталей с подсчитанным кол-вом этапов из шага 1.
-    # Результат: (product_designation, total_possible_stages)
-    total_possible_query = db.session.query(
-        Part.product_designation,
-        func.sum(stages_in_route_subquery.c.total_stages_in_route).label('total_possible_stages')
-    ).join(stages_in_route_subquery, Part.route_template_id == stages_in_route_subquery.c.template_id)\
-     .group_by(Part.product_designation).subquery()
-
-    # Шаг 3: Основной запрос, который считает кол-во деталей и кол-во выполненных этапов.
-    # Результат: (product_designation, total_parts, total_completed_stages)
-    completed_query = db.session.query(
-        Part.product_designation,
-        func.count(distinct(Part.part_id)).label('total_parts'),
-        func.count(StatusHistory.id).label('total_completed_stages')
-    ).outerjoin(StatusHistory, Part.part_id == StatusHistory.part_id)\
-     .group_by(Part.product_designation).subquery()
-
-    # Шаг 4: Финальный запрос. Соединяем результаты шага 2 и шага 3.
-    products_query = db.session.query(
-        completed_query,
-        # Используем coalesce, чтобы если у изделия нет деталей с маршрутами, было 0, а не NULL
-        func.coalesce(total_possible_query.c.total_possible_stages, 0).label('total_possible_stages')
-    ).outerjoin(total_possible_query, completed_query.c.product_designation == total_possible_query.c.product_designation)
-
-    products = products_query.all()
-    
-    return render_template('dashboard.html', products=products)
+        RouteStage.template_id.label('template_id'),
+        func.count(RouteStage.id).label('total_stages')
+    ).group_by(RouteStage.template_id).subquery()
+
+    return db.session.query(
+        Part.part_id,
+        Part.current_status,
+        Part.date_added,
+        Part.completed_count,
+        func.coalesce(stages_in_route_subquery.c.total_stages, 0)
+    ).outerjoin(stages_in_route_subquery, stages_in_route_subquery.c.template_id == Part.route_template_id)\
+     .filter(*part_filters)\
+     .order_by(Part.part_id.asc())
+
+
+def _part_row_to_dict(row):
+    part_id, current_status, date_added, completed_stages, total_stages = row
+    return {
+        'part_id': part_id,
+        'current_status': current_status,
+        'creation_date': date_added.strftime('%Y-%m-%d'),
+        'completed_stages': completed_stages,
+        'total_stages': total_stages
+    }
 
 
 @main.route('/api/parts/<path:product_designation>')
 def api_parts_for_product(product_designation):
-    parts_query = Part.query.filter_by(product_designation=product_designation).order_by(Part.part_id.asc())
-    parts_list = []
-    for part in parts_query:
-        total_stages = part.route_template.stages.count() if part.route_template else 0
-        completed_stages = len(part.history)
-        parts_list.append({
-            'part_id': part.part_id,
-            'current_status': part.current_status,
-            'creation_date': part.date_added.strftime('%Y-%m-%d'),
-            'completed_stages': completed_stages,
-            'total_stages': total_stages
-        })
+    """
+    Возвращает детали изделия страницами по курсору: ?limit=N&after=<part_id>.
+    В ответе 'next_after' содержит курсор следующей страницы (или null).
+    С параметром ?format=ndjson детали отдаются потоком, по одной JSON-строке
+    на деталь, без загрузки всего результата в память.
+    """
+    after = request.args.get('after') or None
+    query = _parts_progress_query(product_designation, after=after)
+
+    if request.args.get('format') == 'ndjson':
+        limit = request.args.get('limit', type=int)
+        if limit:
+            query = query.limit(min(limit, PARTS_PAGE_MAX))
+
+        def generate():
+            # stream_results + yield_per читают строки порциями через серверный курсор
+            rows = query.execution_options(stream_results=True).yield_per(PARTS_PAGE_SIZE)
+            for row in rows:
+                yield json.dumps(_part_row_to_dict(row), ensure_ascii=False) + '\n'
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    limit = request.args.get('limit', PARTS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, PARTS_PAGE_MAX))
+    # Запрашиваем на одну строку больше, чтобы узнать, есть ли следующая страница
+    rows = query.limit(limit + 1).all()
+    next_after = rows[limit - 1][0] if len(rows) > limit else None
+    parts_list = [_part_row_to_dict(row) for row in rows[:limit]]
 
     permissions = None
     if current_user.is_authenticated:
@@ -71,47 +123,118 @@ def api_parts_for_product(product_designation):
             'can_edit': current_user.can_edit_parts,
             'can_generate_qr': current_user.can_generate_qr
         }
-    return jsonify({'parts': parts_list, 'permissions': permissions})
+    return jsonify({'parts': parts_list, 'permissions': permissions, 'next_after': next_after})
 
 @main.route('/history/<string:part_id>')
 def history(part_id):
-    part = Part.query.get_or_404(part_id)
-    status_entries = part.history
-    audit_entries = part.audit_logs
-    for entry in status_entries: entry.type = 'status'
-    for entry in audit_entries: entry.type = 'audit'
-    combined_history = status_entries + audit_entries
-    combined_history.sort(key=lambda x: x.timestamp, reverse=True)
-    return render_template('history.html', part=part, combined_history=combined_history)
+    """
+    Единая лента истории детали страницами по курсору (?before=<курсор>) с
+    фильтрами: ?type=status|audit, ?actor=<исполнитель>, ?date_from/?date_to.
+    ?archive=1 - записи журнала аудита детали, перенесенные в архив.
+    """
+    row = db.session.execute(
+        select(Part, archived_count_subquery(part_id)).where(Part.part_id == part_id)).first()
+    if row is None:
+        abort(404)
+    part, archived_count = row
+    if request.args.get('archive'):
+        return render_template('history.html', part=part, combined_history=archived_entries(part_id),
+                               archive_mode=True, next_cursor=None, is_first_page=True, event_type='',
+                               filters={}, filter_args={}, archived_count=0)
+    event_type = request.args.get('type', '')
+    filters = {
+        'actor': request.args.get('actor', '').strip(),
+        'date_from': request.args.get('date_from', ''),
+        'date_to': request.args.get('date_to', ''),
+    }
+    limit = max(1, min(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), HISTORY_PAGE_MAX))
+    entries, next_cursor = history_page(
+        part_id,
+        types=(event_type,) if event_type in EVENT_TYPES else EVENT_TYPES,
+        actor=filters['actor'] or None,
+        date_from=parse_date(filters['date_from']),
+        date_to=parse_date(filters['date_to']),
+        cursor=decode_cursor(request.args.get('before')),
+        limit=limit,
+    )
+    # Параметры фильтров, которые сохраняются в ссылках на соседние страницы
+    filter_args = {key: value for key, value in dict(filters, type=event_type).items() if value}
+    return render_template('history.html', part=part, combined_history=entries, next_cursor=next_cursor,
+                           event_type=event_type, filters=filters, filter_args=filter_args,
+                           is_first_page=not request.args.get('before'), archive_mode=False,
+                           archived_count=archived_count)
 
 @main.route('/scan/<string:part_id>')
 def select_stage(part_id):
-    part = Part.query.get_or_404(part_id)
-    if not part.route_template:
+    scan = get_scan_info(part_id)
+    if scan is None:
+        abort(404)
+    if not scan['route']:
         flash('Ошибка: Этой детали не присвоен технологический маршрут.', 'error')
         return redirect(url_for('main.dashboard'))
-    
-    completed_stages = {h.status for h in part.history}
-    ordered_possible_stages = [rs.stage.name for rs in part.route_template.stages.order_by('order')]
-    available_stages = [s for s in ordered_possible_stages if s not in completed_stages]
-    
-    return render_template('select_stage.html', part=part, available_stages=available_stages)
+    return render_template('select_stage.html', part=scan, available_stages=scan['available_stages'])
+
+def _operator_name(value):
+    default_name = current_user.username if current_user.is_authenticated else 'Не указан'
+    return (value or '').strip() or default_name
 
 @main.route('/confirm_stage/<string:part_id>/<string:stage_name>', methods=['POST'])
 def confirm_stage(part_id, stage_name):
-    part = Part.query.get_or_404(part_id)
-    all_stages_in_route = [rs.stage.name for rs in part.route_template.stages]
-    completed_stages = {h.status for h in part.history}
-
-    if stage_name not in all_stages_in_route or stage_name in completed_stages:
+    result = confirm_part_stage(part_id, stage_name, _operator_name(request.form.get('operator_name')))
+    if result == PART_NOT_FOUND:
+        abort(404)
+    if result != CONFIRMED:
         flash("Ошибка: Недопустимый или уже пройденный этап.", "error"); return redirect(url_for('main.dashboard'))
-    
-    default_name = current_user.username if current_user.is_authenticated else 'Не указан'
-    operator = request.form.get('operator_name', default_name).strip() or default_name
-    
-    part.current_status = stage_name
-    part.last_update = datetime.utcnow()
-    new_history_entry = StatusHistory(part_id=part_id, status=stage_name, operator_name=operator)
-    db.session.add(new_history_entry); db.session.commit()
     flash(f"Статус для детали {part_id} обновлен на '{stage_name}'!", "success")
-    return redirect(url_for('main.dashboard'))
\ No newline at end of file
+    return redirect(url_for('main.dashboard'))
+
+# --- API для терминалов сканирования ---
+
+CONFIRM_ERRORS = {
+    PART_NOT_FOUND: (404, 'Деталь не найдена.'),
+    NO_ROUTE: (409, 'Детали не присвоен технологический маршрут.'),
+    STAGE_NOT_IN_ROUTE: (409, 'Этапа нет в маршруте детали.'),
+    ALREADY_COMPLETED: (409, 'Этап уже пройден.'),
+}
+
+@main.route('/api/scan/<string:part_id>')
+def api_scan(part_id):
+    """Сведения о детали и ее следующих доступных этапах (один SQL-запрос)."""
+    scan = get_scan_info(part_id)
+    if scan is None:
+        return jsonify({'error': CONFIRM_ERRORS[PART_NOT_FOUND][1], 'code': PART_NOT_FOUND}), 404
+    return jsonify(scan)
+
+@main.route('/api/scan/<string:part_id>/confirm', methods=['POST'])
+def api_confirm_stage(part_id):
+    """
+    Подтверждает этап детали. Тело запроса (JSON или форма):
+    {"stage": "<название этапа>", "operator": "<ФИО оператора>"}.
+    """
+    data = request.get_json(silent=True) or request.form
+    stage_name = (data.get('stage') or '').strip()
+    if not stage_name:
+        return jsonify({'error': 'Не указан этап.', 'code': 'bad_request'}), 400
+    result = confirm_part_stage(part_id, stage_name, _operator_name(data.get('operator')))
+    if result != CONFIRMED:
+        status, message = CONFIRM_ERRORS[result]
+        return jsonify({'error': message, 'code': result}), status
+    return jsonify({'part_id': part_id, 'stage': stage_name, 'code': CONFIRMED}), 201
+
+@main.route('/api/scan/batch', methods=['POST'])
+def api_confirm_stages_batch():
+    """
+    Пакетное подтверждение этапов, накопленных терминалом без связи. Тело запроса:
+    {"events": [{"part_id": ..., "stage": ..., "operator": ..., "client_timestamp": "2024-05-01T08:30:00"}]}.
+    Ответ содержит результат по каждому событию в том же порядке.
+    """
+    data = request.get_json(silent=True)
+    events = data.get('events') if isinstance(data, dict) else None
+    if not isinstance(events, list):
+        return jsonify({'error': 'Ожидается JSON с массивом events.', 'code': 'bad_request'}), 400
+    max_events = current_app.config.get('SCAN_BATCH_MAX_EVENTS', 1000)
+    if len(events) > max_events:
+        return jsonify({'error': f'Не более {max_events} событий в одном пакете.', 'code': 'too_many_events'}), 413
+    results = confirm_stages_batch(events, _operator_name(None))
+    confirmed = sum(1 for result in results if result['code'] == CONFIRMED)
+    return jsonify({'confirmed': confirmed, 'rejected': len(results) - confirmed, 'results': results})
@@ -0,0 +1,247 @@
+# file: app/metrics.py
+import threading
+import time
+from flask import Response, current_app, g, request, abort
+
+# Границы корзин гистограммы длительности запросов (в секундах)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Ширина скользящего окна для счетчика подтверждений "за последнюю минуту"
+RATE_WINDOW_SECONDS = 60
+
+
+def _format_labels(names, values):
+    if not names:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонно растущий счетчик с метками."""
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        if not items and not self.labelnames:
+            # Счетчик без меток выводится сразу, даже если событий еще не было
+            return [(self.name, '', 0)]
+        return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(items)]
+
+
+class Gauge(Counter):
+    """Текущее значение; может устанавливаться явно или вычисляться функцией при выгрузке."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self.lock:
+            self.values[key] = value
+
+    def samples(self):
+        if self.callback is not None:
+            value = self.callback()
+            return [] if value is None else [(self.name, '', value)]
+        return super().samples()
+
+
+class Histogram:
+    """Гистограмма с накопительными корзинами в формате Prometheus."""
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        with self.lock:
+            items = [(key, (list(counts), total, count)) for key, (counts, total, count) in self.values.items()]
+        result = []
+        for key, (counts, total, count) in sorted(items):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames + ('le',), key + (_format_value(bound),))
+                result.append((f'{self.name}_bucket', labels, cumulative))
+            labels = _format_labels(self.labelnames, key)
+            result.append((f'{self.name}_sum', labels, total))
+            result.append((f'{self.name}_count', labels, count))
+        return result
+
+
+class _SlidingWindowCounter:
+    """Число событий за последние RATE_WINDOW_SECONDS секунд (посекундные корзины)."""
+
+    def __init__(self, window=RATE_WINDOW_SECONDS):
+        self.window = window
+        self.lock = threading.Lock()
+        self.buckets = [0] * window
+        self.seconds = [0] * window
+
+    def add(self, amount=1):
+        now = int(time.monotonic())
+        slot = now % self.window
+        with self.lock:
+            if self.seconds[slot] != now:
+                self.seconds[slot], self.buckets[slot] = now, 0
+            self.buckets[slot] += amount
+
+    def total(self):
+        now = int(time.monotonic())
+        with self.lock:
+            return sum(count for second, count in zip(self.seconds, self.buckets) if now - second < self.window)
+
+
+class Metrics:
+    """
+    Внутрипроцессные метрики в текстовом формате Prometheus (эндпоинт /metrics).
+    Счетчики защищены собственными блокировками и безопасны для потоков
+    waitress; на каждый HTTP-запрос приходится одно обновление счетчика
+    и одно - гистограммы. Значения живут до перезапуска процесса.
+    """
+
+    def __init__(self, app=None):
+        self.waitress_dispatcher = None
+        self.confirmations_window = _SlidingWindowCounter()
+        self.requests = Counter('tracker_http_requests_total', 'Количество HTTP-запросов.',
+                                ('endpoint', 'method', 'status'))
+        self.latency = Histogram('tracker_http_request_duration_seconds', 'Длительность обработки HTTP-запросов.',
+                                 ('endpoint',))
+        self.confirmations = Counter('tracker_stage_confirmations_total', 'Подтвержденные этапы деталей.')
+        self.import_rows = Counter('tracker_import_rows_total', 'Строки, обработанные импортом.')
+        self.import_seconds = Counter('tracker_import_seconds_total', 'Суммарное время импорта в секундах.')
+        self.import_rows_per_second = Gauge('tracker_import_last_rows_per_second',
+                                            'Скорость последнего завершенного импорта (строк/с).')
+        self.qr_renders = Counter('tracker_qr_renders_total', 'Сгенерированные изображения QR-кодов.', ('source',))
+        self.families = [
+            self.requests, self.latency, self.confirmations,
+            Gauge('tracker_stage_confirmations_last_minute', 'Подтверждения этапов за последние 60 секунд.',
+                  callback=self.confirmations_window.total),
+            self.import_rows, self.import_seconds, self.import_rows_per_second, self.qr_renders,
+            Gauge('tracker_db_pool_size', 'Размер пула соединений с БД.', callback=lambda: self._pool_stat('size')),
+            Gauge('tracker_db_pool_checked_out', 'Соединения БД, выданные потокам.',
+                  callback=lambda: self._pool_stat('checkedout')),
+            Gauge('tracker_db_pool_overflow', 'Соединения БД сверх размера пула.',
+                  callback=lambda: self._pool_stat('overflow')),
+            Gauge('tracker_waitress_queue_depth', 'Запросы в очереди waitress, ожидающие свободного потока.',
+                  callback=lambda: self._waitress_stat('queue')),
+            Gauge('tracker_waitress_active_threads', 'Занятые рабочие потоки waitress.',
+                  callback=lambda: self._waitress_stat('active')),
+            Gauge('tracker_waitress_threads', 'Всего рабочих потоков waitress.',
+                  callback=lambda: self._waitress_stat('threads')),
+        ]
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.render_endpoint)
+        app.extensions['metrics'] = self
+
+    def bind_waitress(self, server):
+        """Запоминает диспетчер задач сервера waitress для метрик очереди."""
+        self.waitress_dispatcher = server.task_dispatcher
+
+    # --- Обновление метрик из кода приложения ---
+
+    def stage_confirmed(self, count=1):
+        self.confirmations.inc(count)
+        self.confirmations_window.add(count)
+
+    def import_finished(self, result):
+        self.import_rows.inc(result.rows_read)
+        self.import_seconds.inc(result.elapsed)
+        self.import_rows_per_second.set(result.rows_per_sec)
+
+    def qr_rendered(self, source, count=1):
+        self.qr_renders.inc(count, source=source)
+
+    # --- Обработчики запроса ---
+
+    @staticmethod
+    def _start_request():
+        g._metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            # Несуществующие адреса объединяются, чтобы не плодить метки
+            endpoint = request.endpoint or 'unmatched'
+            self.requests.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+            self.latency.observe(time.perf_counter() - started, endpoint=endpoint)
+        return response
+
+    @staticmethod
+    def _pool_stat(name):
+        from app import db
+        method = getattr(db.engine.pool, name, None)
+        return method() if callable(method) else None
+
+    def _waitress_stat(self, name):
+        dispatcher = self.waitress_dispatcher
+        if dispatcher is None:
+            return None
+        if name == 'queue':
+            return len(dispatcher.queue)
+        if name == 'active':
+            return dispatcher.active_count
+        return len(dispatcher.threads)
+
+    def render(self):
+        lines = []
+        for family in self.families:
+            samples = family.samples()
+            if not samples and family.kind == 'gauge':
+                continue
+            lines.append(f'# HELP {family.name} {family.documentation}')
+            lines.append(f'# TYPE {family.name} {family.kind}')
+            lines.extend(f'{name}{labels} {_format_value(value)}' for name, labels, value in samples)
+        return '\n'.join(lines) + '\n'
+
+    def render_endpoint(self):
+        token = current_app.config.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            abort(401)
+        return Response(self.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+metrics = Metrics()
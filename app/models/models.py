@@ -3,6 +3,13 @@ from app import db
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from app.utils import to_safe_key
+
+def _safe_key_of(column):
+    """Значение по умолчанию: нормализованный ключ (to_safe_key) колонки column той же строки."""
+    def default(context):
+        return to_safe_key(context.get_current_parameters()[column])
+    return default
 
 class Stage(db.Model):
     __tablename__ = 'Stages'
@@ -11,6 +18,9 @@ class Stage(db.Model):
 
 class RouteStage(db.Model):
     __tablename__ = 'RouteStages'
+    __table_args__ = (
+        db.Index('ix_RouteStages_template_id_order', 'template_id', 'order'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     template_id = db.Column(db.Integer, db.ForeignKey('RouteTemplates.id'), nullable=False)
     stage_id = db.Column(db.Integer, db.ForeignKey('Stages.id'), nullable=False)
@@ -59,31 +69,142 @@ class User(UserMixin, db.Model):
 
 class Part(db.Model):
     __tablename__ = 'Parts'
+    __table_args__ = (
+        # Выборка деталей изделия с keyset-пагинацией по part_id
+        db.Index('ix_Parts_product_designation_part_id', 'product_designation', 'part_id'),
+    )
     part_id = db.Column(db.String, primary_key=True)
     product_designation = db.Column(db.String, nullable=False)
     date_added = db.Column(db.DateTime, default=datetime.utcnow)
     current_status = db.Column(db.String, default='На складе')
     last_update = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Денормализованный прогресс детали: число записей истории и битовая маска
+    # пройденных этапов (бит i - i-й этап маршрута). Поддерживаются
+    # подтверждением/отменой этапов и правкой маршрута, проверяются командой
+    # 'flask verify-part-progress'.
+    completed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    completed_mask = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+    # Нормализованный номер детали для поиска на панели мониторинга (см. app/search.py)
+    search_key = db.Column(db.String, nullable=False, default=_safe_key_of('part_id'))
     
     # Связи
-    route_template_id = db.Column(db.Integer, db.ForeignKey('RouteTemplates.id'), nullable=True)
+    route_template_id = db.Column(db.Integer, db.ForeignKey('RouteTemplates.id'), nullable=True, index=True)
     route_template = db.relationship('RouteTemplate')
+    # Задание импорта, которым деталь была создана (None для созданных вручную)
+    import_job_id = db.Column(db.Integer, db.ForeignKey('ImportJobs.id'), nullable=True, index=True)
     history = db.relationship('StatusHistory', backref='part', lazy=True, cascade="all, delete-orphan")
-    audit_logs = db.relationship('AuditLog', backref='part', lazy=True, cascade="all, delete-orphan")
+    # Записи журнала удаляются вместе с деталью одним запросом (см. admin.delete_part),
+    # без загрузки всей коллекции в сессию
+    audit_logs = db.relationship('AuditLog', backref='part', lazy=True, cascade="all, delete-orphan",
+                                 passive_deletes=True)
 
 class StatusHistory(db.Model):
     __tablename__ = 'StatusHistory'
+    __table_args__ = (
+        # История детали в хронологическом порядке; покрывает и поиск по part_id
+        db.Index('ix_StatusHistory_part_id_timestamp', 'part_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     part_id = db.Column(db.String, db.ForeignKey('Parts.part_id'), nullable=False)
     status = db.Column(db.String, nullable=False)
-    operator_name = db.Column(db.String, nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    operator_name = db.Column(db.String, nullable=False, index=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class AuditLog(db.Model):
     __tablename__ = 'AuditLogs'
+    __table_args__ = (
+        db.Index('ix_AuditLogs_part_id_timestamp', 'part_id', 'timestamp'),
+        # Фильтры журнала аудита с keyset-пагинацией по (timestamp, id)
+        db.Index('ix_AuditLogs_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_AuditLogs_action_timestamp', 'action', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     part_id = db.Column(db.String, db.ForeignKey('Parts.part_id'), nullable=True)
     user_id = db.Column(db.Integer, db.ForeignKey('Users.id'), nullable=False)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     action = db.Column(db.String(100), nullable=False)
-    details = db.Column(db.Text, nullable=True)
\ No newline at end of file
+    details = db.Column(db.Text, nullable=True)
+
+class AuditArchiveIndex(db.Model):
+    """
+    Указатель архива журнала аудита: сколько записей детали перенесено в
+    месячный файл архива. Заполняется командой 'flask archive-audit'
+    (см. app/audit_archive.py); part_id пустой для записей без детали.
+    """
+    __tablename__ = 'AuditArchiveIndex'
+    part_id = db.Column(db.String, primary_key=True)
+    month = db.Column(db.String(7), primary_key=True)  # ГГГГ-ММ
+    entries = db.Column(db.Integer, nullable=False, default=0)
+
+class DailyStageStats(db.Model):
+    """
+    Дневная сводка пройденных этапов: сколько раз оператор прошел этап за
+    день (по времени UTC в истории). Поддерживается инкрементально при
+    подтверждении и отмене этапов и при удалении деталей, перестраивается
+    командой 'flask rebuild-daily-stats'. Отчеты читают ее вместо StatusHistory.
+    """
+    __tablename__ = 'DailyStageStats'
+    day = db.Column(db.Date, primary_key=True)
+    operator_name = db.Column(db.String, primary_key=True)
+    stage = db.Column(db.String, primary_key=True)
+    completed = db.Column(db.Integer, nullable=False, default=0)
+
+class ProductProgress(db.Model):
+    """
+    Сводная (материализованная) таблица прогресса по изделиям.
+    Поддерживается инкрементально из маршрутов, изменяющих детали и историю,
+    и может быть полностью пересчитана командой 'flask rebuild-progress'.
+    """
+    __tablename__ = 'ProductProgress'
+    product_designation = db.Column(db.String, primary_key=True)
+    total_parts = db.Column(db.Integer, nullable=False, default=0)
+    completed_stages = db.Column(db.Integer, nullable=False, default=0)
+    possible_stages = db.Column(db.Integer, nullable=False, default=0)
+    # Нормализованное обозначение: ключ поиска и HTML id строки панели мониторинга
+    search_key = db.Column(db.String, nullable=False, default=_safe_key_of('product_designation'))
+
+
+class ImportJob(db.Model):
+    """Фоновое задание импорта деталей из файла и его прогресс."""
+    __tablename__ = 'ImportJobs'
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    filename = db.Column(db.String, nullable=False)
+    filepath = db.Column(db.String, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('Users.id'), nullable=False)
+    route_template_id = db.Column(db.Integer, db.ForeignKey('RouteTemplates.id'), nullable=False)
+    rows_read = db.Column(db.Integer, nullable=False, default=0)
+    added = db.Column(db.Integer, nullable=False, default=0)
+    skipped = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Integer, nullable=False, default=0)
+    message = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    user = db.relationship('User')
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'filename': self.filename,
+            'rows_read': self.rows_read,
+            'added': self.added,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'message': self.message,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'started_at': self.started_at.strftime('%Y-%m-%d %H:%M:%S') if self.started_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None,
+        }
+
+class CacheVersion(db.Model):
+    """
+    Номера версий внутрипроцессных кэшей справочников. Процесс, изменивший
+    справочник, увеличивает версию, а остальные процессы сверяют ее со своей
+    и сбрасывают устаревший кэш.
+    """
+    __tablename__ = 'CacheVersions'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
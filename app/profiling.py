@@ -0,0 +1,164 @@
+# file: app/profiling.py
+import threading
+import time
+from flask import current_app, g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Максимальная длина текста SQL, сохраняемого как "самый медленный запрос"
+SLOW_STATEMENT_MAX_LENGTH = 500
+
+
+class _RequestProfile:
+    """Счетчики одного HTTP-запроса; хранится в flask.g."""
+    __slots__ = ('started', 'queries', 'sql_seconds', 'slowest_seconds', 'slowest_statement',
+                 'render_seconds', 'render_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.slowest_seconds = 0.0
+        self.slowest_statement = None
+        self.render_seconds = 0.0
+        self.render_started = []
+
+
+def _current_profile():
+    if has_request_context():
+        return g.get('_request_profile')
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_profile() is not None and context is not None:
+        context._profile_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    started = getattr(context, '_profile_query_start', None)
+    if profile is None or started is None:
+        return
+    elapsed = time.perf_counter() - started
+    profile.queries += 1
+    profile.sql_seconds += elapsed
+    if elapsed >= profile.slowest_seconds:
+        profile.slowest_seconds = elapsed
+        profile.slowest_statement = statement
+
+
+def _before_render(sender, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None:
+        profile.render_started.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    profile = _current_profile()
+    if profile is not None and profile.render_started:
+        elapsed = time.perf_counter() - profile.render_started.pop()
+        # Вложенные шаблоны (include) уже учтены во внешнем рендере
+        if not profile.render_started:
+            profile.render_seconds += elapsed
+
+
+class RequestProfiler:
+    """
+    Инструментирование запросов: число SQL-запросов, суммарное время SQL,
+    самый медленный запрос и время рендеринга шаблонов для каждого эндпоинта.
+    Данные по запросу отдаются в заголовке Server-Timing, накопленная
+    статистика - на странице /admin/metrics. Эндпоинты, превысившие бюджет
+    запросов (QUERY_BUDGET / QUERY_BUDGETS), записываются в лог.
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.stats = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # Обработчики событий движка общие для всех приложений процесса,
+        # поэтому регистрируются один раз
+        if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        before_render_template.connect(_before_render, app)
+        template_rendered.connect(_after_render, app)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.extensions['request_profiler'] = self
+
+    @staticmethod
+    def _start_request():
+        g._request_profile = _RequestProfile()
+
+    @staticmethod
+    def query_budget(app, endpoint):
+        return app.config.get('QUERY_BUDGETS', {}).get(endpoint, app.config.get('QUERY_BUDGET', 30))
+
+    def _finish_request(self, response):
+        profile = g.pop('_request_profile', None)
+        if profile is None or request.endpoint is None:
+            return response
+        total_seconds = time.perf_counter() - profile.started
+        if current_app.config.get('SERVER_TIMING_HEADER', True):
+            response.headers['Server-Timing'] = ', '.join([
+                f'db;dur={profile.sql_seconds * 1000:.2f};desc="{profile.queries} queries"',
+                f'render;dur={profile.render_seconds * 1000:.2f}',
+                f'total;dur={total_seconds * 1000:.2f}',
+            ])
+        budget = self.query_budget(current_app, request.endpoint)
+        over_budget = profile.queries > budget
+        if over_budget:
+            current_app.logger.warning(
+                f"Превышен бюджет SQL-запросов: {request.endpoint} выполнил {profile.queries} "
+                f"запросов (бюджет {budget}) для {request.path}")
+        self._record(request.endpoint, profile, total_seconds, budget, over_budget)
+        return response
+
+    def _record(self, endpoint, profile, total_seconds, budget, over_budget):
+        with self.lock:
+            stats = self.stats.get(endpoint)
+            if stats is None:
+                stats = self.stats[endpoint] = {
+                    'endpoint': endpoint, 'requests': 0, 'queries_total': 0, 'queries_max': 0,
+                    'sql_seconds': 0.0, 'render_seconds': 0.0, 'total_seconds': 0.0,
+                    'total_seconds_max': 0.0, 'slowest_seconds': 0.0, 'slowest_statement': None,
+                    'over_budget': 0, 'budget': budget,
+                }
+            stats['requests'] += 1
+            stats['queries_total'] += profile.queries
+            stats['queries_max'] = max(stats['queries_max'], profile.queries)
+            stats['sql_seconds'] += profile.sql_seconds
+            stats['render_seconds'] += profile.render_seconds
+            stats['total_seconds'] += total_seconds
+            stats['total_seconds_max'] = max(stats['total_seconds_max'], total_seconds)
+            stats['budget'] = budget
+            if over_budget:
+                stats['over_budget'] += 1
+            if profile.slowest_statement and profile.slowest_seconds > stats['slowest_seconds']:
+                stats['slowest_seconds'] = profile.slowest_seconds
+                stats['slowest_statement'] = profile.slowest_statement[:SLOW_STATEMENT_MAX_LENGTH]
+
+    def snapshot(self):
+        """Сводка по эндпоинтам (средние значения в мс), самые медленные - первыми."""
+        with self.lock:
+            rows = [dict(stats) for stats in self.stats.values()]
+        for row in rows:
+            count = row['requests']
+            row['queries_avg'] = row['queries_total'] / count
+            row['sql_ms_avg'] = row['sql_seconds'] * 1000 / count
+            row['render_ms_avg'] = row['render_seconds'] * 1000 / count
+            row['total_ms_avg'] = row['total_seconds'] * 1000 / count
+            row['total_ms_max'] = row['total_seconds_max'] * 1000
+            row['slowest_ms'] = row['slowest_seconds'] * 1000
+        return sorted(rows, key=lambda row: row['total_seconds'], reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+
+request_profiler = RequestProfiler()
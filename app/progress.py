@@ -0,0 +1,198 @@
+# file: app/progress.py
+import click
+from sqlalchemy import func, select, update, bindparam
+from app import db
+from app.models.models import Part, StatusHistory, RouteStage, ProductProgress
+from app.route_cache import route_cache
+
+
+def route_stage_count(template_id):
+    """Возвращает количество этапов в шаблоне маршрута (0, если маршрут не задан)."""
+    route = route_cache.get(template_id)
+    return route.stage_count if route else 0
+
+
+def adjust_progress(product_designation, parts=0, completed=0, possible=0):
+    """
+    Инкрементально изменяет сводную строку изделия на заданные приращения.
+    Изменения добавляются в текущую сессию и фиксируются вместе с основной
+    операцией вызывающего маршрута. Строка без деталей удаляется.
+    """
+    if not (parts or completed or possible):
+        return
+    db.session.flush()
+    updated = ProductProgress.query.filter_by(product_designation=product_designation).update({
+        ProductProgress.total_parts: ProductProgress.total_parts + parts,
+        ProductProgress.completed_stages: ProductProgress.completed_stages + completed,
+        ProductProgress.possible_stages: ProductProgress.possible_stages + possible,
+    }, synchronize_session=False)
+    if not updated:
+        db.session.add(ProductProgress(
+            product_designation=product_designation,
+            total_parts=parts, completed_stages=completed, possible_stages=possible
+        ))
+        db.session.flush()
+    elif parts < 0:
+        ProductProgress.query.filter(
+            ProductProgress.product_designation == product_designation,
+            ProductProgress.total_parts <= 0
+        ).delete(synchronize_session=False)
+
+
+def add_part_to_progress(part, sign=1):
+    """
+    Учитывает (sign=1) или исключает (sign=-1) деталь целиком: саму деталь,
+    ее пройденные этапы и все возможные этапы ее маршрута.
+    """
+    completed = StatusHistory.query.filter_by(part_id=part.part_id).count()
+    possible = route_stage_count(part.route_template_id)
+    adjust_progress(part.product_designation, parts=sign, completed=sign * completed, possible=sign * possible)
+
+
+def _aggregate_query(designations=None):
+    """
+    Строит агрегирующий запрос (product_designation, total_parts,
+    completed_stages, possible_stages) по исходным таблицам.
+    При передаче designations пересчет ограничивается этими изделиями.
+    """
+    stages_per_route = db.session.query(
+        RouteStage.template_id.label('template_id'),
+        func.count(RouteStage.id).label('stage_count')
+    ).group_by(RouteStage.template_id).subquery()
+
+    history_per_part = db.session.query(
+        StatusHistory.part_id.label('part_id'),
+        func.count(StatusHistory.id).label('history_count')
+    ).group_by(StatusHistory.part_id).subquery()
+
+    query = db.session.query(
+        Part.product_designation,
+        func.count(Part.part_id),
+        func.coalesce(func.sum(history_per_part.c.history_count), 0),
+        func.coalesce(func.sum(stages_per_route.c.stage_count), 0)
+    ).outerjoin(history_per_part, history_per_part.c.part_id == Part.part_id)\
+     .outerjoin(stages_per_route, stages_per_route.c.template_id == Part.route_template_id)\
+     .group_by(Part.product_designation)
+
+    if designations is not None:
+        query = query.filter(Part.product_designation.in_(designations))
+    return query
+
+
+def refresh_products(designations):
+    """Полностью пересчитывает сводные строки для указанных изделий."""
+    designations = list(set(designations))
+    if not designations:
+        return
+    ProductProgress.query.filter(ProductProgress.product_designation.in_(designations))\
+        .delete(synchronize_session=False)
+    for designation, parts, completed, possible in _aggregate_query(designations):
+        db.session.add(ProductProgress(
+            product_designation=designation, total_parts=parts,
+            completed_stages=completed, possible_stages=possible
+        ))
+
+
+def refresh_route(template_id):
+    """Пересчитывает все изделия, детали которых используют указанный маршрут."""
+    designations = [row[0] for row in db.session.query(Part.product_designation)
+                    .filter(Part.route_template_id == template_id).distinct()]
+    refresh_products(designations)
+
+
+def rebuild_all():
+    """Полностью перестраивает сводную таблицу прогресса. Возвращает число изделий."""
+    ProductProgress.query.delete(synchronize_session=False)
+    rows = _aggregate_query().all()
+    db.session.add_all([
+        ProductProgress(product_designation=designation, total_parts=parts,
+                        completed_stages=completed, possible_stages=possible)
+        for designation, parts, completed, possible in rows
+    ])
+    db.session.commit()
+    return len(rows)
+
+
+@click.command('rebuild-progress')
+def rebuild_progress_command():
+    """Перестраивает сводную таблицу прогресса изделий по исходным данным."""
+    count = rebuild_all()
+    click.echo(f"Сводная таблица прогресса перестроена: {count} изделий.")
+
+
+# --- Денормализованный прогресс отдельной детали ---
+
+# Сколько деталей проверяется за одну порцию при пересчете (ограничение IN (...) в SQLite)
+PART_RECOMPUTE_CHUNK_SIZE = 500
+
+# Маска пройденных этапов - знаковое 64-битное целое, поэтому в маршруте не больше
+# 63 этапов (проверяется формой маршрута)
+MAX_ROUTE_STAGES = 63
+
+
+def stage_bit(route, stage_name):
+    """Бит этапа в маске completed_mask (0, если этапа нет в маршруте)."""
+    position = route.positions.get(stage_name) if route else None
+    return 0 if position is None else 1 << position
+
+
+def compute_part_state(route, statuses):
+    """Ожидаемые (completed_count, completed_mask) по списку пройденных этапов."""
+    mask = 0
+    for status in statuses:
+        mask |= stage_bit(route, status)
+    return len(statuses), mask
+
+
+def recompute_parts(template_id=None, repair=True, route=None):
+    """
+    Сверяет completed_count/completed_mask деталей с историей (все детали или
+    детали одного маршрута) и при repair исправляет расхождения. route -
+    CompiledRoute маршрута template_id вместо кэша (еще не зафиксированные этапы).
+    Изменения не фиксируются. Возвращает список (part_id, было, ожидалось).
+    """
+    query = select(Part.part_id, Part.route_template_id, Part.completed_count, Part.completed_mask)\
+        .order_by(Part.part_id)
+    if template_id is not None:
+        query = query.where(Part.route_template_id == template_id)
+    mismatches, after = [], None
+    while True:
+        page = query if after is None else query.where(Part.part_id > after)
+        parts = db.session.execute(page.limit(PART_RECOMPUTE_CHUNK_SIZE)).all()
+        if not parts:
+            break
+        after = parts[-1][0]
+        statuses = {}
+        for part_id, status in db.session.execute(
+                select(StatusHistory.part_id, StatusHistory.status)
+                .where(StatusHistory.part_id.in_([part[0] for part in parts]))):
+            statuses.setdefault(part_id, []).append(status)
+        fixes = []
+        for part_id, part_template_id, count, mask in parts:
+            part_route = route if route is not None else route_cache.get(part_template_id)
+            expected = compute_part_state(part_route, statuses.get(part_id, []))
+            if (count, mask) != expected:
+                mismatches.append((part_id, (count, mask), expected))
+                fixes.append({'b_part_id': part_id, 'b_count': expected[0], 'b_mask': expected[1]})
+        if repair and fixes:
+            db.session.execute(
+                update(Part.__table__).where(Part.part_id == bindparam('b_part_id'))
+                .values(completed_count=bindparam('b_count'), completed_mask=bindparam('b_mask')),
+                fixes
+            )
+    return mismatches
+
+
+@click.command('verify-part-progress')
+@click.option('--repair', is_flag=True, help='Исправить найденные расхождения.')
+def verify_part_progress_command(repair):
+    """Проверяет счетчики и маски пройденных этапов деталей по истории."""
+    mismatches = recompute_parts(repair=repair)
+    for part_id, actual, expected in mismatches[:20]:
+        click.echo(f"{part_id}: в базе {actual}, по истории {expected}")
+    if repair:
+        db.session.commit()
+        click.echo(f"Исправлено деталей: {len(mismatches)}.")
+    else:
+        click.echo(f"Деталей с расхождениями: {len(mismatches)}." +
+                   (" Запустите с --repair для исправления." if mismatches else ""))
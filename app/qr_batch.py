@@ -0,0 +1,170 @@
+# file: app/qr_batch.py
+import zlib
+import zipfile
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageDraw, ImageFont
+from app.utils import render_qr_png, create_safe_file_name
+
+# Параметры листа наклеек: A4 при 150 DPI, сетка 3 x 4 наклейки
+PAGE_SIZE_PX = (1240, 1754)
+PAGE_SIZE_PT = (595, 842)
+LABEL_GRID = (3, 4)
+QR_SIZE_PX = 320
+
+# Сколько QR-кодов передается процессу-исполнителю за одну задачу
+RENDER_CHUNK_SIZE = 16
+
+_executor = None
+
+
+def _get_executor(workers):
+    """
+    Лениво создает общий пул процессов для генерации QR-кодов. Процессы
+    запускаются через spawn, а не fork: fork из многопоточного процесса
+    waitress копирует блокировки, захваченные другими потоками (очередь
+    аудита, задания импорта, пул соединений), и процесс может зависнуть.
+    Исполнитель render_qr_png не использует контекст приложения.
+    """
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def iter_qr_pngs(urls, workers):
+    """
+    Выдает PNG-байты QR-кодов в порядке urls по мере их готовности.
+    При workers > 0 генерация распределяется по пулу процессов,
+    при workers == 0 выполняется в текущем процессе.
+    """
+    if not workers:
+        return map(render_qr_png, urls)
+    return _get_executor(workers).map(render_qr_png, urls, chunksize=RENDER_CHUNK_SIZE)
+
+
+class _StreamBuffer:
+    """Буфер без поддержки seek: zipfile пишет в него, генератор забирает данные."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(part_ids, pngs):
+    """Потоково формирует ZIP-архив с PNG-файлами QR-кодов."""
+    buffer = _StreamBuffer()
+    # PNG уже сжат, поэтому файлы сохраняются без повторного сжатия
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_STORED) as archive:
+        for part_id, png in zip(part_ids, pngs):
+            archive.writestr(create_safe_file_name(f"part_{part_id}_qr.png"), png)
+            yield buffer.drain()
+    yield buffer.drain()
+
+
+def _load_label_font(size=28):
+    """Ищет шрифт с поддержкой кириллицы, иначе использует встроенный."""
+    for name in ('DejaVuSans.ttf', 'arial.ttf', 'Arial.ttf'):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+class _PdfStreamWriter:
+    """
+    Минимальный потоковый PDF-писатель: каждая страница - одно растровое
+    изображение. Объекты страниц выводятся сразу, а дерево страниц,
+    каталог и таблица xref - в конце документа.
+    """
+
+    def __init__(self):
+        self.offset = 0
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 3  # 1 - каталог, 2 - дерево страниц
+
+    def _raw(self, data):
+        self.offset += len(data)
+        return data
+
+    def _obj(self, obj_id, body):
+        self.offsets[obj_id] = self.offset
+        return self._raw(f"{obj_id} 0 obj\n".encode() + body + b"\nendobj\n")
+
+    def _stream_obj(self, obj_id, dictionary, data):
+        return self._obj(obj_id, f"<< {dictionary} /Length {len(data)} >>\nstream\n".encode() + data + b"\nendstream")
+
+    def header(self):
+        return self._raw(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def page(self, image):
+        image_id, content_id, page_id = self.next_id, self.next_id + 1, self.next_id + 2
+        self.next_id += 3
+        self.page_ids.append(page_id)
+        width, height = image.size
+        page_w, page_h = PAGE_SIZE_PT
+        content = f"q {page_w} 0 0 {page_h} 0 0 cm /Im0 Do Q".encode()
+        return b''.join([
+            self._stream_obj(image_id,
+                             f"/Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                             f"/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode",
+                             zlib.compress(image.convert('L').tobytes())),
+            self._stream_obj(content_id, "", content),
+            self._obj(page_id, (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {page_w} {page_h}] "
+                                f"/Resources << /XObject << /Im0 {image_id} 0 R >> >> "
+                                f"/Contents {content_id} 0 R >>").encode()),
+        ])
+
+    def trailer(self):
+        kids = ' '.join(f"{page_id} 0 R" for page_id in self.page_ids)
+        data = self._obj(2, f"<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>".encode())
+        data += self._obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref_offset = self.offset
+        xref = [f"xref\n0 {self.next_id}\n", "0000000000 65535 f \n"]
+        xref += [f"{self.offsets[obj_id]:010d} 00000 n \n" for obj_id in range(1, self.next_id)]
+        xref.append(f"trailer\n<< /Size {self.next_id} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n")
+        return data + self._raw(''.join(xref).encode())
+
+
+def stream_label_pdf(part_ids, pngs):
+    """
+    Потоково формирует PDF с листами наклеек: QR-код и артикул под ним.
+    Каждая страница выводится сразу после заполнения.
+    """
+    writer = _PdfStreamWriter()
+    font = _load_label_font()
+    columns, rows = LABEL_GRID
+    cell_w, cell_h = PAGE_SIZE_PX[0] // columns, PAGE_SIZE_PX[1] // rows
+    per_page = columns * rows
+
+    yield writer.header()
+    page, draw = None, None
+    for index, (part_id, png) in enumerate(zip(part_ids, pngs)):
+        slot = index % per_page
+        if slot == 0:
+            if page is not None:
+                yield writer.page(page)
+            page = Image.new('L', PAGE_SIZE_PX, 255)
+            draw = ImageDraw.Draw(page)
+        x0, y0 = (slot % columns) * cell_w, (slot // columns) * cell_h
+        qr = Image.open(BytesIO(png)).convert('L').resize((QR_SIZE_PX, QR_SIZE_PX), Image.NEAREST)
+        page.paste(qr, (x0 + (cell_w - QR_SIZE_PX) // 2, y0 + 20))
+        text_w = draw.textlength(part_id, font=font)
+        draw.text((x0 + max(0, (cell_w - text_w) // 2), y0 + 30 + QR_SIZE_PX), part_id, fill=0, font=font)
+    if page is not None:
+        yield writer.page(page)
+    yield writer.trailer()
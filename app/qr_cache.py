@@ -0,0 +1,114 @@
+# file: app/qr_cache.py
+import os
+import hashlib
+import threading
+from flask import current_app
+from app.utils import build_scan_url, get_public_base_url, render_qr_png
+from app.metrics import metrics
+
+# Версия параметров отрисовки QR-кода. Ее изменение делает недействительными
+# все ранее сохраненные изображения, так как она входит в ключ кэша.
+QR_RENDER_SETTINGS = 'qrcode.make:png:v1'
+
+# Файл в каталоге кэша, хранящий публичный адрес, для которого создан кэш
+HOST_MARKER_FILE = '.host'
+
+
+class QrCache:
+    """
+    Дисковый кэш PNG-изображений QR-кодов в каталоге QR_FOLDER.
+    Ключ - SHA-256 от закодированного URL и параметров отрисовки; он же
+    служит строгим ETag. Общий размер ограничен QR_CACHE_MAX_BYTES,
+    при превышении удаляются давно не использованные файлы (LRU по mtime).
+    """
+
+    def __init__(self, app=None):
+        self.lock = threading.Lock()
+        self.directory = None
+        self.total_bytes = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['qr_cache'] = self
+
+    @staticmethod
+    def make_key(url):
+        return hashlib.sha256(f"{QR_RENDER_SETTINGS}|{url}".encode('utf-8')).hexdigest()
+
+    def _prepare_directory(self, directory):
+        """
+        Вызывается под блокировкой. Пересчитывает размер кэша при смене каталога
+        и очищает его, если изменился публичный адрес сервера.
+        """
+        host = get_public_base_url()
+        marker_path = os.path.join(directory, HOST_MARKER_FILE)
+        if self.directory != directory:
+            os.makedirs(directory, exist_ok=True)
+            self.directory = directory
+            self.total_bytes = sum(entry.stat().st_size for entry in self._entries(directory))
+        try:
+            with open(marker_path, encoding='utf-8') as f:
+                cached_host = f.read()
+        except FileNotFoundError:
+            cached_host = None
+        if cached_host != host:
+            # Старые изображения указывают на прежний адрес - они больше не нужны
+            for entry in self._entries(directory):
+                os.remove(entry.path)
+            self.total_bytes = 0
+            with open(marker_path, 'w', encoding='utf-8') as f:
+                f.write(host)
+
+    @staticmethod
+    def _entries(directory):
+        return [entry for entry in os.scandir(directory) if entry.is_file() and entry.name.endswith('.png')]
+
+    def _evict(self, max_bytes):
+        """Удаляет самые давно использованные файлы, пока кэш не уложится в лимит."""
+        if self.total_bytes <= max_bytes:
+            return
+        entries = sorted(self._entries(self.directory), key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.total_bytes <= max_bytes:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+                self.total_bytes -= size
+            except FileNotFoundError:
+                pass
+
+    def get_png(self, part_id):
+        """Возвращает (png_bytes, etag) для детали, генерируя изображение при промахе."""
+        url = build_scan_url(part_id)
+        key = self.make_key(url)
+        directory = current_app.config['QR_FOLDER']
+        with self.lock:
+            self._prepare_directory(directory)
+            path = os.path.join(directory, f"{key}.png")
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                os.utime(path)  # отмечаем использование для LRU
+                return data, key
+            except FileNotFoundError:
+                pass
+
+        data = render_qr_png(url)
+        metrics.qr_rendered('single')
+
+        with self.lock:
+            self._prepare_directory(directory)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            existed = os.path.exists(path)
+            os.replace(tmp_path, path)
+            if not existed:
+                self.total_bytes += len(data)
+            self._evict(current_app.config.get('QR_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+        return data, key
+
+
+qr_cache = QrCache()
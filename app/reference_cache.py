@@ -0,0 +1,93 @@
+# file: app/reference_cache.py
+import threading
+import time
+from collections import namedtuple
+from flask import current_app
+from sqlalchemy import select
+from app import db
+from app.models.models import RouteTemplate, Stage
+from app.route_cache import route_cache
+
+# Легкие неизменяемые записи справочников: в отличие от объектов ORM их можно
+# безопасно использовать в любом потоке и после закрытия сессии
+StageRef = namedtuple('StageRef', 'id name')
+RouteTemplateRef = namedtuple('RouteTemplateRef', 'id name is_default')
+_Loaded = namedtuple('_Loaded', 'stages route_templates')
+
+
+class _ReferenceCacheState:
+    """Состояние кэша одного приложения."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages = None
+        self.route_templates = None
+        self.loaded_at = 0.0
+        self.version = 0
+
+
+class ReferenceCache:
+    """
+    Кэш справочников этапов и шаблонов маршрутов для контекстного процессора
+    шаблонов и полей форм. Записи живут REFERENCE_CACHE_TTL секунд и
+    сбрасываются явно при изменении справочников (см. invalidate_reference_data).
+    TTL ограничивает устаревание в других процессах, где явный сброс не виден.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['reference_cache'] = _ReferenceCacheState()
+
+    @staticmethod
+    def _state():
+        return current_app.extensions['reference_cache']
+
+    def _ensure_loaded(self):
+        state = self._state()
+        ttl = current_app.config.get('REFERENCE_CACHE_TTL', 300)
+        with state.lock:
+            loaded = _Loaded(state.stages, state.route_templates)
+            fresh = loaded.stages is not None and time.monotonic() - state.loaded_at < ttl
+        if fresh:
+            return loaded
+        version = state.version
+        stages = tuple(StageRef(*row) for row in db.session.execute(
+            select(Stage.id, Stage.name).order_by(Stage.name)))
+        route_templates = tuple(RouteTemplateRef(*row) for row in db.session.execute(
+            select(RouteTemplate.id, RouteTemplate.name, RouteTemplate.is_default).order_by(RouteTemplate.name)))
+        with state.lock:
+            # Данные, загруженные во время сброса, могли устареть - не сохраняем их
+            if state.version == version:
+                state.stages, state.route_templates = stages, route_templates
+                state.loaded_at = time.monotonic()
+        return _Loaded(stages, route_templates)
+
+    def stages(self):
+        """Этапы справочника по алфавиту: кортеж StageRef."""
+        return self._ensure_loaded().stages
+
+    def route_templates(self):
+        """Шаблоны маршрутов по алфавиту: кортеж RouteTemplateRef."""
+        return self._ensure_loaded().route_templates
+
+    def default_route_template(self):
+        """Шаблон маршрута по умолчанию или None."""
+        return next((route for route in self.route_templates() if route.is_default), None)
+
+    def invalidate(self):
+        state = self._state()
+        with state.lock:
+            state.stages = state.route_templates = None
+            state.version += 1
+
+
+reference_cache = ReferenceCache()
+
+
+def invalidate_reference_data():
+    """Сбрасывает кэши справочников после изменения этапов или маршрутов."""
+    reference_cache.invalidate()
+    route_cache.invalidate()
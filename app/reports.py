@@ -0,0 +1,135 @@
+# file: app/reports.py
+from collections import namedtuple
+from datetime import timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, func, case, and_, literal
+from app import db
+from app.models.models import StatusHistory, Part, DailyStageStats
+from app.route_cache import route_cache
+
+# Строка отчета по длительности этапа маршрута (длительности - в секундах)
+StageDuration = namedtuple('StageDuration',
+                           'route_template_id route_name stage count min_seconds median_seconds p95_seconds avg_seconds')
+
+# Сколько записей истории читается за одну порцию при расчете отчета
+REPORT_CHUNK_SIZE = 100000
+
+
+def _daily_period(date_from=None, date_to=None):
+    # Дата "по" включается в период целиком
+    conditions = []
+    if date_from:
+        conditions.append(DailyStageStats.day >= date_from.date())
+    if date_to:
+        conditions.append(DailyStageStats.day <= date_to.date())
+    return conditions
+
+
+def operator_performance(date_from=None, date_to=None):
+    """Число пройденных этапов по операторам за период (из дневной сводки)."""
+    total = func.sum(DailyStageStats.completed)
+    return db.session.execute(
+        select(DailyStageStats.operator_name, total.label('stages_completed'))
+        .where(*_daily_period(date_from, date_to))
+        .group_by(DailyStageStats.operator_name).order_by(total.desc(), DailyStageStats.operator_name)).all()
+
+
+def stage_throughput(date_from=None, date_to=None):
+    """Число прохождений каждого этапа за период (из дневной сводки)."""
+    total = func.sum(DailyStageStats.completed)
+    return db.session.execute(
+        select(DailyStageStats.stage, total.label('completed'))
+        .where(*_daily_period(date_from, date_to))
+        .group_by(DailyStageStats.stage).order_by(total.desc(), DailyStageStats.stage)).all()
+
+
+def daily_output(date_from=None, date_to=None):
+    """Число пройденных этапов по дням за период (из дневной сводки)."""
+    return db.session.execute(
+        select(DailyStageStats.day, func.sum(DailyStageStats.completed).label('completed'))
+        .where(*_daily_period(date_from, date_to))
+        .group_by(DailyStageStats.day).order_by(DailyStageStats.day)).all()
+
+
+def format_duration(seconds):
+    """Длительность в виде 'Д д ЧЧ:ММ:СС' (дни - только если есть)."""
+    if seconds is None:
+        return '—'
+    days, rest = divmod(int(round(seconds)), 86400)
+    hours, rest = divmod(rest, 3600)
+    minutes, secs = divmod(rest, 60)
+    return (f"{days} д " if days else '') + f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+
+def _history_chunks(route_template_id=None, date_from=None, date_to=None):
+    """
+    История этапов порциями DataFrame в порядке (part_id, timestamp, id) -
+    порядке индекса (part_id, timestamp), поэтому чтение идет без сортировки.
+    Колонки: part_id, route, status, day (юлианский день), in_period (1/0).
+    """
+    period = []
+    if date_from:
+        period.append(StatusHistory.timestamp >= date_from)
+    if date_to:
+        # Дата "по" включается в период целиком
+        period.append(StatusHistory.timestamp < date_to + timedelta(days=1))
+    query = select(StatusHistory.part_id, Part.route_template_id.label('route'), StatusHistory.status,
+                   func.julianday(StatusHistory.timestamp).label('day'),
+                   (case((and_(*period), 1), else_=0) if period else literal(1)).label('in_period'))\
+        .join(Part, Part.part_id == StatusHistory.part_id)\
+        .order_by(StatusHistory.part_id, StatusHistory.timestamp, StatusHistory.id)
+    if route_template_id is not None:
+        query = query.where(Part.route_template_id == route_template_id)
+    if period:
+        # Читаются только детали с этапами в периоде (по индексу timestamp), но вся
+        # их история: предыдущий этап мог быть пройден до начала периода
+        query = query.where(StatusHistory.part_id.in_(select(StatusHistory.part_id).where(*period)))
+    return pd.read_sql(query, db.session.connection(), chunksize=REPORT_CHUNK_SIZE)
+
+
+def _nearest_rank(sorted_values, pct):
+    # Перцентиль методом ближайшего ранга; ранг ceil(pct * n / 100) считается в целых числах
+    return float(sorted_values[max(0, -(-pct * len(sorted_values) // 100) - 1)])
+
+
+def stage_duration_report(route_template_id=None, date_from=None, date_to=None):
+    """
+    Длительность этапов по маршрутам: число измерений, минимум, медиана, 95-й
+    перцентиль (методом ближайшего ранга) и среднее. Длительность этапа - время
+    от предыдущей записи истории той же детали (аналог LAG по part_id),
+    вычисляется векторно по порциям истории; между порциями переносится
+    последняя строка. Период отбирает этапы по времени завершения.
+    Возвращает список StageDuration в порядке этапов маршрута.
+    """
+    buckets = {}
+    last_part_id, last_day = None, np.nan
+    for chunk in _history_chunks(route_template_id, date_from, date_to):
+        if chunk.empty:
+            continue
+        part_ids = chunk['part_id'].to_numpy()
+        days = chunk['day'].to_numpy()
+        previous_part_ids = np.concatenate(([last_part_id], part_ids[:-1]))
+        previous_days = np.concatenate(([last_day], days[:-1]))
+        last_part_id, last_day = part_ids[-1], days[-1]
+        # Округление до миллисекунд убирает погрешность вычислений с julianday
+        chunk['seconds'] = np.round((days - previous_days) * 86400, 3)
+        measured = chunk[(part_ids == previous_part_ids) & (chunk['in_period'].to_numpy() == 1)]
+        for key, seconds in measured.groupby(['route', 'status'], dropna=False)['seconds']:
+            buckets.setdefault(key, []).append(seconds.to_numpy())
+
+    report = []
+    for (template_id, stage), parts in buckets.items():
+        template_id = None if pd.isna(template_id) else int(template_id)
+        values = np.sort(np.concatenate(parts))
+        route = route_cache.get(template_id)
+        report.append(StageDuration(template_id, route.name if route else 'Без маршрута', stage, len(values),
+                                    float(values[0]), _nearest_rank(values, 50), _nearest_rank(values, 95),
+                                    float(values.mean())))
+
+    def order(row):
+        route = route_cache.get(row.route_template_id)
+        position = route.positions.get(row.stage) if route else None
+        return (row.route_name, position is None, position or 0, row.stage)
+    report.sort(key=order)
+    return report
@@ -0,0 +1,173 @@
+# file: app/route_cache.py
+import threading
+import time
+from flask import current_app
+from sqlalchemy import select, update
+from app import db
+from app.models.models import RouteTemplate, RouteStage, Stage, CacheVersion
+
+
+def get_db_version(name):
+    """Текущая версия кэша name в базе (0, если кэш еще не изменялся)."""
+    return db.session.execute(select(CacheVersion.version).where(CacheVersion.name == name)).scalar() or 0
+
+
+def bump_db_version(name):
+    """Увеличивает версию кэша name в базе в текущей транзакции."""
+    updated = db.session.execute(
+        update(CacheVersion).where(CacheVersion.name == name).values(version=CacheVersion.version + 1)
+    ).rowcount
+    if not updated:
+        db.session.add(CacheVersion(name=name, version=1))
+
+
+class CompiledRoute:
+    """Неизменяемое представление маршрута: этапы по порядку и их позиции."""
+    __slots__ = ('id', 'name', 'stages', 'stage_count', 'positions')
+
+    def __init__(self, template_id, name, stages):
+        self.id = template_id
+        self.name = name
+        self.stages = tuple(stages)
+        self.stage_count = len(self.stages)
+        self.positions = {stage: index for index, stage in enumerate(self.stages)}
+
+    def __contains__(self, stage_name):
+        return stage_name in self.positions
+
+
+class _RouteCacheState:
+    """Состояние кэша одного приложения."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = None
+        self.version = 0
+        self.db_version = None
+        self.checked_at = 0.0
+
+
+class RouteCache:
+    """
+    Кэш скомпилированных маршрутов, общий для потоков waitress. Все маршруты
+    загружаются одним запросом при первом обращении. Изменение маршрутов или
+    этапов вызывает invalidate(), которое увеличивает локальную версию и,
+    при ROUTE_CACHE_SHARED, версию в таблице CacheVersions; другие процессы
+    сверяются с ней не чаще раза в ROUTE_CACHE_CHECK_INTERVAL секунд.
+    Изменение позиций этапов увеличивает версию в базе в своей транзакции
+    (stamp()), и перед записью масок пройденных этапов версия сверяется каждый
+    раз и в любом режиме (all(fresh=True)).
+    """
+    VERSION_NAME = 'routes'
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['route_cache'] = _RouteCacheState()
+
+    @staticmethod
+    def _state():
+        return current_app.extensions['route_cache']
+
+    @property
+    def shared(self):
+        """True, если кэш сверяется с версией в базе (ROUTE_CACHE_SHARED)."""
+        return current_app.config.get('ROUTE_CACHE_SHARED', False)
+
+    def _check_shared_version(self, state, force=False):
+        if not force and not self.shared:
+            return
+        now = time.monotonic()
+        if not force and now - state.checked_at < current_app.config.get('ROUTE_CACHE_CHECK_INTERVAL', 2.0):
+            return
+        state.checked_at = now
+        db_version = get_db_version(self.VERSION_NAME)
+        if db_version != state.db_version:
+            with state.lock:
+                state.routes = None
+                state.version += 1
+                state.db_version = db_version
+
+    @staticmethod
+    def _load(*conditions):
+        rows = db.session.execute(
+            select(RouteTemplate.id, RouteTemplate.name, Stage.name)
+            .outerjoin(RouteStage, RouteStage.template_id == RouteTemplate.id)
+            .outerjoin(Stage, Stage.id == RouteStage.stage_id)
+            .where(*conditions)
+            .order_by(RouteTemplate.id, RouteStage.order)
+        ).all()
+        names, stages = {}, {}
+        for template_id, route_name, stage_name in rows:
+            names[template_id] = route_name
+            stages.setdefault(template_id, [])
+            if stage_name is not None:
+                stages[template_id].append(stage_name)
+        return {template_id: CompiledRoute(template_id, names[template_id], stages[template_id])
+                for template_id in names}
+
+    @property
+    def version(self):
+        """Локальная версия кэша; увеличивается при каждом сбросе."""
+        return self._state().version
+
+    def all(self, fresh=False):
+        """
+        Словарь {id шаблона: CompiledRoute}. При fresh версия в базе сверяется
+        всегда, без учета ROUTE_CACHE_SHARED и ROUTE_CACHE_CHECK_INTERVAL.
+        """
+        state = self._state()
+        self._check_shared_version(state, force=fresh)
+        routes = state.routes
+        if routes is not None:
+            return routes
+        version = state.version
+        routes = self._load()
+        with state.lock:
+            # Если кэш сбросили во время загрузки, данные могли устареть - не сохраняем их
+            if state.version == version:
+                state.routes = routes
+        return routes
+
+    def get(self, template_id):
+        """CompiledRoute шаблона или None (шаблона нет или не задан)."""
+        if template_id is None:
+            return None
+        return self.all().get(template_id)
+
+    def load(self, template_id):
+        """
+        CompiledRoute шаблона, прочитанный из базы в текущей транзакции в обход
+        кэша (например, после изменения маршрута до фиксации). None, если шаблона нет.
+        """
+        return self._load(RouteTemplate.id == template_id).get(template_id)
+
+    def stamp(self):
+        """
+        Увеличивает версию в базе в текущей транзакции: запись масок, ожидающая
+        блокировки, после фиксации увидит новую версию и не возьмет старые
+        позиции этапов. После фиксации вызывается invalidate(bump=False).
+        """
+        bump_db_version(self.VERSION_NAME)
+
+    def invalidate(self, bump=True):
+        """
+        Сбрасывает кэш после изменения маршрутов или этапов. Вызывается после
+        фиксации изменений; при ROUTE_CACHE_SHARED версия в базе увеличивается
+        отдельной транзакцией, если ее уже не увеличил stamp() (bump=False).
+        """
+        state = self._state()
+        with state.lock:
+            state.routes = None
+            state.version += 1
+        if self.shared:
+            if bump:
+                bump_db_version(self.VERSION_NAME)
+                db.session.commit()
+            state.db_version = None
+            state.checked_at = 0.0
+
+
+route_cache = RouteCache()
@@ -0,0 +1,233 @@
+# file: app/scanning.py
+from collections import Counter
+from datetime import datetime, timezone
+from sqlalchemy import select, insert, update, exists, case, bindparam
+from app import db
+from app.models.models import Part, StatusHistory
+from app.progress import adjust_progress, stage_bit
+from app.daily_stats import adjust_daily_stats, stage_key
+from app.importer import LOOKUP_CHUNK_SIZE
+from app.metrics import metrics
+from app.route_cache import route_cache
+
+# Результаты подтверждения этапа
+CONFIRMED = 'confirmed'
+PART_NOT_FOUND = 'part_not_found'
+NO_ROUTE = 'no_route'
+STAGE_NOT_IN_ROUTE = 'stage_not_in_route'
+ALREADY_COMPLETED = 'already_completed'
+INVALID_EVENT = 'invalid_event'
+BAD_TIMESTAMP = 'bad_timestamp'
+
+
+def get_scan_info(part_id):
+    """
+    Возвращает сведения для экрана сканирования чтением одной строки детали:
+    пройденные этапы берутся из маски completed_mask, маршрут - из кэша.
+    Возвращает None, если детали нет.
+    """
+    row = db.session.execute(
+        select(Part.part_id, Part.product_designation, Part.current_status, Part.route_template_id,
+               Part.completed_mask)
+        .where(Part.part_id == part_id)
+    ).first()
+    if row is None:
+        return None
+    part_id, product, current_status, template_id, mask = row
+    route = route_cache.get(template_id)
+    stages = [{'name': stage_name, 'completed': bool(mask & (1 << position))}
+              for position, stage_name in enumerate(route.stages if route else ())]
+    return {
+        'part_id': part_id,
+        'product': product,
+        'current_status': current_status,
+        'route': route.name if route else None,
+        'stages': stages,
+        'available_stages': [stage['name'] for stage in stages if not stage['completed']],
+    }
+
+
+def _confirm_failure_reason(part_id, stage_name):
+    """Определяет, почему условная вставка не добавила строку (только для ошибочного пути)."""
+    part = db.session.get(Part, part_id)
+    if part is None:
+        return PART_NOT_FOUND
+    route = route_cache.get(part.route_template_id)
+    if route is None:
+        return NO_ROUTE
+    return ALREADY_COMPLETED if stage_name in route else STAGE_NOT_IN_ROUTE
+
+
+def _lock_for_write():
+    """
+    Захватывает блокировку записи SQLite (BEGIN IMMEDIATE) до чтения масок
+    или версии кэша маршрутов. pysqlite открывает транзакцию только перед
+    первым изменяющим оператором, и без блокировки одиночное подтверждение
+    могло пройти между чтением масок пакетом и его записью. Другие
+    подтверждения ждут фиксации текущей транзакции.
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'sqlite' and not connection.connection.driver_connection.in_transaction:
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+def routes_for_write():
+    """
+    Маршруты для записи масок пройденных этапов. Маршрут мог измениться в
+    другом потоке или процессе уже после загрузки кэша, поэтому версия в базе
+    сверяется под блокировкой записи: изменение маршрута не пройдет между
+    сверкой и записью маски, а уже зафиксированное будет видно по версии.
+    """
+    _lock_for_write()
+    return route_cache.all(fresh=True)
+
+
+def confirm_part_stage(part_id, stage_name, operator_name, timestamp=None):
+    """
+    Подтверждает этап детали условным обновлением: бит этапа в completed_mask
+    устанавливается, только если этап есть в маршруте детали и бит еще не
+    установлен. Проверка и обновление выполняются одним оператором, поэтому
+    повторное сканирование с другого терминала не создаст дубликат.
+    Возвращает одну из констант модуля.
+    """
+    timestamp = timestamp or datetime.utcnow()
+    # Позиция этапа зависит от маршрута: бит выбирается по шаблону детали
+    bits = {route.id: stage_bit(route, stage_name) for route in routes_for_write().values() if stage_name in route}
+    if not bits:
+        db.session.rollback()
+        return _confirm_failure_reason(part_id, stage_name)
+    bit = case(bits, value=Part.route_template_id, else_=0)
+    product = db.session.execute(
+        update(Part)
+        .where(Part.part_id == part_id, Part.route_template_id.in_(bits), Part.completed_mask.op('&')(bit) == 0)
+        .values(completed_mask=Part.completed_mask.op('|')(bit), completed_count=Part.completed_count + 1,
+                current_status=stage_name, last_update=timestamp)
+        .returning(Part.product_designation)
+        .execution_options(synchronize_session=False)
+    ).scalar()
+    if product is None:
+        db.session.rollback()
+        return _confirm_failure_reason(part_id, stage_name)
+
+    db.session.execute(insert(StatusHistory).values(part_id=part_id, status=stage_name,
+                                                    operator_name=operator_name, timestamp=timestamp))
+    adjust_progress(product, completed=1)
+    adjust_daily_stats({stage_key(timestamp, operator_name, stage_name): 1})
+    db.session.commit()
+    metrics.stage_confirmed()
+    return CONFIRMED
+
+
+def parse_client_timestamp(value, now):
+    """
+    Разбирает время сканирования с терминала (ISO 8601). Время с часовым поясом
+    приводится к UTC; время из будущего (сбитые часы терминала) заменяется на now.
+    Возвращает None, если строку разобрать нельзя.
+    """
+    if not value:
+        return now
+    try:
+        moment = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return min(moment, now)
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), LOOKUP_CHUNK_SIZE):
+        yield values[start:start + LOOKUP_CHUNK_SIZE]
+
+
+def confirm_stages_batch(events, default_operator):
+    """
+    Подтверждает пакет этапов, накопленных терминалом без связи.
+    events - список словарей {part_id, stage, operator, client_timestamp}.
+    События проверяются по кэшу маршрутов и маскам пройденных этапов (один
+    запрос на порцию деталей), допустимые строки истории вставляются одной
+    командой, маски и статусы деталей обновляются через executemany, и все
+    фиксируется одной транзакцией. Маски читаются уже под блокировкой записи.
+    Возвращает список результатов в порядке событий: {index, part_id, stage, code}.
+    """
+    now = datetime.utcnow()
+    part_ids = {str(event.get('part_id') or '').strip() for event in events if isinstance(event, dict)}
+    part_ids.discard('')
+
+    _lock_for_write()
+    parts, masks = {}, {}
+    for chunk in _chunks(part_ids):
+        for part_id, template_id, product, mask in db.session.execute(
+                select(Part.part_id, Part.route_template_id, Part.product_designation, Part.completed_mask)
+                .where(Part.part_id.in_(chunk))):
+            parts[part_id] = (template_id, product)
+            masks[part_id] = mask
+
+    routes = routes_for_write()
+    results, history_rows, latest, confirmed_by_product, added = [], [], {}, {}, {}
+    for index, event in enumerate(events):
+        if not isinstance(event, dict):
+            results.append({'index': index, 'part_id': None, 'stage': None, 'code': INVALID_EVENT})
+            continue
+        part_id = str(event.get('part_id') or '').strip()
+        stage_name = str(event.get('stage') or '').strip()
+        result = {'index': index, 'part_id': part_id, 'stage': stage_name}
+        results.append(result)
+        timestamp = parse_client_timestamp(event.get('client_timestamp'), now)
+        if not part_id or not stage_name:
+            result['code'] = INVALID_EVENT
+        elif timestamp is None:
+            result['code'] = BAD_TIMESTAMP
+        elif part_id not in parts:
+            result['code'] = PART_NOT_FOUND
+        elif parts[part_id][0] not in routes:
+            result['code'] = NO_ROUTE
+        elif stage_name not in routes[parts[part_id][0]]:
+            result['code'] = STAGE_NOT_IN_ROUTE
+        elif masks[part_id] & stage_bit(routes[parts[part_id][0]], stage_name):
+            # В том числе повторное сканирование внутри того же пакета
+            result['code'] = ALREADY_COMPLETED
+        else:
+            result['code'] = CONFIRMED
+            bit = stage_bit(routes[parts[part_id][0]], stage_name)
+            masks[part_id] |= bit
+            bits, count = added.get(part_id, (0, 0))
+            added[part_id] = (bits | bit, count + 1)
+            operator = str(event.get('operator') or '').strip() or default_operator
+            history_rows.append({'part_id': part_id, 'status': stage_name,
+                                 'operator_name': operator, 'timestamp': timestamp})
+            if part_id not in latest or timestamp >= latest[part_id][1]:
+                latest[part_id] = (stage_name, timestamp)
+            product = parts[part_id][1]
+            confirmed_by_product[product] = confirmed_by_product.get(product, 0) + 1
+
+    if history_rows:
+        db.session.execute(insert(StatusHistory), history_rows)
+        db.session.execute(
+            update(Part.__table__).where(Part.part_id == bindparam('b_part_id'))
+            .values(completed_mask=Part.completed_mask.op('|')(bindparam('b_bits')),
+                    completed_count=Part.completed_count + bindparam('b_count')),
+            [{'b_part_id': part_id, 'b_bits': bits, 'b_count': count} for part_id, (bits, count) in added.items()]
+        )
+        # Статус меняется, только если в истории нет более позднего этапа:
+        # поздно выгруженные сканы не затирают более свежий статус
+        newer_history = exists().where(StatusHistory.part_id == bindparam('b_part_id'),
+                                       StatusHistory.timestamp > bindparam('b_timestamp'))
+        db.session.execute(
+            update(Part.__table__)
+            .where(Part.part_id == bindparam('b_part_id'), ~newer_history)
+            .values(current_status=bindparam('b_status'), last_update=bindparam('b_timestamp')),
+            [{'b_part_id': part_id, 'b_status': stage_name, 'b_timestamp': timestamp}
+             for part_id, (stage_name, timestamp) in latest.items()]
+        )
+        for product, count in confirmed_by_product.items():
+            adjust_progress(product, completed=count)
+        adjust_daily_stats(Counter(stage_key(row['timestamp'], row['operator_name'], row['status'])
+                                   for row in history_rows))
+        db.session.commit()
+        metrics.stage_confirmed(len(history_rows))
+    else:
+        # Снимает блокировку записи, если подтверждать нечего
+        db.session.rollback()
+    return results
@@ -0,0 +1,161 @@
+# file: app/search.py
+import weakref
+from sqlalchemy import DDL, event, inspect, select, text, or_, and_
+from app import db
+from app.models.models import Part, ProductProgress
+from app.utils import to_safe_key
+
+# Ограничения выдачи поиска на панели мониторинга
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+# Сколько найденных деталей показывается под каждым изделием
+SEARCH_PARTS_PER_PRODUCT = 5
+# Сколько совпадений по номерам деталей просматривается за один поиск: короткий
+# префикс может совпасть с десятками тысяч деталей, а поиск идет на каждое нажатие
+SEARCH_PART_ROWS_LIMIT = 500
+
+FTS_TABLE = 'SearchIndex'
+
+# Полнотекстовый индекс SQLite FTS5 по нормализованным ключам: строка на изделие
+# (ключ в product_key) и строка на деталь (ключ в part_key), поэтому поиск по
+# обозначениям не просматривает совпадения среди деталей. Индекс поддерживается
+# триггерами: импорт, ручное добавление и удаление деталей не требуют отдельного
+# кода. Символ '_' из to_safe_key токенизатор считает разделителем, так что
+# префиксный поиск работает по каждому слову.
+FTS_DDL = (
+    f'CREATE VIRTUAL TABLE IF NOT EXISTS "{FTS_TABLE}" USING fts5('
+    'product_key, part_key, product_designation UNINDEXED, part_id UNINDEXED, tokenize="unicode61")',
+    f'CREATE TRIGGER IF NOT EXISTS "Parts_search_ai" AFTER INSERT ON "Parts" BEGIN '
+    f'INSERT INTO "{FTS_TABLE}"(product_key, part_key, product_designation, part_id) '
+    'VALUES (NULL, new.search_key, new.product_designation, new.part_id); END',
+    f'CREATE TRIGGER IF NOT EXISTS "Parts_search_ad" AFTER DELETE ON "Parts" BEGIN '
+    f'DELETE FROM "{FTS_TABLE}" WHERE part_id = old.part_id; END',
+    f'CREATE TRIGGER IF NOT EXISTS "Parts_search_au" AFTER UPDATE OF product_designation ON "Parts" BEGIN '
+    f'UPDATE "{FTS_TABLE}" SET product_designation = new.product_designation WHERE part_id = old.part_id; END',
+    f'CREATE TRIGGER IF NOT EXISTS "ProductProgress_search_ai" AFTER INSERT ON "ProductProgress" BEGIN '
+    f'INSERT INTO "{FTS_TABLE}"(product_key, part_key, product_designation, part_id) '
+    'VALUES (new.search_key, NULL, new.product_designation, NULL); END',
+    f'CREATE TRIGGER IF NOT EXISTS "ProductProgress_search_ad" AFTER DELETE ON "ProductProgress" BEGIN '
+    f'DELETE FROM "{FTS_TABLE}" WHERE part_id IS NULL AND product_designation = old.product_designation; END',
+)
+
+
+def fts5_supported(connection):
+    """True, если база - SQLite, собранная с поддержкой FTS5."""
+    if connection.dialect.name != 'sqlite':
+        return False
+    return bool(connection.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+
+
+# Есть ли индекс в базе движка: проверяется один раз на движок, а не на каждый поиск
+_fts_index_present = weakref.WeakKeyDictionary()
+
+
+def fts_index_available(connection):
+    """True, если в базе соединения есть индекс FTS5 (результат кэшируется на движок)."""
+    present = _fts_index_present.get(connection.engine)
+    if present is None:
+        present = _fts_index_present[connection.engine] = inspect(connection).has_table(FTS_TABLE)
+    return present
+
+
+def _create_fts_index(target, connection, **kw):
+    if fts5_supported(connection):
+        for statement in FTS_DDL:
+            connection.execute(DDL(statement))
+        _fts_index_present[connection.engine] = True
+
+
+def _drop_fts_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(DDL(f'DROP TABLE IF EXISTS "{FTS_TABLE}"'))
+        _fts_index_present[connection.engine] = False
+
+
+# Индекс создается и удаляется вместе со схемой (db.create_all / db.drop_all);
+# в рабочей базе его создает миграция.
+event.listen(db.metadata, 'after_create', _create_fts_index)
+event.listen(db.metadata, 'before_drop', _drop_fts_index)
+
+
+def normalize_query(query):
+    """Нормализует строку поиска так же, как ключи индекса. Возвращает список слов."""
+    return [token for token in to_safe_key(query or '').split('_') if token]
+
+
+def _fts_match_expression(column, tokens):
+    # Каждое слово - префиксный запрос; слова объединяются через AND
+    return f"{column} : (" + ' '.join(f'"{token}"*' for token in tokens) + ')'
+
+
+def _like_prefix_condition(column, token):
+    # Резервный вариант без FTS5: слово должно начинаться с начала ключа или после '_'
+    escaped = token.replace('\\', '\\\\').replace('_', '\\_').replace('%', '\\%')
+    return or_(column.like(f'{escaped}%', escape='\\'), column.like(f'%\\_{escaped}%', escape='\\'))
+
+
+def _search_fts(tokens, limit):
+    by_name = [row[0] for row in db.session.execute(text(
+        f'SELECT product_designation FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH :match '
+        'ORDER BY product_designation LIMIT :limit'
+    ), {'match': _fts_match_expression('product_key', tokens), 'limit': limit})]
+    # Без ORDER BY строки читаются в порядке индекса, и LIMIT прерывает просмотр
+    part_rows = db.session.execute(text(
+        f'SELECT product_designation, part_id FROM "{FTS_TABLE}" WHERE "{FTS_TABLE}" MATCH :match LIMIT :limit'
+    ), {'match': _fts_match_expression('part_key', tokens), 'limit': SEARCH_PART_ROWS_LIMIT}).all()
+    return by_name, part_rows
+
+
+def _search_like(tokens, limit):
+    by_name = [row[0] for row in db.session.execute(
+        select(ProductProgress.product_designation)
+        .where(and_(*[_like_prefix_condition(ProductProgress.search_key, token) for token in tokens]))
+        .order_by(ProductProgress.product_designation).limit(limit))]
+    part_rows = db.session.execute(
+        select(Part.product_designation, Part.part_id)
+        .where(and_(*[_like_prefix_condition(Part.search_key, token) for token in tokens]))
+        .limit(SEARCH_PART_ROWS_LIMIT)
+    ).all()
+    return by_name, part_rows
+
+
+def search_products(query, limit=SEARCH_DEFAULT_LIMIT):
+    """
+    Ищет изделия по обозначению изделия и номерам его деталей (префиксное
+    совпадение по словам нормализованного ключа). Использует индекс FTS5,
+    если он есть, иначе - LIKE по колонкам search_key.
+    Возвращает список словарей в порядке обозначений изделий.
+    """
+    tokens = normalize_query(query)
+    if not tokens:
+        return []
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    if fts_index_available(db.session.connection()):
+        by_name, part_rows = _search_fts(tokens, limit)
+    else:
+        by_name, part_rows = _search_like(tokens, limit)
+
+    matched_parts = {}
+    for designation, part_id in part_rows:
+        matched_parts.setdefault(designation, []).append(part_id)
+    # Сначала изделия, совпавшие по обозначению, затем - по номерам деталей
+    designations = by_name + sorted(set(matched_parts) - set(by_name))
+    designations = designations[:limit]
+    if not designations:
+        return []
+    progress = {row.product_designation: row for row in ProductProgress.query.filter(
+        ProductProgress.product_designation.in_(designations))}
+    results = []
+    for designation in designations:
+        row = progress.get(designation)
+        if row is None:
+            continue
+        results.append({
+            'product_designation': designation,
+            'safe_key': row.search_key,
+            'total_parts': row.total_parts,
+            'completed_stages': row.completed_stages,
+            'possible_stages': row.possible_stages,
+            'matched_parts': sorted(matched_parts.get(designation, []))[:SEARCH_PARTS_PER_PRODUCT],
+        })
+    return results
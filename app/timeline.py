@@ -0,0 +1,112 @@
+# file: app/timeline.py
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import select, literal, null, union_all, or_, and_
+from app import db
+from app.models.models import StatusHistory, AuditLog, User
+
+HISTORY_PAGE_SIZE = 50
+HISTORY_PAGE_MAX = 500
+
+# Типы событий единой ленты истории детали
+STATUS = 'status'
+AUDIT = 'audit'
+EVENT_TYPES = (STATUS, AUDIT)
+
+# Запись ленты: этап производства (title - этап, actor - оператор) или
+# запись журнала аудита (title - действие, actor - пользователь)
+TimelineEntry = namedtuple('TimelineEntry', 'type id timestamp title details actor')
+
+
+def parse_date(value):
+    """Дата фильтра в формате ГГГГ-ММ-ДД или None, если значение пустое или неверное."""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d') if value else None
+    except ValueError:
+        return None
+
+
+def encode_cursor(entry):
+    """Курсор keyset-пагинации: позиция последней записи страницы."""
+    return f"{entry.timestamp.isoformat()}|{entry.type}|{entry.id}"
+
+
+def decode_cursor(value):
+    """Разбирает курсор в (timestamp, type, id) или возвращает None."""
+    try:
+        timestamp, event_type, entry_id = value.split('|')
+        if event_type not in EVENT_TYPES:
+            return None
+        return datetime.fromisoformat(timestamp), event_type, int(entry_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _after_cursor(event_type, timestamp_column, id_column, cursor):
+    # Лента упорядочена по (timestamp, type, id) по убыванию. Тип ветки известен
+    # заранее, поэтому условие на курсор сводится к сравнению по (timestamp, id)
+    # и использует индекс (part_id, timestamp) каждой таблицы.
+    cursor_timestamp, cursor_type, cursor_id = cursor
+    if event_type < cursor_type:
+        return timestamp_column <= cursor_timestamp
+    if event_type > cursor_type:
+        return timestamp_column < cursor_timestamp
+    # Условие на timestamp вынесено отдельно, чтобы оно задавало диапазон по индексу
+    return and_(timestamp_column <= cursor_timestamp,
+                or_(timestamp_column < cursor_timestamp, id_column < cursor_id))
+
+
+def _branch(event_type, query, timestamp_column, id_column, actor_column, filters, limit):
+    conditions = []
+    if filters.get('actor'):
+        conditions.append(actor_column.ilike(f"%{filters['actor']}%"))
+    if filters.get('date_from'):
+        conditions.append(timestamp_column >= filters['date_from'])
+    if filters.get('date_to'):
+        # Дата "по" включается в период целиком
+        conditions.append(timestamp_column < filters['date_to'] + timedelta(days=1))
+    if filters.get('cursor'):
+        conditions.append(_after_cursor(event_type, timestamp_column, id_column, filters['cursor']))
+    # Каждая ветка сама ограничена размером страницы: объем чтения не зависит от длины истории
+    return query.where(*conditions).order_by(timestamp_column.desc(), id_column.desc()).limit(limit).subquery()
+
+
+def history_page(part_id, types=EVENT_TYPES, actor=None, date_from=None, date_to=None, cursor=None,
+                 limit=HISTORY_PAGE_SIZE):
+    """
+    Возвращает страницу единой ленты истории детали (этапы и журнал аудита)
+    одним запросом UNION ALL, упорядоченную от новых записей к старым.
+    cursor - результат decode_cursor() для продолжения со следующей страницы.
+    Возвращает (список TimelineEntry, курсор следующей страницы или None).
+    """
+    filters = {'actor': actor, 'date_from': date_from, 'date_to': date_to, 'cursor': cursor}
+    branches = []
+    if STATUS in types:
+        branches.append(_branch(
+            STATUS,
+            select(literal(STATUS).label('type'), StatusHistory.id.label('id'),
+                   StatusHistory.timestamp.label('timestamp'), StatusHistory.status.label('title'),
+                   null().label('details'), StatusHistory.operator_name.label('actor'))
+            .where(StatusHistory.part_id == part_id),
+            StatusHistory.timestamp, StatusHistory.id, StatusHistory.operator_name, filters, limit + 1))
+    if AUDIT in types:
+        branches.append(_branch(
+            AUDIT,
+            select(literal(AUDIT).label('type'), AuditLog.id.label('id'),
+                   AuditLog.timestamp.label('timestamp'), AuditLog.action.label('title'),
+                   AuditLog.details.label('details'), User.username.label('actor'))
+            .outerjoin(User, User.id == AuditLog.user_id)
+            .where(AuditLog.part_id == part_id),
+            AuditLog.timestamp, AuditLog.id, User.username, filters, limit + 1))
+    if not branches:
+        return [], None
+
+    timeline = union_all(*[select(branch) for branch in branches]).subquery()
+    rows = db.session.execute(
+        select(timeline)
+        .order_by(timeline.c.timestamp.desc(), timeline.c.type.desc(), timeline.c.id.desc())
+        .limit(limit + 1)
+    ).all()
+    entries = [TimelineEntry(*row) for row in rows[:limit]]
+    next_cursor = encode_cursor(entries[-1]) if len(rows) > limit else None
+    return entries, next_cursor
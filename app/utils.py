@@ -1,6 +1,7 @@
 # file: app/utils.py
 import os
 import re
+import functools
 import qrcode
 from io import BytesIO
 
@@ -10,30 +11,41 @@ def create_safe_file_name(name):
     """
     return re.sub(r'[\\/*?:"<>|]', "_", name)
 
+def get_public_base_url():
+    """
+    Возвращает публичный адрес сервера, который кодируется в QR-коды.
+    IP-адрес берется из переменной окружения. Если ее нет, используется '127.0.0.1'.
+    """
+    SERVER_PUBLIC_IP = os.environ.get("SERVER_PUBLIC_IP", "127.0.0.1")
+    SERVER_PORT = 5000
+    return f"http://{SERVER_PUBLIC_IP}:{SERVER_PORT}"
+
+def build_scan_url(part_id):
+    """Возвращает URL страницы сканирования детали, который кодируется в QR-код."""
+    return f"{get_public_base_url()}/scan/{part_id}"
+
+def render_qr_png(url):
+    """
+    Кодирует URL в QR-код и возвращает PNG в виде байтов.
+    Функция верхнего уровня, поэтому может выполняться в пуле процессов.
+    """
+    qr_img = qrcode.make(url)
+    img_buffer = BytesIO()
+    qr_img.save(img_buffer, format='PNG')
+    return img_buffer.getvalue()
+
 def generate_qr_code(part_id):
     """
     Генерирует QR-код и возвращает его как объект BytesIO в оперативной памяти.
     Это позволяет отдавать файл напрямую пользователю без сохранения на диске.
     Возвращает объект BytesIO в случае успеха или None в случае ошибки.
     """
-    # ИСПРАВЛЕНИЕ: Удален ненужный блок try...except RuntimeError, так как
-    # os.environ.get() не вызывает таких ошибок. Код упрощен.
-    # IP-адрес берется из переменной окружения. Если ее нет, используется '127.0.0.1'.
-    SERVER_PUBLIC_IP = os.environ.get("SERVER_PUBLIC_IP", "127.0.0.1")
-    SERVER_PORT = 5000
-
-    url = f"http://{SERVER_PUBLIC_IP}:{SERVER_PORT}/scan/{part_id}"
+    url = build_scan_url(part_id)
     
     try:
-        # Создаем объект QR-кода
-        qr_img = qrcode.make(url)
-        
-        # Создаем буфер в оперативной памяти для хранения изображения
-        img_buffer = BytesIO()
-        # Сохраняем изображение в этот буфер в формате PNG
-        qr_img.save(img_buffer, format='PNG')
-        # Перемещаем "курсор" в начало буфера, чтобы Flask мог его прочитать с самого начала
-        img_buffer.seek(0)
+        # Создаем буфер в оперативной памяти с PNG-изображением QR-кода.
+        # "Курсор" буфера находится в начале, чтобы Flask мог его прочитать.
+        img_buffer = BytesIO(render_qr_png(url))
         
         print(f"  -> QR-код для детали {part_id} сгенерирован в памяти.")
         return img_buffer # Возвращаем буфер с данными изображения
@@ -41,20 +53,22 @@ def generate_qr_code(part_id):
         print(f"  -> ОШИБКА создания QR-кода для {part_id}: {e}")
         return None
 
+# Таблица транслитерации кириллицы для str.translate (символы в нижнем регистре)
+_TRANSLIT = str.maketrans({
+    'а':'a','б':'b','в':'v','г':'g','д':'d','е':'e','ё':'yo','ж':'zh',
+    'з':'z','и':'i','й':'y','к':'k','л':'l','м':'m','н':'n','о':'o',
+    'п':'p','р':'r','с':'s','т':'t','у':'u','ф':'f','х':'h','ц':'c',
+    'ч':'ch','ш':'sh','щ':'sch','ъ':'','ы':'y','ь':'','э':'e','ю':'yu','я':'ya'
+})
+_UNSAFE_CHARS = re.compile(r'[^a-z0-9]+')
+
+@functools.lru_cache(maxsize=4096)
 def to_safe_key(text):
     """
     Преобразует текст (например, название изделия) в безопасный для использования
     в URL и как HTML id/class. Транслитерирует кириллицу и заменяет
     недопустимые символы на подчеркивание.
+    Результат кэшируется: обозначения изделий повторяются на каждой странице.
     """
-    text = text.lower()
-    translit = {
-        'а':'a','б':'b','в':'v','г':'g','д':'d','е':'e','ё':'yo','ж':'zh',
-        'з':'z','и':'i','й':'y','к':'k','л':'l','м':'m','н':'n','о':'o',
-        'п':'p','р':'r','с':'s','т':'t','у':'u','ф':'f','х':'h','ц':'c',
-        'ч':'ch','ш':'sh','щ':'sch','ъ':'','ы':'y','ь':'','э':'e','ю':'yu','я':'ya'
-    }
-    for char, repl in translit.items():
-        text = text.replace(char, repl)
     # Заменяем все, что не является латинской буквой или цифрой, на '_'
-    return re.sub(r'[^a-z0-9]+', '_', text).strip('_')
\ No newline at end of file
+    return _UNSAFE_CHARS.sub('_', text.lower().translate(_TRANSLIT)).strip('_')
@@ -0,0 +1,104 @@
+# file: benchmarks/bench_indexes.py
+"""
+Замер влияния индексов на "горячие" маршруты.
+
+Заполняет временную SQLite-базу детерминированным набором данных, затем
+замеряет маршруты без вторичных индексов и с ними и печатает таблицу
+медианных времен ответа.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_indexes --products 100 --parts 500
+"""
+import os
+import argparse
+import statistics
+import tempfile
+import time
+from sqlalchemy import text
+from app import db
+from benchmarks.dataset import seed_dataset, create_bench_app, ADMIN_USERNAME, ADMIN_PASSWORD
+
+# Индексы, добавленные миграцией f19b6d2c7a34
+BENCH_INDEXES = [
+    'ix_Parts_product_designation_part_id', 'ix_Parts_route_template_id', 'ix_Parts_import_job_id',
+    'ix_StatusHistory_part_id_timestamp', 'ix_StatusHistory_operator_name', 'ix_StatusHistory_timestamp',
+    'ix_AuditLogs_part_id_timestamp', 'ix_AuditLogs_timestamp', 'ix_RouteStages_template_id_order',
+]
+
+
+def bench_routes(summary):
+    """Список (название, URL) замеряемых маршрутов."""
+    return [
+        ('dashboard', '/'),
+        ('parts api', f"/api/parts/{summary['sample_product']}"),
+        ('history', f"/history/{summary['sample_part']}"),
+        ('scan', f"/scan/{summary['sample_part']}"),
+        ('audit log (page 1)', '/admin/audit_log?page=1'),
+        ('audit log (deep page)', f"/admin/audit_log?page={max(1, summary['audit'] // 25 - 1)}"),
+        ('operator report', '/admin/reports/operator_performance?date_from=2024-03-01&date_to=2024-06-01'),
+    ]
+
+
+def measure(client, routes, repeat):
+    """Возвращает медианное время ответа (мс) для каждого маршрута."""
+    results = {}
+    for name, url in routes:
+        client.get(url)  # прогрев
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200, f"{url}: {response.status_code}"
+        results[name] = statistics.median(timings)
+    return results
+
+
+def set_indexes(enabled):
+    """Удаляет или создает заново индексы из BENCH_INDEXES и обновляет статистику."""
+    indexes = {index.name: index for table in db.metadata.tables.values() for index in table.indexes}
+    with db.engine.begin() as connection:
+        for name in BENCH_INDEXES:
+            connection.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+            if enabled:
+                indexes[name].create(bind=connection)
+        connection.execute(text('ANALYZE'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--parts', type=int, default=400, help='деталей на изделие')
+    parser.add_argument('--history', type=int, default=4, help='максимум этапов на деталь')
+    parser.add_argument('--audit', type=int, default=3, help='записей аудита на деталь')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = create_bench_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            summary = seed_dataset(args.products, args.parts, args.history, args.audit)
+            print(f"Данные: {summary['parts']} деталей, {summary['history']} записей истории, "
+                  f"{summary['audit']} записей аудита ({time.perf_counter() - started:.1f} с)")
+
+            client = app.test_client()
+            client.post('/admin/login', data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+            routes = bench_routes(summary)
+
+            set_indexes(False)
+            before = measure(client, routes, args.repeat)
+            set_indexes(True)
+            after = measure(client, routes, args.repeat)
+            db.session.remove()
+            db.engine.dispose()
+
+    print(f"\n{'Маршрут':<24}{'без индексов, мс':>18}{'с индексами, мс':>18}{'ускорение':>12}")
+    for name, _ in routes:
+        speedup = before[name] / after[name] if after[name] else float('inf')
+        print(f"{name:<24}{before[name]:>18.1f}{after[name]:>18.1f}{speedup:>11.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# file: benchmarks/bench_safe_key.py
+"""
+Микрозамер app.utils.to_safe_key: прежняя реализация (33 последовательных
+str.replace) против str.translate без кэша и с LRU-кэшем.
+
+Корпус - обозначения в духе ЕСКД (шифр, номер, исполнение, наименование),
+каждое встречается несколько раз, как при выводе панели мониторинга.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_safe_key --designations 2000 --repeat 5
+"""
+import re
+import random
+import argparse
+import timeit
+from app.utils import to_safe_key
+
+NAMES = ["Корпус", "Вал", "Шестерня", "Крышка", "Втулка", "Фланец", "Кронштейн", "Ось", "Щит",
+         "Съемник", "Подшипниковый узел", "Ёмкость", "Шайба", "Гайка", "Муфта", "Экран", "Юбка", "Якорь"]
+CODES = ["АБВГ", "ЖКИЮ", "ШЩЭЯ", "ИЦЧФ", "ПРСТ", "ЛМНО", "EFGH"]
+
+
+def reference_to_safe_key(text):
+    """Прежняя реализация to_safe_key - эталон для сравнения результатов."""
+    text = text.lower()
+    translit = {
+        'а':'a','б':'b','в':'v','г':'g','д':'d','е':'e','ё':'yo','ж':'zh',
+        'з':'z','и':'i','й':'y','к':'k','л':'l','м':'m','н':'n','о':'o',
+        'п':'p','р':'r','с':'s','т':'t','у':'u','ф':'f','х':'h','ц':'c',
+        'ч':'ch','ш':'sh','щ':'sch','ъ':'','ы':'y','ь':'','э':'e','ю':'yu','я':'ya'
+    }
+    for char, repl in translit.items():
+        text = text.replace(char, repl)
+    return re.sub(r'[^a-z0-9]+', '_', text).strip('_')
+
+
+def designation_corpus(count, seed=42):
+    """Список из count различных обозначений изделий."""
+    rng = random.Random(seed)
+    corpus = set()
+    while len(corpus) < count:
+        code = f"{rng.choice(CODES)}.{rng.randint(100000, 999999)}.{rng.randint(1, 999):03d}"
+        if rng.random() < 0.3:
+            code += f"-{rng.randint(1, 20):02d}"
+        corpus.add(f"{code} {rng.choice(NAMES)}" + (f" ({rng.choice(NAMES).lower()})" if rng.random() < 0.2 else ''))
+    return sorted(corpus)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--designations', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=5, help='сколько раз встречается каждое обозначение')
+    args = parser.parse_args()
+
+    workload = designation_corpus(args.designations) * args.repeat
+    candidates = [
+        ('str.replace (прежняя)', reference_to_safe_key),
+        ('str.translate', to_safe_key.__wrapped__),
+        ('str.translate + LRU', to_safe_key),
+    ]
+    print(f"Вызовов на прогон: {len(workload)}")
+    print(f"{'Реализация':<24}{'мкс/вызов':>12}")
+
+    def run(function):
+        # Кэш очищается перед каждым прогоном: учитываются и промахи, и попадания
+        to_safe_key.cache_clear()
+        for text in workload:
+            function(text)
+
+    for name, function in candidates:
+        seconds = min(timeit.repeat(lambda: run(function), number=1, repeat=5))
+        print(f"{name:<24}{seconds / len(workload) * 1e6:>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
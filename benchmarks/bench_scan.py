@@ -0,0 +1,44 @@
+# file: benchmarks/bench_scan.py
+"""
+Замер потока сканирования на терминалах: HTML-страница выбора этапа и
+подтверждение формой против JSON API /api/scan.
+
+Печатает p50/p95 времени ответа и число SQL-запросов на запрос и отмечает
+сценарии, не укладывающиеся в целевое серверное время.
+
+Запуск из корня проекта:
+    python -m benchmarks.bench_scan --products 100 --parts 500 --requests 200
+"""
+import os
+import argparse
+import tempfile
+from benchmarks.run_suite import run_benchmarks
+
+SCAN_SCENARIOS = ('scan', 'scan_api', 'confirm_stage', 'confirm_api')
+
+# Целевое серверное время ответа быстрого пути (мс)
+TARGET_P50_MS = 10.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=50)
+    parser.add_argument('--parts', type=int, default=200)
+    parser.add_argument('--history', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=100, help='запросов на сценарий')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = run_benchmarks(os.path.join(tmp, 'bench.db'), args.products, args.parts, args.history,
+                                audit=1, requests=args.requests, only=SCAN_SCENARIOS)
+
+    print(f"Деталей: {report['dataset']['parts']}, записей истории: {report['dataset']['history']}")
+    print(f"{'Сценарий':<16}{'p50, мс':>10}{'p95, мс':>10}{'запросов':>10}")
+    for name in SCAN_SCENARIOS:
+        stats = report['routes'][name]
+        mark = '' if stats['p50_ms'] <= TARGET_P50_MS else f"  > {TARGET_P50_MS:.0f} мс"
+        print(f"{name:<16}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['queries_per_request']:>10.1f}{mark}")
+
+
+if __name__ == '__main__':
+    main()
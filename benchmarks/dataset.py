@@ -0,0 +1,123 @@
+# file: benchmarks/dataset.py
+"""
+Детерминированная генерация большого набора данных для замеров производительности.
+Одинаковые параметры и seed всегда дают одинаковые данные, поэтому результаты
+замеров можно сравнивать между коммитами.
+"""
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert
+from app import db
+from app.models.models import User, Stage, RouteTemplate, RouteStage, Part, StatusHistory, AuditLog
+from app.progress import rebuild_all
+from app.daily_stats import rebuild_daily_stats
+
+STAGE_NAMES = ["Заготовка", "Резка", "Токарная обработка", "Фрезерная обработка",
+               "Сверловка", "Термообработка", "Контроль ОТК", "Упаковка"]
+OPERATOR_COUNT = 25
+INSERT_BATCH_SIZE = 5000
+START_DATE = datetime(2024, 1, 1)
+
+ADMIN_USERNAME = 'bench_admin'
+ADMIN_PASSWORD = 'bench_password'
+
+
+def _insert_batches(model, rows):
+    """Вставляет строки порциями через core insert()."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+
+
+def product_name(index):
+    return f"Изделие {index:04d}"
+
+
+def part_name(product_index, part_index):
+    return f"P{product_index:04d}-{part_index:05d}"
+
+
+def seed_dataset(products=50, parts_per_product=200, history_per_part=3, audit_per_part=2, seed=42):
+    """
+    Заполняет пустую базу: справочник этапов, два маршрута, администратора,
+    products x parts_per_product деталей, до history_per_part пройденных этапов
+    и audit_per_part записей аудита на деталь. Возвращает сводку с примерами
+    идентификаторов для построения URL.
+    """
+    rng = random.Random(seed)
+
+    admin = User(username=ADMIN_USERNAME, role='admin', can_add_parts=True, can_edit_parts=True,
+                 can_delete_parts=True, can_generate_qr=True, can_view_audit_log=True,
+                 can_manage_stages=True, can_manage_routes=True, can_view_reports=True,
+                 can_manage_users=True)
+    admin.set_password(ADMIN_PASSWORD)
+    db.session.add(admin)
+    stages = [Stage(name=name) for name in STAGE_NAMES]
+    db.session.add_all(stages)
+    db.session.flush()
+
+    routes = []
+    for route_index, stage_slice in enumerate((stages[:5], stages[1:])):
+        route = RouteTemplate(name=f"Маршрут {route_index + 1}", is_default=route_index == 0)
+        db.session.add(route)
+        db.session.flush()
+        for order, stage in enumerate(stage_slice):
+            db.session.add(RouteStage(template_id=route.id, stage_id=stage.id, order=order))
+        routes.append((route.id, [stage.name for stage in stage_slice]))
+    db.session.commit()
+
+    operators = [f"Оператор {i:02d}" for i in range(OPERATOR_COUNT)]
+    part_rows, history_rows, audit_rows = [], [], []
+    for product_index in range(products):
+        route_id, route_stages = routes[product_index % len(routes)]
+        for part_index in range(parts_per_product):
+            part_id = part_name(product_index, part_index)
+            added = START_DATE + timedelta(minutes=rng.randrange(0, 60 * 24 * 365))
+            completed = route_stages[:rng.randint(0, min(history_per_part, len(route_stages)))]
+            moment = added
+            for stage_name in completed:
+                moment += timedelta(minutes=rng.randrange(10, 60 * 24 * 3))
+                history_rows.append({'part_id': part_id, 'status': stage_name,
+                                     'operator_name': rng.choice(operators), 'timestamp': moment})
+            for audit_index in range(audit_per_part):
+                audit_rows.append({'part_id': part_id, 'user_id': admin.id, 'action': "Создание" if audit_index == 0 else "Редактирование",
+                                   'details': "Сгенерировано для замеров производительности.",
+                                   'timestamp': added + timedelta(minutes=audit_index)})
+            part_rows.append({'part_id': part_id, 'product_designation': product_name(product_index),
+                              'route_template_id': route_id, 'date_added': added, 'last_update': moment,
+                              'current_status': completed[-1] if completed else 'На складе',
+                              # Пройден префикс маршрута: биты 0..len(completed)-1
+                              'completed_count': len(completed), 'completed_mask': (1 << len(completed)) - 1})
+
+    _insert_batches(Part, part_rows)
+    _insert_batches(StatusHistory, history_rows)
+    _insert_batches(AuditLog, audit_rows)
+    db.session.commit()
+    rebuild_all()
+    rebuild_daily_stats()
+
+    return {
+        'products': products,
+        'parts': len(part_rows),
+        'history': len(history_rows),
+        'audit': len(audit_rows),
+        'sample_product': product_name(products // 2),
+        'sample_part': part_name(products // 2, parts_per_product // 2),
+        'sample_operator': operators[0],
+    }
+
+
+def create_bench_app(db_path):
+    """Создает приложение с файловой SQLite-базой для замеров (фоновые задания синхронны)."""
+    from app import create_app
+    from config import TestingConfig
+
+    class BenchmarkConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{db_path}"
+
+    return create_app(BenchmarkConfig)
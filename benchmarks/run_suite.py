@@ -0,0 +1,232 @@
+# file: benchmarks/run_suite.py
+"""
+HTTP-бенчмарк основных маршрутов приложения.
+
+Заполняет SQLite-базу детерминированным синтетическим набором данных
+(изделия, детали, история, аудит), прогоняет через тестовый клиент Flask
+панель мониторинга, API деталей, историю, сканирование/подтверждение этапа,
+журнал аудита и отчеты, и сохраняет перцентили задержек и число SQL-запросов
+на запрос в JSON-файл, который удобно сравнивать между коммитами.
+
+Запуск из корня проекта:
+    python -m benchmarks.run_suite --products 100 --parts 300 --output bench.json
+    python -m benchmarks.run_suite --output new.json --compare bench.json
+"""
+import os
+import sys
+import json
+import argparse
+import platform
+import subprocess
+import tempfile
+import time
+from urllib.parse import quote
+from contextlib import contextmanager
+from sqlalchemy import event, func
+from app import db
+from app.models.models import Part, StatusHistory, RouteStage, Stage, AuditLog
+from app.audit import encode_cursor as encode_audit_cursor
+from benchmarks.dataset import seed_dataset, create_bench_app, ADMIN_USERNAME, ADMIN_PASSWORD
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(sorted_values, pct):
+    """Перцентиль методом ближайшего ранга по отсортированному списку."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[rank]
+
+
+@contextmanager
+def count_queries(engine):
+    """Подсчитывает SQL-запросы, выполненные движком внутри блока."""
+    counter = {'queries': 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter['queries'] += 1
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def confirm_targets(limit):
+    """
+    Подбирает детали без пройденных этапов и первый этап их маршрута,
+    чтобы каждое подтверждение в замере было допустимым и уникальным.
+    """
+    first_stages = dict(db.session.query(RouteStage.template_id, Stage.name)
+                        .join(Stage, Stage.id == RouteStage.stage_id)
+                        .filter(RouteStage.order == 0))
+    rows = db.session.query(Part.part_id, Part.route_template_id)\
+        .outerjoin(StatusHistory, StatusHistory.part_id == Part.part_id)\
+        .group_by(Part.part_id).having(func.count(StatusHistory.id) == 0)\
+        .order_by(Part.part_id).limit(limit)
+    targets = [(part_id, first_stages[template_id]) for part_id, template_id in rows]
+    if len(targets) < limit:
+        raise RuntimeError(f"Недостаточно деталей без истории для {limit} подтверждений: "
+                           f"увеличьте объем данных или уменьшите --requests.")
+    return targets
+
+
+def deep_audit_cursor(offset):
+    """Курсор журнала аудита на записи с номером offset от самой новой."""
+    log = AuditLog.query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).offset(offset).first()
+    return encode_audit_cursor(log)
+
+
+def build_scenarios(summary, requests):
+    """
+    Список сценариев: (название, метод, генератор URL по номеру итерации,
+    генератор JSON-тела или None).
+    """
+    # Каждому сценарию подтверждения - свой набор деталей (с учетом прогрева)
+    targets = confirm_targets(2 * (requests + 1))
+    form_targets, api_targets = targets[0::2], targets[1::2]
+    # Курсор на последние записи журнала - самая глубокая страница
+    deep_cursor = quote(deep_audit_cursor(max(0, summary['audit'] - 26)))
+    return [
+        ('dashboard', 'GET', lambda i: '/', None),
+        ('search', 'GET', lambda i: f"/api/search?q={summary['sample_part'][:4]}", None),
+        ('parts_api', 'GET', lambda i: f"/api/parts/{summary['sample_product']}", None),
+        ('parts_api_page', 'GET', lambda i: f"/api/parts/{summary['sample_product']}?limit=50", None),
+        ('history', 'GET', lambda i: f"/history/{summary['sample_part']}", None),
+        ('scan', 'GET', lambda i: f"/scan/{summary['sample_part']}", None),
+        ('scan_api', 'GET', lambda i: f"/api/scan/{summary['sample_part']}", None),
+        ('confirm_stage', 'POST', lambda i: f"/confirm_stage/{form_targets[i][0]}/{form_targets[i][1]}", None),
+        ('confirm_api', 'POST', lambda i: f"/api/scan/{api_targets[i][0]}/confirm",
+         lambda i: {'stage': api_targets[i][1], 'operator': summary['sample_operator']}),
+        ('audit_log', 'GET', lambda i: '/admin/audit_log?page=1', None),
+        ('audit_log_deep', 'GET', lambda i: f"/admin/audit_log?before={deep_cursor}", None),
+        ('report_operators', 'GET', lambda i: '/admin/reports/operator_performance?date_from=2024-03-01&date_to=2024-06-01', None),
+        ('report_stage_duration', 'GET', lambda i: '/admin/reports/stage_duration', None),
+        ('report_stage_throughput', 'GET', lambda i: '/admin/reports/stage_throughput?date_from=2024-03-01&date_to=2024-06-01', None),
+    ]
+
+
+def run_scenario(client, engine, method, url_for_iteration, requests, json_for_iteration=None):
+    """Выполняет сценарий requests раз, возвращает статистику задержек и запросов."""
+    def send(i):
+        body = json_for_iteration(i) if json_for_iteration else None
+        return client.open(url_for_iteration(i), method=method, json=body)
+
+    # Прогрев: первый запрос компилирует шаблоны и заполняет кэши
+    send(requests)
+    timings, queries, statuses = [], [], set()
+    for i in range(requests):
+        url = url_for_iteration(i)
+        with count_queries(engine) as counter:
+            started = time.perf_counter()
+            response = send(i)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(counter['queries'])
+        statuses.add(response.status_code)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {url}: HTTP {response.status_code}")
+    timings.sort()
+    result = {f"p{pct}_ms": round(percentile(timings, pct), 3) for pct in PERCENTILES}
+    result['mean_ms'] = round(sum(timings) / len(timings), 3)
+    result['max_ms'] = round(timings[-1], 3)
+    result['queries_per_request'] = round(sum(queries) / len(queries), 2)
+    result['status_codes'] = sorted(statuses)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(db_path, products, parts, history, audit, requests, seed=42, only=None):
+    """
+    Заполняет базу по пути db_path и выполняет сценарии (все или перечисленные
+    в only). Возвращает отчет (dict).
+    """
+    app = create_bench_app(db_path)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        summary = seed_dataset(products, parts, history, audit, seed=seed)
+        seed_seconds = time.perf_counter() - started
+
+        client = app.test_client()
+        client.post('/admin/login', data={'username': ADMIN_USERNAME, 'password': ADMIN_PASSWORD})
+        routes = {}
+        for name, method, url_for_iteration, json_for_iteration in build_scenarios(summary, requests):
+            if only is None or name in only:
+                routes[name] = run_scenario(client, db.engine, method, url_for_iteration, requests,
+                                            json_for_iteration)
+        db.session.remove()
+        db.engine.dispose()
+
+    return {
+        'meta': {
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'params': {'products': products, 'parts_per_product': parts, 'history_per_part': history,
+                       'audit_per_part': audit, 'requests': requests, 'seed': seed},
+            'seed_seconds': round(seed_seconds, 2),
+        },
+        'dataset': summary,
+        'routes': routes,
+    }
+
+
+def print_report(report, baseline=None):
+    """Печатает таблицу результатов, при наличии baseline - с разницей p50/p95."""
+    header = f"{'Маршрут':<24}{'p50, мс':>10}{'p95, мс':>10}{'запросов':>10}"
+    if baseline:
+        header += f"{'Δp50':>10}{'Δp95':>10}{'Δзапр.':>9}"
+    print(header)
+    for name, stats in report['routes'].items():
+        line = f"{name:<24}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['queries_per_request']:>10.1f}"
+        old = (baseline or {}).get('routes', {}).get(name)
+        if old:
+            line += (f"{stats['p50_ms'] - old['p50_ms']:>+10.2f}{stats['p95_ms'] - old['p95_ms']:>+10.2f}"
+                     f"{stats['queries_per_request'] - old['queries_per_request']:>+9.1f}")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=50, help='количество изделий')
+    parser.add_argument('--parts', type=int, default=200, help='деталей на изделие')
+    parser.add_argument('--history', type=int, default=4, help='максимум пройденных этапов на деталь')
+    parser.add_argument('--audit', type=int, default=3, help='записей аудита на деталь')
+    parser.add_argument('--requests', type=int, default=30, help='запросов на сценарий')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--db', help='путь к файлу базы (по умолчанию временный файл)')
+    parser.add_argument('--output', help='куда сохранить JSON-отчет')
+    parser.add_argument('--compare', help='JSON-отчет предыдущего запуска для сравнения')
+    args = parser.parse_args()
+
+    params = (args.products, args.parts, args.history, args.audit, args.requests, args.seed)
+    if args.db:
+        if os.path.exists(args.db):
+            sys.exit(f"Файл {args.db} уже существует: бенчмарку нужна пустая база.")
+        report = run_benchmarks(args.db, *params)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            report = run_benchmarks(os.path.join(tmp, 'bench.db'), *params)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nОтчет сохранен в {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,61 @@ class Config:
     # конфигурациях или через переменную окружения.
     SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_DATABASE_URI')
 
+    # Количество фоновых потоков для заданий импорта. Один поток не дает
+    # крупным импортам конкурировать между собой за блокировку SQLite.
+    IMPORT_JOB_WORKERS = int(os.environ.get('IMPORT_JOB_WORKERS', 1))
+
+    # Если True, задания импорта выполняются сразу в потоке запроса
+    # (используется в тестах, где база данных живет в памяти).
+    IMPORT_JOBS_SYNCHRONOUS = False
+
+    # Количество процессов для пакетной генерации QR-кодов (0 - в текущем процессе)
+    # и максимальное число деталей в одном пакете.
+    QR_BATCH_WORKERS = int(os.environ.get('QR_BATCH_WORKERS', os.cpu_count() or 1))
+    QR_BATCH_MAX_PARTS = 10000
+
+    # Максимальный размер дискового кэша QR-кодов в каталоге QR_FOLDER (в байтах).
+    QR_CACHE_MAX_BYTES = int(os.environ.get('QR_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+
+    # Кэш маршрутов общий для нескольких процессов: при True процессы сверяют
+    # версию кэша в таблице CacheVersions не чаще раза в ROUTE_CACHE_CHECK_INTERVAL секунд.
+    # Для одного процесса waitress (по умолчанию) экраны читают кэш со сбросом в процессе.
+    # Подтверждение и отмена этапа в любом режиме сверяют версию в базе под блокировкой записи.
+    ROUTE_CACHE_SHARED = os.environ.get('ROUTE_CACHE_SHARED', '').lower() in ('1', 'true', 'yes')
+    ROUTE_CACHE_CHECK_INTERVAL = 2.0
+
+    # Время жизни кэша справочников этапов и шаблонов маршрутов (в секундах).
+    # Локальные изменения сбрасывают кэш сразу; TTL ограничивает устаревание
+    # в других процессах.
+    REFERENCE_CACHE_TTL = int(os.environ.get('REFERENCE_CACHE_TTL', 300))
+
+    # Максимальное число событий в одном пакете подтверждений от терминала.
+    SCAN_BATCH_MAX_EVENTS = 1000
+
+    # Журнал аудита записывается фоновым потоком пакетами: не реже раза в
+    # AUDIT_FLUSH_INTERVAL секунд или по AUDIT_BATCH_SIZE строк. При заполнении
+    # очереди (AUDIT_QUEUE_SIZE строк) запись выполняется в потоке запроса.
+    AUDIT_SYNCHRONOUS = False
+    AUDIT_QUEUE_SIZE = 10000
+    AUDIT_BATCH_SIZE = 200
+    AUDIT_FLUSH_INTERVAL = 0.5
+
+    # Записи журнала аудита старше AUDIT_RETENTION_DAYS дней команда
+    # 'flask archive-audit' переносит в сжатые месячные файлы в instance/audit_archive.
+    AUDIT_RETENTION_DAYS = int(os.environ.get('AUDIT_RETENTION_DAYS', 365))
+
+    # Бюджет SQL-запросов на один HTTP-запрос. Превышение записывается в лог
+    # и отмечается на странице /admin/metrics (обычно это признак N+1).
+    # QUERY_BUDGETS задает бюджеты для отдельных эндпоинтов, например {'main.history': 5}.
+    QUERY_BUDGET = int(os.environ.get('QUERY_BUDGET', 30))
+    QUERY_BUDGETS = {}
+
+    # Добавлять ли к ответам заголовок Server-Timing (время SQL, рендеринга и общее).
+    SERVER_TIMING_HEADER = True
+
+    # Если задан, эндпоинт /metrics требует заголовок "Authorization: Bearer <токен>".
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
 
 class DevelopmentConfig(Config):
     """
@@ -55,6 +110,16 @@ class TestingConfig(Config):
     # Это решает ошибку "The session is unavailable because no secret key was set".
     SECRET_KEY = 'a-secret-key-for-testing-purposes'
 
+    # In-memory SQLite доступна только одному соединению, поэтому
+    # фоновые задания в тестах выполняются синхронно.
+    IMPORT_JOBS_SYNCHRONOUS = True
+
+    # По той же причине журнал аудита в тестах записывается сразу.
+    AUDIT_SYNCHRONOUS = True
+
+    # Пул процессов в тестах не нужен: QR-коды генерируются в текущем процессе.
+    QR_BATCH_WORKERS = 0
+
 
 class ProductionConfig(Config):
     """
@@ -1,13 +1,14 @@
 # file: database_setup.py
 from app import create_app
 from app.models.models import db, Part, User, AuditLog, RouteTemplate, RouteStage, Stage
+from app.progress import rebuild_all
 
-def seed_data():
+def seed_data(app=None):
     """
     Заполняет базу начальными данными: этапами, маршрутами, деталями и
     первым администратором. Выполняется только если база пуста.
     """
-    app = create_app()
+    app = app or create_app()
     with app.app_context():
         # Проверяем, есть ли уже пользователи, чтобы не запускать скрипт повторно
         if User.query.first():
@@ -82,6 +83,11 @@ def seed_data():
             db.session.add(log)
         
         db.session.commit()
+
+        # Детали добавлены через ORM, а панель мониторинга и поиск читают сводную
+        # таблицу ProductProgress; миграции заполняют ее, пока база еще пуста
+        print("Заполнение сводной таблицы прогресса изделий...")
+        rebuild_all()
         
         print("\n✅ База данных и администратор успешно созданы.")
         print("\n--- Учетные данные администратора ---")
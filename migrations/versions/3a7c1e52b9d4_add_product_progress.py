@@ -0,0 +1,44 @@
+"""Add ProductProgress summary table
+
+Revision ID: 3a7c1e52b9d4
+Revises: 1d2881f8a15c
+Create Date: 2026-10-17 09:12:31.418205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7c1e52b9d4'
+down_revision = '1d2881f8a15c'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ProductProgress',
+    sa.Column('product_designation', sa.String(), nullable=False),
+    sa.Column('total_parts', sa.Integer(), nullable=False),
+    sa.Column('completed_stages', sa.Integer(), nullable=False),
+    sa.Column('possible_stages', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('product_designation')
+    )
+    # Первичное заполнение сводной таблицы по уже существующим данным
+    op.execute("""
+        INSERT INTO "ProductProgress" (product_designation, total_parts, completed_stages, possible_stages)
+        SELECT p.product_designation,
+               COUNT(p.part_id),
+               COALESCE(SUM(h.history_count), 0),
+               COALESCE(SUM(r.stage_count), 0)
+        FROM "Parts" p
+        LEFT JOIN (SELECT part_id, COUNT(id) AS history_count
+                   FROM "StatusHistory" GROUP BY part_id) h ON h.part_id = p.part_id
+        LEFT JOIN (SELECT template_id, COUNT(id) AS stage_count
+                   FROM "RouteStages" GROUP BY template_id) r ON r.template_id = p.route_template_id
+        GROUP BY p.product_designation
+    """)
+
+
+def downgrade():
+    op.drop_table('ProductProgress')
@@ -0,0 +1,27 @@
+"""Add audit log indexes for filtered keyset pagination
+
+Revision ID: 5c2e8a41f9b3
+Revises: e3a95c7d1f48
+Create Date: 2026-10-17 18:05:47.390122
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5c2e8a41f9b3'
+down_revision = 'e3a95c7d1f48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('AuditLogs', schema=None) as batch_op:
+        batch_op.create_index('ix_AuditLogs_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_AuditLogs_action_timestamp', ['action', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('AuditLogs', schema=None) as batch_op:
+        batch_op.drop_index('ix_AuditLogs_action_timestamp')
+        batch_op.drop_index('ix_AuditLogs_user_id_timestamp')
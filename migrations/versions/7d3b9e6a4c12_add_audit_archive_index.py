@@ -0,0 +1,29 @@
+"""Add audit archive index
+
+Revision ID: 7d3b9e6a4c12
+Revises: 5c2e8a41f9b3
+Create Date: 2026-10-17 19:12:08.514730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3b9e6a4c12'
+down_revision = '5c2e8a41f9b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('AuditArchiveIndex',
+    sa.Column('part_id', sa.String(), nullable=False),
+    sa.Column('month', sa.String(length=7), nullable=False),
+    sa.Column('entries', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('part_id', 'month')
+    )
+
+
+def downgrade():
+    op.drop_table('AuditArchiveIndex')
@@ -0,0 +1,42 @@
+"""Add ImportJobs table for background imports
+
+Revision ID: 8e41d0c6f2a7
+Revises: 3a7c1e52b9d4
+Create Date: 2026-10-17 10:02:47.903114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e41d0c6f2a7'
+down_revision = '3a7c1e52b9d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ImportJobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('filename', sa.String(), nullable=False),
+    sa.Column('filepath', sa.String(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('route_template_id', sa.Integer(), nullable=False),
+    sa.Column('rows_read', sa.Integer(), nullable=False),
+    sa.Column('added', sa.Integer(), nullable=False),
+    sa.Column('skipped', sa.Integer(), nullable=False),
+    sa.Column('errors', sa.Integer(), nullable=False),
+    sa.Column('message', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['route_template_id'], ['RouteTemplates.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['Users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade():
+    op.drop_table('ImportJobs')
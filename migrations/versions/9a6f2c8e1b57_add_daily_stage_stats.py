@@ -0,0 +1,38 @@
+"""Add daily stage stats rollup
+
+Revision ID: 9a6f2c8e1b57
+Revises: 7d3b9e6a4c12
+Create Date: 2026-10-17 20:03:41.207915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a6f2c8e1b57'
+down_revision = '7d3b9e6a4c12'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('DailyStageStats',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('operator_name', sa.String(), nullable=False),
+    sa.Column('stage', sa.String(), nullable=False),
+    sa.Column('completed', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'operator_name', 'stage')
+    )
+
+    # Заполнение по существующей истории; то же делает 'flask rebuild-daily-stats'
+    op.execute("""
+        INSERT INTO "DailyStageStats" (day, operator_name, stage, completed)
+        SELECT date(timestamp), operator_name, status, COUNT(*)
+        FROM "StatusHistory"
+        GROUP BY date(timestamp), operator_name, status
+    """)
+
+
+def downgrade():
+    op.drop_table('DailyStageStats')
@@ -0,0 +1,28 @@
+"""Add CacheVersions table for cross-process cache invalidation
+
+Revision ID: a4d9e27b1c85
+Revises: f19b6d2c7a34
+Create Date: 2026-10-17 14:21:09.417520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d9e27b1c85'
+down_revision = 'f19b6d2c7a34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('CacheVersions',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('CacheVersions')
@@ -0,0 +1,43 @@
+"""Add denormalized completed_count and completed_mask to Parts
+
+Revision ID: b71e3f05d6a2
+Revises: a4d9e27b1c85
+Create Date: 2026-10-17 15:02:33.108246
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b71e3f05d6a2'
+down_revision = 'a4d9e27b1c85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('Parts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('completed_count', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('completed_mask', sa.BigInteger(), server_default='0', nullable=False))
+
+    # Заполнение по существующей истории. Позиция этапа - его порядковый номер
+    # в маршруте; повторные записи одного этапа дают один бит (SUM DISTINCT).
+    # При необходимости результат проверяется 'flask verify-part-progress'.
+    op.execute("""
+        UPDATE "Parts" SET
+            completed_count = (SELECT COUNT(*) FROM "StatusHistory" h WHERE h.part_id = "Parts".part_id),
+            completed_mask = COALESCE((
+                SELECT SUM(DISTINCT 1 << rs."order")
+                FROM "StatusHistory" h
+                JOIN "Stages" s ON s.name = h.status
+                JOIN "RouteStages" rs ON rs.stage_id = s.id AND rs.template_id = "Parts".route_template_id
+                WHERE h.part_id = "Parts".part_id
+            ), 0)
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('Parts', schema=None) as batch_op:
+        batch_op.drop_column('completed_mask')
+        batch_op.drop_column('completed_count')
@@ -0,0 +1,29 @@
+"""Link parts to the import job that created them
+
+Revision ID: c5f83a19d2e0
+Revises: 8e41d0c6f2a7
+Create Date: 2026-10-17 11:20:05.662371
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f83a19d2e0'
+down_revision = '8e41d0c6f2a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('Parts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('import_job_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_Parts_import_job_id_ImportJobs', 'ImportJobs', ['import_job_id'], ['id'])
+
+
+def downgrade():
+    # SQLite не сохраняет имена внешних ключей при отражении схемы, поэтому
+    # ограничение удаляется вместе с колонкой при пересоздании таблицы.
+    with op.batch_alter_table('Parts', schema=None) as batch_op:
+        batch_op.drop_column('import_job_id')
@@ -0,0 +1,105 @@
+"""Add normalized search keys and FTS5 search index
+
+Revision ID: e3a95c7d1f48
+Revises: b71e3f05d6a2
+Create Date: 2026-10-17 16:40:12.513904
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a95c7d1f48'
+down_revision = 'b71e3f05d6a2'
+branch_labels = None
+depends_on = None
+
+# Схема и нормализация зафиксированы на момент ревизии (копия app/search.py и
+# app/utils.to_safe_key), чтобы их последующие изменения не меняли миграцию.
+FTS_TABLE = 'SearchIndex'
+
+FTS_DDL = (
+    'CREATE VIRTUAL TABLE IF NOT EXISTS "SearchIndex" USING fts5('
+    'product_key, part_key, product_designation UNINDEXED, part_id UNINDEXED, tokenize="unicode61")',
+    'CREATE TRIGGER IF NOT EXISTS "Parts_search_ai" AFTER INSERT ON "Parts" BEGIN '
+    'INSERT INTO "SearchIndex"(product_key, part_key, product_designation, part_id) '
+    'VALUES (NULL, new.search_key, new.product_designation, new.part_id); END',
+    'CREATE TRIGGER IF NOT EXISTS "Parts_search_ad" AFTER DELETE ON "Parts" BEGIN '
+    'DELETE FROM "SearchIndex" WHERE part_id = old.part_id; END',
+    'CREATE TRIGGER IF NOT EXISTS "Parts_search_au" AFTER UPDATE OF product_designation ON "Parts" BEGIN '
+    'UPDATE "SearchIndex" SET product_designation = new.product_designation WHERE part_id = old.part_id; END',
+    'CREATE TRIGGER IF NOT EXISTS "ProductProgress_search_ai" AFTER INSERT ON "ProductProgress" BEGIN '
+    'INSERT INTO "SearchIndex"(product_key, part_key, product_designation, part_id) '
+    'VALUES (new.search_key, NULL, new.product_designation, NULL); END',
+    'CREATE TRIGGER IF NOT EXISTS "ProductProgress_search_ad" AFTER DELETE ON "ProductProgress" BEGIN '
+    'DELETE FROM "SearchIndex" WHERE part_id IS NULL AND product_designation = old.product_designation; END',
+)
+
+FTS_POPULATE = (
+    'INSERT INTO "SearchIndex"(product_key, part_key, product_designation, part_id) '
+    'SELECT search_key, NULL, product_designation, NULL FROM "ProductProgress" '
+    'UNION ALL SELECT NULL, search_key, product_designation, part_id FROM "Parts"'
+)
+
+TRIGGERS = ('Parts_search_ai', 'Parts_search_ad', 'Parts_search_au',
+            'ProductProgress_search_ai', 'ProductProgress_search_ad')
+
+_TRANSLIT = str.maketrans({
+    'а':'a','б':'b','в':'v','г':'g','д':'d','е':'e','ё':'yo','ж':'zh',
+    'з':'z','и':'i','й':'y','к':'k','л':'l','м':'m','н':'n','о':'o',
+    'п':'p','р':'r','с':'s','т':'t','у':'u','ф':'f','х':'h','ц':'c',
+    'ч':'ch','ш':'sh','щ':'sch','ъ':'','ы':'y','ь':'','э':'e','ю':'yu','я':'ya'
+})
+_UNSAFE_CHARS = re.compile(r'[^a-z0-9]+')
+
+
+def _search_key(text):
+    return _UNSAFE_CHARS.sub('_', text.lower().translate(_TRANSLIT)).strip('_')
+
+
+def _fts5_supported(bind):
+    if bind.dialect.name != 'sqlite':
+        return False
+    return bool(bind.exec_driver_sql("SELECT sqlite_compileoption_used('ENABLE_FTS5')").scalar())
+
+
+def _backfill(bind, table, key_column):
+    # Транслитерация выполняется в Python, поэтому ключи заполняются executemany
+    rows = bind.execute(sa.text(f'SELECT {key_column} FROM "{table}"')).all()
+    if rows:
+        bind.execute(sa.text(f'UPDATE "{table}" SET search_key = :search_key WHERE {key_column} = :key'),
+                     [{'search_key': _search_key(key), 'key': key} for key, in rows])
+
+
+def upgrade():
+    for table in ('Parts', 'ProductProgress'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('search_key', sa.String(), nullable=True))
+
+    bind = op.get_bind()
+    _backfill(bind, 'Parts', 'part_id')
+    _backfill(bind, 'ProductProgress', 'product_designation')
+
+    for table in ('Parts', 'ProductProgress'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('search_key', existing_type=sa.String(), nullable=False)
+
+    # Индекс FTS5 и триггеры создаются после пересоздания таблиц в batch-режиме
+    if _fts5_supported(bind):
+        for statement in FTS_DDL:
+            op.execute(statement)
+        op.execute(FTS_POPULATE)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'sqlite':
+        for trigger in TRIGGERS:
+            op.execute(f'DROP TRIGGER IF EXISTS "{trigger}"')
+        op.execute(f'DROP TABLE IF EXISTS "{FTS_TABLE}"')
+
+    for table in ('ProductProgress', 'Parts'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('search_key')
@@ -0,0 +1,53 @@
+"""Add indexes for hot query columns
+
+Revision ID: f19b6d2c7a34
+Revises: c5f83a19d2e0
+Create Date: 2026-10-17 12:41:18.230957
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f19b6d2c7a34'
+down_revision = 'c5f83a19d2e0'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('Parts', schema=None) as batch_op:
+        batch_op.create_index('ix_Parts_product_designation_part_id', ['product_designation', 'part_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_Parts_route_template_id'), ['route_template_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_Parts_import_job_id'), ['import_job_id'], unique=False)
+
+    with op.batch_alter_table('StatusHistory', schema=None) as batch_op:
+        batch_op.create_index('ix_StatusHistory_part_id_timestamp', ['part_id', 'timestamp'], unique=False)
+        batch_op.create_index(batch_op.f('ix_StatusHistory_operator_name'), ['operator_name'], unique=False)
+        batch_op.create_index(batch_op.f('ix_StatusHistory_timestamp'), ['timestamp'], unique=False)
+
+    with op.batch_alter_table('AuditLogs', schema=None) as batch_op:
+        batch_op.create_index('ix_AuditLogs_part_id_timestamp', ['part_id', 'timestamp'], unique=False)
+        batch_op.create_index(batch_op.f('ix_AuditLogs_timestamp'), ['timestamp'], unique=False)
+
+    with op.batch_alter_table('RouteStages', schema=None) as batch_op:
+        batch_op.create_index('ix_RouteStages_template_id_order', ['template_id', 'order'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('RouteStages', schema=None) as batch_op:
+        batch_op.drop_index('ix_RouteStages_template_id_order')
+
+    with op.batch_alter_table('AuditLogs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_AuditLogs_timestamp'))
+        batch_op.drop_index('ix_AuditLogs_part_id_timestamp')
+
+    with op.batch_alter_table('StatusHistory', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_StatusHistory_timestamp'))
+        batch_op.drop_index(batch_op.f('ix_StatusHistory_operator_name'))
+        batch_op.drop_index('ix_StatusHistory_part_id_timestamp')
+
+    with op.batch_alter_table('Parts', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_Parts_import_job_id'))
+        batch_op.drop_index(batch_op.f('ix_Parts_route_template_id'))
+        batch_op.drop_index('ix_Parts_product_designation_part_id')
@@ -1,8 +1,11 @@
 import os
+import signal
 import logging
 from logging.handlers import RotatingFileHandler
 from app import create_app
-from waitress import serve
+from waitress import create_server
+from app.metrics import metrics
+from app.jobs import job_runner
 from dotenv import load_dotenv
 from config import DevelopmentConfig, ProductionConfig
 
@@ -56,8 +59,32 @@ if __name__ == '__main__':
     host = '0.0.0.0'
     port = 5000
     
+    # Задания импорта, оставшиеся от прошлого запуска, возвращаются в очередь
+    requeued, interrupted = job_runner.recover()
+    app.logger.info(f'Import jobs recovered: {requeued} requeued, {interrupted} interrupted.')
+
     # Выводим информационное сообщение в консоль.
     print(f"Server is starting on http://{host}:{port}")
     
-    # Запускаем приложение с помощью сервера waitress.
-    serve(app, host=host, port=port)
\ No newline at end of file
+    # Запускаем приложение с помощью сервера waitress. Сервер создается явно,
+    # чтобы метрики /metrics могли показывать глубину его очереди запросов.
+    server = create_server(app, host=host, port=port)
+    metrics.bind_waitress(server)
+
+    # В Docker процесс работает как PID 1, и 'docker stop' присылает SIGTERM,
+    # на который по умолчанию процесс завершается без atexit. Сигнал превращается
+    # в SystemExit, и waitress выходит из цикла run().
+    def stop_server(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop_server)
+    signal.signal(signal.SIGINT, stop_server)
+    try:
+        server.run()
+    finally:
+        # Сначала закрывается прием соединений и завершаются рабочие потоки
+        # (текущие запросы дорабатывают), и только затем записывается остаток
+        # очереди аудита: после этого новые записи в очередь не попадают
+        server.close()
+        server.task_dispatcher.shutdown()
+        app.extensions['audit_writer'].shutdown()
\ No newline at end of file
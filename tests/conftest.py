@@ -7,6 +7,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 from app import create_app, db
 from config import TestingConfig
 from app.models.models import User, Stage
+from app.reference_cache import invalidate_reference_data
 
 @pytest.fixture(scope='module')
 def app():
@@ -27,6 +28,32 @@ def database(app):
         stage2 = Stage(name='Test Stage 2')
         db.session.add_all([admin, stage1, stage2])
         db.session.commit()
+        # База пересоздается для каждого теста, поэтому кэши справочников сбрасываются
+        invalidate_reference_data()
         yield db
         db.session.remove()
-        db.drop_all()
\ No newline at end of file
+        db.drop_all()
+
+@pytest.fixture(scope='function')
+def query_counter(app):
+    """
+    Возвращает функцию-контекст, подсчитывающую SQL-запросы к движку БД.
+    Используется в регрессионных тестах против N+1.
+    """
+    from contextlib import contextmanager
+    from sqlalchemy import event
+
+    @contextmanager
+    def count_queries():
+        statements = []
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+    return count_queries
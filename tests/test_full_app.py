@@ -113,4 +113,1239 @@ def test_create_route_with_no_stages_fails_validation(app, client, database):
     # Проверяем, что маршрут НЕ был создан
     with app.app_context():
         route = RouteTemplate.query.filter_by(name='Route Without Stages').first()
-        assert route is None
\ No newline at end of file
+        assert route is None
+
+# === 5. Тесты сводной таблицы прогресса изделий ===
+
+def _create_route_with_parts(product, part_ids):
+    """Создает маршрут из двух тестовых этапов и детали изделия на нем."""
+    from app import db
+    from app.reference_cache import invalidate_reference_data
+    stage1 = Stage.query.filter_by(name='Test Stage 1').first()
+    stage2 = Stage.query.filter_by(name='Test Stage 2').first()
+    route = RouteTemplate(name=f'Route for {product}', is_default=True)
+    db.session.add(route)
+    db.session.add_all([
+        RouteStage(template=route, stage_id=stage1.id, order=0),
+        RouteStage(template=route, stage_id=stage2.id, order=1),
+    ])
+    db.session.flush()
+    for part_id in part_ids:
+        db.session.add(Part(part_id=part_id, product_designation=product, route_template_id=route.id))
+    db.session.commit()
+    invalidate_reference_data()
+    return route
+
+
+def test_product_progress_is_maintained_incrementally(app, client, database):
+    """Проверяет, что подтверждение и отмена этапа обновляют сводную таблицу."""
+    from app.models.models import ProductProgress, StatusHistory
+    from app.progress import rebuild_all
+    with app.test_request_context():
+        _create_route_with_parts('Изделие П', ['P-1', 'P-2'])
+        rebuild_all()
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+
+        client.post(url_for('main.confirm_stage', part_id='P-1', stage_name='Test Stage 1'))
+        progress = database.session.get(ProductProgress, 'Изделие П')
+        assert (progress.total_parts, progress.completed_stages, progress.possible_stages) == (2, 1, 4)
+
+        user = User.query.filter_by(username='admin').first()
+        user.can_edit_parts = True
+        user.can_delete_parts = True
+        database.session.commit()
+        history_entry = StatusHistory.query.filter_by(part_id='P-1').first()
+        client.post(url_for('admin.cancel_stage', history_id=history_entry.id))
+        client.post(url_for('admin.delete_part', part_id='P-2'))
+        progress = database.session.get(ProductProgress, 'Изделие П')
+        assert (progress.total_parts, progress.completed_stages, progress.possible_stages) == (1, 0, 2)
+
+        response = client.get(url_for('main.dashboard'))
+    assert 'Изделие П' in response.get_data(as_text=True)
+
+
+def test_rebuild_progress_matches_incremental_state(app, client, database):
+    """Проверяет, что полная перестройка дает тот же результат, что и инкрементальные изменения."""
+    from app.models.models import ProductProgress
+    from app.progress import rebuild_all
+    with app.test_request_context():
+        _create_route_with_parts('Изделие Р', ['R-1'])
+        rebuild_all()
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        client.post(url_for('main.confirm_stage', part_id='R-1', stage_name='Test Stage 2'))
+        incremental = [(p.product_designation, p.total_parts, p.completed_stages, p.possible_stages)
+                       for p in ProductProgress.query.all()]
+        rebuild_all()
+        rebuilt = [(p.product_designation, p.total_parts, p.completed_stages, p.possible_stages)
+                   for p in ProductProgress.query.all()]
+    assert incremental == rebuilt == [('Изделие Р', 1, 1, 2)]
+
+
+
+def test_seeded_database_shows_products_on_dashboard(tmp_path, monkeypatch):
+    """Проверяет установку с нуля: миграции, затем database_setup.py - изделия видны на панели и в поиске."""
+    import flask_migrate
+    from app import create_app
+    from app.jobs import job_runner
+    from app.models.models import ProductProgress
+    from config import TestingConfig
+    from database_setup import seed_data
+
+    class SeededConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'seeded.db'}"
+
+    # Очередь заданий импорта - общий объект модуля: после теста он возвращается к приложению модуля
+    monkeypatch.setattr(job_runner, 'app', job_runner.app)
+    seeded_app = create_app(SeededConfig)
+    with seeded_app.app_context():
+        flask_migrate.upgrade()
+    seed_data(seeded_app)
+    with seeded_app.app_context():
+        assert ProductProgress.query.count() == 4
+    client = seeded_app.test_client()
+    assert 'Трактор ДТ-75' in client.get('/').get_data(as_text=True)
+    products = client.get('/api/search', query_string={'q': 'трактор'}).get_json()['products']
+    assert [product['product_designation'] for product in products] == ['Трактор ДТ-75']
+
+# === 6. Тесты API деталей изделия ===
+
+def test_api_parts_uses_fixed_number_of_queries(app, client, database, query_counter):
+    """Проверяет, что число запросов к БД не зависит от количества деталей (нет N+1)."""
+    from app.scanning import confirm_part_stage
+    with app.test_request_context():
+        _create_route_with_parts('Малое изделие', ['S-1', 'S-2'])
+        _create_route_with_parts('Большое изделие', [f'B-{i:03d}' for i in range(40)])
+        confirm_part_stage('B-001', 'Test Stage 1', 'op')
+
+        # Отдельный клиент без сессии, чтобы загрузка пользователя не влияла на подсчет
+        guest = app.test_client()
+        with query_counter() as small_queries:
+            small = guest.get(url_for('main.api_parts_for_product', product_designation='Малое изделие'))
+        with query_counter() as big_queries:
+            big = guest.get(url_for('main.api_parts_for_product', product_designation='Большое изделие'))
+
+    assert len(small_queries) == len(big_queries) <= 2
+    parts = {p['part_id']: p for p in big.get_json()['parts']}
+    assert len(parts) == 40
+    assert parts['B-001']['completed_stages'] == 1
+    assert parts['B-001']['total_stages'] == 2
+    assert small.get_json()['parts'][0]['completed_stages'] == 0
+
+
+def test_api_parts_keyset_pagination_and_ndjson(app, client, database):
+    """Проверяет постраничную выдачу деталей по курсору и потоковый формат NDJSON."""
+    import json
+    with app.test_request_context():
+        _create_route_with_parts('Изделие К', [f'K-{i:02d}' for i in range(5)])
+        url = url_for('main.api_parts_for_product', product_designation='Изделие К')
+
+        first = client.get(url, query_string={'limit': 2}).get_json()
+        second = client.get(url, query_string={'limit': 2, 'after': first['next_after']}).get_json()
+        last = client.get(url, query_string={'limit': 2, 'after': second['next_after']}).get_json()
+        stream = client.get(url, query_string={'format': 'ndjson', 'after': 'K-01'})
+        # Потоковый ответ читаем внутри контекста: он формируется лениво
+        stream_body = stream.get_data(as_text=True)
+
+    assert [p['part_id'] for p in first['parts']] == ['K-00', 'K-01']
+    assert [p['part_id'] for p in second['parts']] == ['K-02', 'K-03']
+    assert [p['part_id'] for p in last['parts']] == ['K-04']
+    assert last['next_after'] is None
+    assert stream.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in stream_body.splitlines()]
+    assert [p['part_id'] for p in lines] == ['K-02', 'K-03', 'K-04']
+
+
+# === 7. Тесты массового импорта ===
+
+def test_upload_excel_bulk_import_skips_duplicates(app, client, database, tmp_path):
+    """Проверяет пакетный импорт: новые детали добавляются, дубликаты и пустые строки пропускаются."""
+    import io
+    import pandas as pd
+    from app.models.models import AuditLog, ProductProgress
+    with app.test_request_context():
+        _create_route_with_parts('Изделие И', ['I-EXISTING'])
+        user = User.query.filter_by(username='admin').first()
+        user.can_add_parts = True
+        database.session.commit()
+
+        buffer = io.BytesIO()
+        pd.DataFrame({
+            'Артикул': ['I-1', ' I-2 ', 'I-EXISTING', 'I-1', None, 'I-3'],
+            'Номенклатура': ['Изделие И', 'Изделие И', 'Изделие И', 'Изделие И', 'Изделие И', 'Другое'],
+            'Лишняя колонка': range(6),
+        }).to_excel(buffer, index=False)
+        buffer.seek(0)
+
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        response = client.post(url_for('admin.upload_excel'),
+                               data={'file': (buffer, 'import.xlsx')},
+                               content_type='multipart/form-data')
+        assert response.status_code == 302
+        job_url = response.headers['Location']
+
+        # В тестах задания выполняются синхронно, поэтому статус уже итоговый
+        job = client.get(job_url, query_string={'format': 'json'}).get_json()
+        assert job['status'] == 'done'
+        assert (job['rows_read'], job['added'], job['skipped'], job['errors']) == (6, 3, 2, 1)
+        assert 'Задание импорта' in client.get(job_url).get_data(as_text=True)
+        assert database.session.get(Part, 'I-2').product_designation == 'Изделие И'
+        assert AuditLog.query.filter_by(part_id='I-3', action='Создание').count() == 1
+        assert database.session.get(ProductProgress, 'Другое').total_parts == 1
+
+
+def test_streaming_readers_yield_bounded_chunks(app, tmp_path):
+    """Проверяет, что .xlsx и .csv читаются порциями заданного размера."""
+    import pandas as pd
+    from app.importer import read_import_frames, normalize_frame
+    source = pd.DataFrame({'Номенклатура': ['Изделие'] * 7, 'Артикул': [f'C-{i}' for i in range(7)]})
+    xlsx_path, csv_path = tmp_path / 'parts.xlsx', tmp_path / 'parts.csv'
+    source.to_excel(xlsx_path, index=False)
+    source.to_csv(csv_path, index=False, sep=';', encoding='utf-8-sig')
+
+    for path in (xlsx_path, csv_path):
+        frames = list(read_import_frames(str(path), chunk_size=3))
+        assert [len(frame) for frame in frames] == [3, 3, 1]
+        assert list(pd.concat([normalize_frame(f) for f in frames])['part_id']) == list(source['Артикул'])
+
+
+def test_upload_csv_is_imported(app, client, database):
+    """Проверяет импорт деталей из CSV-файла через админ-панель."""
+    import io
+    with app.test_request_context():
+        _create_route_with_parts('Изделие CSV', [])
+        user = User.query.filter_by(username='admin').first()
+        user.can_add_parts = True
+        database.session.commit()
+
+        data = 'Артикул,Номенклатура\nCSV-1,Изделие CSV\nCSV-2,Изделие CSV\n'.encode('utf-8')
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        response = client.post(url_for('admin.upload_excel'),
+                               data={'file': (io.BytesIO(data), 'parts.csv')},
+                               content_type='multipart/form-data')
+        job = client.get(response.headers['Location'], query_string={'format': 'json'}).get_json()
+    assert (job['status'], job['added']) == ('done', 2)
+
+
+
+def test_job_runner_recovers_jobs_after_restart(app, database, tmp_path, monkeypatch):
+    """
+    Проверяет восстановление заданий импорта, оставшихся от прошлого запуска
+    процесса; задания и файлы, появившиеся после запуска, не трогаются.
+    """
+    import os
+    import time
+    from datetime import datetime, timedelta
+    from app.models.models import ImportJob
+    from app.jobs import job_runner
+    monkeypatch.setitem(app.config, 'UPLOAD_FOLDER', str(tmp_path))
+    before_boot = datetime.utcnow() - timedelta(hours=1)
+    with app.app_context():
+        route = _create_route_with_parts('Изделие RJ', [])
+        user = User.query.filter_by(username='admin').first()
+        files = {name: tmp_path / f'{name}.csv' for name in ('queued', 'running', 'stray', 'live', 'uploading')}
+        for index, path in enumerate(files.values()):
+            path.write_text(f'Артикул,Номенклатура\nRJ-{index},Изделие RJ\n', encoding='utf-8')
+        for name in ('queued', 'running', 'stray', 'live'):
+            os.utime(files[name], (time.time() - 3600, time.time() - 3600))
+        jobs = {
+            'queued': ImportJob(filename='queued.csv', filepath=str(files['queued']), user_id=user.id,
+                                route_template_id=route.id, created_at=before_boot),
+            'running': ImportJob(filename='running.csv', filepath=str(files['running']), user_id=user.id,
+                                 route_template_id=route.id, status='running', created_at=before_boot,
+                                 started_at=before_boot),
+            # Задание, которое уже после запуска взял другой работающий процесс
+            'live': ImportJob(filename='live.csv', filepath=str(files['live']), user_id=user.id,
+                              route_template_id=route.id, status='running', created_at=before_boot,
+                              started_at=datetime.utcnow() + timedelta(seconds=1)),
+        }
+        database.session.add_all(jobs.values())
+        database.session.commit()
+        job_ids = {name: job.id for name, job in jobs.items()}
+
+    monkeypatch.setattr(job_runner, 'booted_at', datetime.utcnow())
+    monkeypatch.setattr(job_runner, 'booted_at_epoch', time.time() - 60)
+    assert job_runner.recover() == (1, 1)
+    with app.app_context():
+        assert database.session.get(ImportJob, job_ids['queued']).status == 'done'
+        assert database.session.get(Part, 'RJ-0') is not None
+        interrupted = database.session.get(ImportJob, job_ids['running'])
+        assert interrupted.status == 'failed' and interrupted.finished_at is not None
+        assert database.session.get(Part, 'RJ-1') is None
+        assert database.session.get(ImportJob, job_ids['live']).status == 'running'
+    # Файл загрузки, еще не записанный в задание, и файл живого задания остаются
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['live.csv', 'uploading.csv']
+
+
+# === 8. Тесты пакетной генерации QR-кодов ===
+
+def test_generate_qr_batch_zip_and_pdf(app, client, database):
+    """Проверяет выгрузку QR-кодов изделия в ZIP-архив и PDF с наклейками."""
+    import io
+    import zipfile
+    with app.test_request_context():
+        _create_route_with_parts('Изделие QR', ['Q-1', 'Q-2', 'Q/3'])
+        user = User.query.filter_by(username='admin').first()
+        user.can_generate_qr = True
+        database.session.commit()
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+
+        zip_response = client.post(url_for('admin.generate_qr_batch'),
+                                   data={'product': 'Изделие QR', 'output_format': 'zip'})
+        zip_body = zip_response.get_data()
+        pdf_response = client.post(url_for('admin.generate_qr_batch'),
+                                   data={'part_ids': 'Q-1\nQ-2\nQ-1\n', 'output_format': 'pdf'})
+        pdf_body = pdf_response.get_data()
+
+    assert zip_response.mimetype == 'application/zip'
+    with zipfile.ZipFile(io.BytesIO(zip_body)) as archive:
+        assert sorted(archive.namelist()) == ['part_Q-1_qr.png', 'part_Q-2_qr.png', 'part_Q_3_qr.png']
+        assert archive.read('part_Q-1_qr.png').startswith(b'\x89PNG')
+    assert pdf_response.mimetype == 'application/pdf'
+    assert pdf_body.startswith(b'%PDF-1.4') and pdf_body.rstrip().endswith(b'%%EOF')
+    assert b'/Count 1' in pdf_body
+
+
+def test_single_qr_is_cached_and_served_with_etag(app, client, database, tmp_path, monkeypatch):
+    """Проверяет дисковый кэш QR-кодов, ответ 304 по ETag и сброс кэша при смене адреса сервера."""
+    monkeypatch.setitem(app.config, 'QR_FOLDER', str(tmp_path))
+    monkeypatch.setenv('SERVER_PUBLIC_IP', '10.0.0.1')
+    with app.test_request_context():
+        user = User.query.filter_by(username='admin').first()
+        user.can_generate_qr = True
+        database.session.commit()
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        url = url_for('admin.generate_single_qr', part_id='ETAG-1')
+
+        first = client.get(url)
+        etag = first.headers['ETag']
+        cached_files = list(tmp_path.glob('*.png'))
+        cached_bytes = cached_files[0].read_bytes() if cached_files else None
+        repeat = client.get(url, headers={'If-None-Match': etag})
+
+        monkeypatch.setenv('SERVER_PUBLIC_IP', '10.0.0.2')
+        after_host_change = client.get(url, headers={'If-None-Match': etag})
+
+    assert first.status_code == 200 and first.data.startswith(b'\x89PNG')
+    assert len(cached_files) == 1 and cached_bytes == first.data
+    assert repeat.status_code == 304
+    assert after_host_change.status_code == 200
+    assert after_host_change.headers['ETag'] != etag
+    # Изображения для прежнего адреса удалены из кэша
+    assert not cached_files[0].exists()
+    assert len(list(tmp_path.glob('*.png'))) == 1
+
+
+def test_qr_cache_evicts_least_recently_used(app, tmp_path, monkeypatch):
+    """Проверяет, что при превышении лимита удаляются давно не использованные изображения."""
+    import os
+    from app.qr_cache import QrCache
+    monkeypatch.setitem(app.config, 'QR_FOLDER', str(tmp_path))
+    cache = QrCache(app)
+    with app.app_context():
+        first, first_key = cache.get_png('LRU-1')
+        monkeypatch.setitem(app.config, 'QR_CACHE_MAX_BYTES', len(first) + 10)
+        os.utime(tmp_path / f'{first_key}.png', (1, 1))
+        _, second_key = cache.get_png('LRU-2')
+    assert not (tmp_path / f'{first_key}.png').exists()
+    assert (tmp_path / f'{second_key}.png').exists()
+
+
+
+def test_qr_process_pool_uses_spawn_and_matches_in_process_render(monkeypatch):
+    """Проверяет, что пул генерации QR-кодов запускает процессы через spawn, а результат совпадает."""
+    from app import qr_batch
+    monkeypatch.setattr(qr_batch, '_executor', None)
+    urls = [f'http://localhost/scan/SP-{i}' for i in range(3)]
+    try:
+        assert list(qr_batch.iter_qr_pngs(urls, workers=1)) == list(qr_batch.iter_qr_pngs(urls, workers=0))
+        assert qr_batch._executor._mp_context.get_start_method() == 'spawn'
+    finally:
+        qr_batch._executor.shutdown()
+
+# === 9. Тесты инструментов замеров производительности ===
+
+def test_http_benchmark_suite_smoke(tmp_path):
+    """Проверяет, что HTTP-бенчмарк отрабатывает на малом наборе данных и дает полный отчет."""
+    from benchmarks.run_suite import run_benchmarks
+    report = run_benchmarks(str(tmp_path / 'bench.db'), products=4, parts=20, history=3, audit=2, requests=3)
+    assert report['dataset']['parts'] == 80
+    assert {'dashboard', 'parts_api', 'history', 'scan', 'confirm_stage', 'audit_log'} <= set(report['routes'])
+    for stats in report['routes'].values():
+        assert stats['p50_ms'] <= stats['p95_ms'] <= stats['max_ms']
+        assert all(code < 400 for code in stats['status_codes'])
+
+
+# === 10. Тесты инструментирования запросов ===
+
+def test_request_profiler_reports_server_timing_and_budget(app, client, database, monkeypatch):
+    """Проверяет заголовок Server-Timing, учет превышения бюджета запросов и страницу метрик."""
+    from app.profiling import request_profiler
+    request_profiler.reset()
+    monkeypatch.setitem(app.config, 'QUERY_BUDGETS', {'main.dashboard': 0})
+    with app.test_request_context():
+        response = app.test_client().get(url_for('main.dashboard'))
+        user = User.query.filter_by(username='admin').first()
+        user.can_manage_users = True
+        database.session.commit()
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        metrics_page = client.get(url_for('admin.performance_metrics')).get_data(as_text=True)
+
+    timing = response.headers['Server-Timing']
+    assert 'db;dur=' in timing and 'render;dur=' in timing and 'total;dur=' in timing
+    stats = {row['endpoint']: row for row in request_profiler.snapshot()}
+    assert stats['main.dashboard']['queries_max'] >= 1
+    assert stats['main.dashboard']['over_budget'] == 1
+    assert stats['main.dashboard']['slowest_statement'].startswith('SELECT')
+    assert 'main.dashboard' in metrics_page and 'metrics-over-budget' in metrics_page
+
+
+def test_prometheus_metrics_endpoint(app, client, database):
+    """Проверяет счетчики запросов, гистограмму длительности и подтверждения в /metrics."""
+    from app.metrics import metrics
+    with app.test_request_context():
+        _create_route_with_parts('Изделие M', ['M-1'])
+        guest = app.test_client()
+        guest.get(url_for('main.dashboard'))
+        confirmations_before = metrics.confirmations_window.total()
+        guest.post(url_for('main.confirm_stage', part_id='M-1', stage_name='Test Stage 1'))
+        response = guest.get('/metrics')
+    body = response.get_data(as_text=True)
+
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    assert 'tracker_http_requests_total{endpoint="main.dashboard",method="GET",status="200"}' in body
+    assert 'tracker_http_request_duration_seconds_bucket{endpoint="main.dashboard",le="+Inf"}' in body
+    assert '# TYPE tracker_stage_confirmations_total counter' in body
+    assert metrics.confirmations_window.total() == confirmations_before + 1
+
+
+def test_prometheus_metrics_token(app, database, monkeypatch):
+    """Проверяет, что при заданном METRICS_TOKEN эндпоинт требует авторизацию."""
+    monkeypatch.setitem(app.config, 'METRICS_TOKEN', 'secret')
+    guest = app.test_client()
+    assert guest.get('/metrics').status_code == 401
+    assert guest.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+# === 11. Тесты API сканирования ===
+
+def test_scan_api_and_fast_confirm(app, client, database, query_counter):
+    """Проверяет JSON API сканирования и подтверждение этапа условной вставкой."""
+    from app.models.models import StatusHistory, ProductProgress
+    with app.test_request_context():
+        _create_route_with_parts('Изделие S', ['S-1'])
+        guest = app.test_client()
+        guest.get(url_for('main.api_scan', part_id='S-1'))  # прогрев кэша маршрутов
+        with query_counter() as statements:
+            scan = guest.get(url_for('main.api_scan', part_id='S-1')).get_json()
+        confirmed = guest.post(url_for('main.api_confirm_stage', part_id='S-1'),
+                               json={'stage': 'Test Stage 2', 'operator': 'Иванов'})
+        duplicate = guest.post(url_for('main.api_confirm_stage', part_id='S-1'),
+                               json={'stage': 'Test Stage 2', 'operator': 'Петров'})
+        unknown_stage = guest.post(url_for('main.api_confirm_stage', part_id='S-1'), json={'stage': 'Нет такого'})
+        missing_part = guest.post(url_for('main.api_confirm_stage', part_id='NOPE'), json={'stage': 'Test Stage 1'})
+        rescan = guest.get(url_for('main.api_scan', part_id='S-1')).get_json()
+
+        history = StatusHistory.query.filter_by(part_id='S-1').all()
+        part = database.session.get(Part, 'S-1')
+        progress = database.session.get(ProductProgress, 'Изделие S')
+
+    assert len(statements) == 1
+    assert scan['available_stages'] == ['Test Stage 1', 'Test Stage 2']
+    assert confirmed.status_code == 201
+    assert duplicate.status_code == 409 and duplicate.get_json()['code'] == 'already_completed'
+    assert unknown_stage.status_code == 409 and unknown_stage.get_json()['code'] == 'stage_not_in_route'
+    assert missing_part.status_code == 404
+    assert rescan['available_stages'] == ['Test Stage 1']
+    assert [(h.status, h.operator_name) for h in history] == [('Test Stage 2', 'Иванов')]
+    assert part.current_status == 'Test Stage 2'
+    assert progress.completed_stages == 1
+
+
+def test_scan_batch_confirms_valid_events(app, client, database, query_counter):
+    """Проверяет пакетное подтверждение: результаты по событиям, одна транзакция, статусы деталей."""
+    from app.models.models import StatusHistory, ProductProgress
+    with app.test_request_context():
+        _create_route_with_parts('Изделие B', ['B-1', 'B-2'])
+        events = [
+            {'part_id': 'B-1', 'stage': 'Test Stage 2', 'operator': 'Иванов', 'client_timestamp': '2024-05-01T08:00:00'},
+            {'part_id': 'B-1', 'stage': 'Test Stage 1', 'operator': 'Иванов', 'client_timestamp': '2024-05-01T07:00:00'},
+            {'part_id': 'B-1', 'stage': 'Test Stage 2', 'operator': 'Петров'},
+            {'part_id': 'B-2', 'stage': 'Test Stage 1', 'client_timestamp': '2024-05-01T09:00:00+03:00'},
+            {'part_id': 'B-2', 'stage': 'Нет такого'},
+            {'part_id': 'NOPE', 'stage': 'Test Stage 1'},
+            {'part_id': 'B-2', 'stage': 'Test Stage 2', 'client_timestamp': 'вчера'},
+            'не событие',
+        ]
+        with query_counter() as statements:
+            response = app.test_client().post(url_for('main.api_confirm_stages_batch'), json={'events': events})
+        body = response.get_json()
+        part1 = database.session.get(Part, 'B-1')
+        part2 = database.session.get(Part, 'B-2')
+        history_count = StatusHistory.query.count()
+        progress = database.session.get(ProductProgress, 'Изделие B')
+
+    assert [result['code'] for result in body['results']] == [
+        'confirmed', 'confirmed', 'already_completed', 'confirmed',
+        'stage_not_in_route', 'part_not_found', 'bad_timestamp', 'invalid_event']
+    assert body['confirmed'] == 3 and body['rejected'] == 5
+    assert history_count == 3 and progress.completed_stages == 3
+    # Статус детали - по самому позднему событию, а не по порядку в пакете
+    assert part1.current_status == 'Test Stage 2'
+    assert part2.current_status == 'Test Stage 1'
+    assert str(part2.last_update) == '2024-05-01 06:00:00'
+    # Запросы не зависят от числа событий: проверка, вставка, обновление, прогресс
+    assert len([s for s in statements if s.startswith('INSERT INTO "StatusHistory"')]) == 1
+
+
+def test_scan_batch_is_not_raced_by_single_confirm(tmp_path, monkeypatch):
+    """
+    Проверяет, что одиночное подтверждение, пришедшее между чтением масок
+    пакетом и его записью, не создает дубликат этапа (файловая база, два соединения).
+    """
+    import threading
+    import app.scanning as scanning
+    from app import create_app, db
+    from app.models.models import StatusHistory
+    from app.scanning import confirm_part_stage, confirm_stages_batch, ALREADY_COMPLETED
+    from app.reference_cache import invalidate_reference_data
+    from config import TestingConfig
+
+    class FileConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'race.db'}"
+
+    race_app = create_app(FileConfig)
+    with race_app.app_context():
+        db.create_all()
+        db.session.add_all([Stage(name='Test Stage 1'), Stage(name='Test Stage 2')])
+        db.session.commit()
+        invalidate_reference_data()
+        _create_route_with_parts('Изделие R', ['R-1'])
+
+    single = {}
+
+    def confirm_concurrently():
+        with race_app.app_context():
+            single['code'] = confirm_part_stage('R-1', 'Test Stage 1', 'Петров')
+
+    real_route_cache = scanning.route_cache
+
+    class RouteCacheWithRace:
+        # Маршруты запрашиваются пакетом сразу после чтения масок деталей
+        started = False
+
+        def all(self, **kwargs):
+            if not self.started:
+                self.started = True
+                single['thread'] = threading.Thread(target=confirm_concurrently)
+                single['thread'].start()
+                single['thread'].join(timeout=0.5)
+            return real_route_cache.all(**kwargs)
+
+        def __getattr__(self, name):
+            return getattr(real_route_cache, name)
+
+    monkeypatch.setattr(scanning, 'route_cache', RouteCacheWithRace())
+    with race_app.app_context():
+        (result,) = confirm_stages_batch([{'part_id': 'R-1', 'stage': 'Test Stage 1'}], 'Иванов')
+        single['thread'].join()
+        history = StatusHistory.query.filter_by(part_id='R-1').all()
+        part = db.session.get(Part, 'R-1')
+        assert len(history) == 1 and part.completed_count == 1
+        assert sorted([result['code'], single['code']]) == sorted(['confirmed', ALREADY_COMPLETED])
+        db.session.remove()
+        db.engine.dispose()
+
+
+# === 12. Тесты кэша маршрутов ===
+
+def test_route_cache_is_invalidated_by_route_edit(app, client, database, query_counter):
+    """Проверяет, что кэш маршрутов не обращается к базе повторно и сбрасывается при изменении маршрута."""
+    from app.route_cache import route_cache
+    with app.test_request_context():
+        route = _create_route_with_parts('Изделие RC', ['RC-1'])
+        stage1 = Stage.query.filter_by(name='Test Stage 1').first()
+        assert route_cache.get(route.id).stages == ('Test Stage 1', 'Test Stage 2')
+        with query_counter() as statements:
+            compiled = route_cache.get(route.id)
+        assert statements == []
+        assert compiled.positions == {'Test Stage 1': 0, 'Test Stage 2': 1} and compiled.stage_count == 2
+
+        version = route_cache.version
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        client.post(url_for('admin.edit_route', route_id=route.id),
+                    data={'name': 'Укороченный маршрут', 'stages': [stage1.id]})
+        assert route_cache.version > version
+        assert route_cache.get(route.id).stages == ('Test Stage 1',)
+
+
+def test_route_cache_follows_shared_version_stamp(app, database, monkeypatch):
+    """Проверяет межпроцессный сброс: другой процесс увеличил версию в таблице CacheVersions."""
+    from app.route_cache import route_cache, bump_db_version
+    monkeypatch.setitem(app.config, 'ROUTE_CACHE_SHARED', True)
+    monkeypatch.setitem(app.config, 'ROUTE_CACHE_CHECK_INTERVAL', 0)
+    with app.test_request_context():
+        route = _create_route_with_parts('Изделие RS', ['RS-1'])
+        assert route_cache.get(route.id).name == 'Route for Изделие RS'
+        # Изменение "из другого процесса": данные и версия меняются без вызова invalidate()
+        route.name = 'Переименован'
+        bump_db_version(route_cache.VERSION_NAME)
+        database.session.commit()
+        assert route_cache.get(route.id).name == 'Переименован'
+
+
+def test_confirm_checks_shared_route_version_before_writing_mask(app, database, monkeypatch):
+    """Проверяет, что при ROUTE_CACHE_SHARED подтверждение не пишет бит по устаревшим позициям этапов."""
+    from app.route_cache import route_cache, bump_db_version
+    from app.scanning import confirm_part_stage, confirm_stages_batch, CONFIRMED
+    monkeypatch.setitem(app.config, 'ROUTE_CACHE_SHARED', True)
+    monkeypatch.setitem(app.config, 'ROUTE_CACHE_CHECK_INTERVAL', 3600)
+    with app.test_request_context():
+        route = _create_route_with_parts('Изделие RV', ['RV-1', 'RV-2'])
+        assert route_cache.get(route.id).positions['Test Stage 1'] == 0
+        # Другой процесс меняет этапы местами; интервал сверки еще не истек
+        for route_stage in RouteStage.query.filter_by(template_id=route.id):
+            route_stage.order = 1 - route_stage.order
+        bump_db_version(route_cache.VERSION_NAME)
+        database.session.commit()
+
+        assert confirm_part_stage('RV-1', 'Test Stage 1', 'Иванов') == CONFIRMED
+        results = confirm_stages_batch([{'part_id': 'RV-2', 'stage': 'Test Stage 1'}], 'Терминал')
+        assert results[0]['code'] == CONFIRMED
+        database.session.expire_all()
+        assert database.session.get(Part, 'RV-1').completed_mask == 0b10
+        assert database.session.get(Part, 'RV-2').completed_mask == 0b10
+
+
+def test_confirm_sees_route_edit_before_local_cache_reset(app, database):
+    """
+    Проверяет один процесс: маршрут изменен и зафиксирован, локальный кэш еще
+    не сброшен - подтверждение берет новые позиции этапов.
+    """
+    from app.route_cache import route_cache
+    from app.scanning import confirm_part_stage, CONFIRMED
+    assert not app.config['ROUTE_CACHE_SHARED']
+    with app.test_request_context():
+        route = _create_route_with_parts('Изделие RW', ['RW-1'])
+        assert route_cache.get(route.id).positions['Test Stage 1'] == 0
+        # Так edit_route меняет этапы: версия в базе растет в той же транзакции
+        for route_stage in RouteStage.query.filter_by(template_id=route.id):
+            route_stage.order = 1 - route_stage.order
+        route_cache.stamp()
+        database.session.commit()
+
+        assert confirm_part_stage('RW-1', 'Test Stage 1', 'Иванов') == CONFIRMED
+        database.session.expire_all()
+        assert database.session.get(Part, 'RW-1').completed_mask == 0b10
+
+
+def test_reference_cache_serves_forms_and_is_invalidated(app, client, database, query_counter):
+    """Проверяет кэш справочников: формы без запросов к базе, сброс при добавлении этапа."""
+    from app.reference_cache import reference_cache
+    from app.admin.forms import PartForm, RouteTemplateForm
+    with app.test_request_context():
+        route = _create_route_with_parts('Изделие RF', [])
+        reference_cache.stages()  # прогрев
+        with query_counter() as statements:
+            choices = RouteTemplateForm().stages.choices
+            part_form = PartForm()
+            route_choices = [label for _, label, *_ in part_form.route_template.iter_choices()]
+        assert statements == []
+        assert [name for _, name in choices] == ['Test Stage 1', 'Test Stage 2']
+        assert route_choices == [route.name]
+
+        user = User.query.filter_by(username='admin').first()
+        user.can_add_parts = True
+        database.session.commit()
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        client.post(url_for('admin.add_stage'), data={'name': 'Новый этап'})
+        client.post(url_for('admin.add_single_part'),
+                    data={'product': 'Изделие RF', 'part_id': 'RF-1', 'route_template': str(route.id)})
+        stage_names = [stage.name for stage in reference_cache.stages()]
+        part = database.session.get(Part, 'RF-1')
+
+    assert 'Новый этап' in stage_names
+    assert part is not None and part.route_template_id == route.id
+
+
+# === 13. Тесты денормализованного прогресса детали ===
+
+def test_part_completed_counters_follow_confirm_cancel_and_route_edit(app, client, database):
+    """Проверяет, что completed_count/completed_mask поддерживаются при подтверждении, отмене и изменении маршрута."""
+    from app.models.models import StatusHistory
+    from app.scanning import confirm_part_stage, confirm_stages_batch, CONFIRMED, ALREADY_COMPLETED
+    with app.test_request_context():
+        route = _create_route_with_parts('Изделие DC', ['DC-1', 'DC-2'])
+        stage1 = Stage.query.filter_by(name='Test Stage 1').first()
+        stage2 = Stage.query.filter_by(name='Test Stage 2').first()
+
+        assert confirm_part_stage('DC-1', 'Test Stage 2', 'Иванов') == CONFIRMED
+        assert confirm_part_stage('DC-1', 'Test Stage 2', 'Петров') == ALREADY_COMPLETED
+        results = confirm_stages_batch([{'part_id': 'DC-2', 'stage': 'Test Stage 1'},
+                                        {'part_id': 'DC-2', 'stage': 'Test Stage 2'},
+                                        {'part_id': 'DC-2', 'stage': 'Test Stage 1'}], 'Терминал')
+        assert [result['code'] for result in results] == [CONFIRMED, CONFIRMED, ALREADY_COMPLETED]
+        database.session.expire_all()
+        part1, part2 = database.session.get(Part, 'DC-1'), database.session.get(Part, 'DC-2')
+        assert (part1.completed_count, part1.completed_mask) == (1, 0b10)
+        assert (part2.completed_count, part2.completed_mask) == (2, 0b11)
+
+        user = User.query.filter_by(username='admin').first()
+        user.can_edit_parts = True
+        database.session.commit()
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        history_entry = StatusHistory.query.filter_by(part_id='DC-2', status='Test Stage 1').first()
+        client.post(url_for('admin.cancel_stage', history_id=history_entry.id))
+        database.session.expire_all()
+        part2 = database.session.get(Part, 'DC-2')
+        assert (part2.completed_count, part2.completed_mask) == (1, 0b10)
+
+        # Этапы меняются местами - биты пересчитываются по новым позициям
+        client.post(url_for('admin.edit_route', route_id=route.id),
+                    data={'name': 'Обратный маршрут', 'stages': [stage2.id, stage1.id]})
+        database.session.expire_all()
+        assert database.session.get(Part, 'DC-1').completed_mask == 0b01
+        assert database.session.get(Part, 'DC-2').completed_mask == 0b01
+
+
+def test_route_edit_and_mask_recompute_share_one_transaction(app, client, database, monkeypatch):
+    """Проверяет, что сбой пересчета масок откатывает и изменение маршрута."""
+    import pytest
+    from app.admin import routes as admin_routes
+    with app.test_request_context():
+        route = _create_route_with_parts('Изделие ET', ['ET-1'])
+        stage1 = Stage.query.filter_by(name='Test Stage 1').first()
+
+        def failing_recompute(*args, **kwargs):
+            raise RuntimeError('сбой пересчета')
+        monkeypatch.setattr(admin_routes, 'recompute_parts', failing_recompute)
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        with pytest.raises(RuntimeError):
+            client.post(url_for('admin.edit_route', route_id=route.id),
+                        data={'name': 'Не сохранится', 'stages': [stage1.id]})
+        # Запрос идет в контексте теста: откат, который сделал бы teardown сессии
+        database.session.rollback()
+        assert database.session.get(RouteTemplate, route.id).name == 'Route for Изделие ET'
+        assert RouteStage.query.filter_by(template_id=route.id).count() == 2
+
+
+def test_verify_part_progress_detects_and_repairs_drift(app, database):
+    """Проверяет команду сверки счетчиков деталей с историей."""
+    from app.scanning import confirm_part_stage
+    with app.test_request_context():
+        _create_route_with_parts('Изделие VP', ['VP-1', 'VP-2'])
+        confirm_part_stage('VP-1', 'Test Stage 1', 'Иванов')
+        part = database.session.get(Part, 'VP-2')
+        part.completed_count, part.completed_mask = 5, 0b11
+        database.session.commit()
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['verify-part-progress'])
+    assert 'VP-2' in result.output and 'VP-1' not in result.output
+    result = runner.invoke(args=['verify-part-progress', '--repair'])
+    assert 'Исправлено деталей: 1.' in result.output
+    with app.app_context():
+        part = database.session.get(Part, 'VP-2')
+        assert (part.completed_count, part.completed_mask) == (0, 0)
+
+
+
+def test_route_longer_than_completed_mask_is_rejected(app, client, database):
+    """Проверяет, что маршрут длиннее маски пройденных этапов (63 бита) не создается."""
+    from app.progress import MAX_ROUTE_STAGES
+    from app.reference_cache import invalidate_reference_data
+    with app.test_request_context():
+        database.session.add_all([Stage(name=f'Длинный этап {index}') for index in range(MAX_ROUTE_STAGES + 1)])
+        database.session.commit()
+        invalidate_reference_data()
+        stage_ids = [stage.id for stage in Stage.query.filter(Stage.name.like('Длинный этап %'))]
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        response = client.post(url_for('admin.add_route'), data={'name': 'Слишком длинный', 'stages': stage_ids},
+                               follow_redirects=True)
+        assert f'не больше {MAX_ROUTE_STAGES} этапов' in response.get_data(as_text=True)
+        assert RouteTemplate.query.filter_by(name='Слишком длинный').first() is None
+
+        response = client.post(url_for('admin.add_route'),
+                               data={'name': 'Самый длинный', 'stages': stage_ids[:MAX_ROUTE_STAGES]})
+        assert response.status_code == 302
+        assert RouteTemplate.query.filter_by(name='Самый длинный').first() is not None
+
+# === 14. Тесты поиска на панели мониторинга ===
+
+def test_search_api_matches_products_and_parts_by_prefix(app, database, query_counter):
+    """Проверяет серверный поиск: транслитерация, префикс слова, номер детали, лимит."""
+    from app.progress import rebuild_all
+    with app.test_request_context():
+        _create_route_with_parts('Вал ЖК-120', ['ВЛ-001', 'ВЛ-002'])
+        _create_route_with_parts('Корпус насоса', ['KN-777'])
+        rebuild_all()
+        guest = app.test_client()
+
+        def found(query, **params):
+            response = guest.get(url_for('main.api_search', q=query, **params))
+            return [(p['product_designation'], p['matched_parts']) for p in response.get_json()['products']]
+
+        assert found('вал') == [('Вал ЖК-120', [])]
+        assert found('val zhk') == [('Вал ЖК-120', [])]
+        assert found('12') == [('Вал ЖК-120', [])]
+        assert found('насос') == [('Корпус насоса', [])]
+        assert found('вл-00') == [('Вал ЖК-120', ['ВЛ-001', 'ВЛ-002'])]
+        assert found('kn 7') == [('Корпус насоса', ['KN-777'])]
+        assert found('нет такого') == []
+        assert found('') == []
+        assert len(found('k', limit=1)) == 1
+        # Наличие индекса FTS5 не проверяется по схеме базы на каждый запрос
+        with query_counter() as statements:
+            found('вал')
+        assert not [statement for statement in statements if 'PRAGMA' in statement or 'sqlite_master' in statement]
+
+
+def test_search_like_fallback_matches_fts(app, database):
+    """Проверяет, что резервный поиск через LIKE дает те же изделия, что и FTS5."""
+    from app.progress import rebuild_all
+    from app.search import _search_fts, _search_like, normalize_query
+    with app.test_request_context():
+        _create_route_with_parts('Вал ЖК-120', ['ВЛ-001'])
+        _create_route_with_parts('Вал_шлицевой', ['W_1'])
+        rebuild_all()
+        for query in ['вал', 'жк', 'вл 001', 'w_1', 'шлиц', '1']:
+            tokens = normalize_query(query)
+            like_names, like_parts = _search_like(tokens, 10)
+            fts_names, fts_parts = _search_fts(tokens, 10)
+            assert like_names == fts_names and sorted(like_parts) == sorted(fts_parts), query
+
+
+def test_dashboard_renders_limited_products(app, database, monkeypatch):
+    """Проверяет, что панель выводит ограниченное число изделий и подсказку о поиске."""
+    from app.main import routes as main_routes
+    from app.progress import rebuild_all
+    monkeypatch.setattr(main_routes, 'DASHBOARD_PRODUCTS_LIMIT', 1)
+    with app.test_request_context():
+        _create_route_with_parts('Изделие А', ['A-1'])
+        _create_route_with_parts('Изделие Б', ['B-1'])
+        rebuild_all()
+        html = app.test_client().get(url_for('main.dashboard')).get_data(as_text=True)
+    assert 'details-for-izdelie_a' in html and 'details-for-izdelie_b' not in html
+    assert 'Показаны первые 1 из 2 изделий' in html
+
+
+def test_autogenerate_ignores_search_index_after_upgrade(tmp_path):
+    """Проверяет, что автогенерация на базе после всех миграций не предлагает операций (в т.ч. над FTS5)."""
+    import flask_migrate
+    from app import create_app
+    from config import TestingConfig
+
+    class MigratedConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'migrated.db'}"
+
+    migrated_app = create_app(MigratedConfig)
+    with migrated_app.app_context():
+        flask_migrate.upgrade()
+        # 'flask db check' завершает процесс с ошибкой, если автогенерация нашла изменения
+        flask_migrate.check()
+
+
+# === 15. Тесты нормализации ключей ===
+
+def test_to_safe_key_matches_reference_implementation():
+    """Проверяет, что ускоренный to_safe_key совпадает с прежней реализацией."""
+    from app.utils import to_safe_key
+    from benchmarks.bench_safe_key import reference_to_safe_key, designation_corpus
+    corpus = designation_corpus(500) + [
+        '', '---', 'Изделие 0001', 'ЁЛКА ёлка', 'Съёмник/Щит*2', 'Вал ЖК-120 (исп. 01)',
+        'АБВГ.301412.005-01', 'Mixed Кириллица и Latin 42', 'Подъём_объём', '  пробелы  по краям  ',
+        'Ўзбек ÄÖÜ ß', 'ЪЬ', 'Emoji ✓ знак №5',
+    ]
+    for text in corpus:
+        assert to_safe_key(text) == reference_to_safe_key(text), text
+    # Повторный вызов берется из кэша и дает тот же результат
+    assert to_safe_key('Вал ЖК-120 (исп. 01)') == 'val_zhk_120_isp_01'
+    assert to_safe_key.cache_info().hits > 0
+
+
+# === 16. Тесты ленты истории детали ===
+
+def test_history_timeline_keyset_pages_and_filters(app, database):
+    """Проверяет, что страницы ленты по курсору покрывают всю историю без пропусков и повторов."""
+    from datetime import datetime, timedelta
+    from app.models.models import StatusHistory, AuditLog
+    from app.timeline import history_page, decode_cursor, STATUS, AUDIT
+    with app.test_request_context():
+        _create_route_with_parts('Изделие H', ['H-1'])
+        admin = User.query.filter_by(username='admin').first()
+        start = datetime(2024, 5, 1, 8, 0)
+        for i in range(7):
+            # Часть записей с одинаковым временем - порядок внутри них задают тип и id
+            moment = start + timedelta(hours=i // 2)
+            database.session.add(StatusHistory(part_id='H-1', status=f'Этап {i}', operator_name='Иванов' if i % 2 else 'Петров',
+                                               timestamp=moment))
+            database.session.add(AuditLog(part_id='H-1', user_id=admin.id, action='Редактирование',
+                                          details=f'Правка {i}', timestamp=moment))
+        database.session.commit()
+
+        seen, cursor = [], None
+        while True:
+            entries, next_cursor = history_page('H-1', cursor=cursor, limit=3)
+            seen.extend(entries)
+            if not next_cursor:
+                break
+            cursor = decode_cursor(next_cursor)
+        keys = [(entry.timestamp, entry.type, entry.id) for entry in seen]
+        assert len(seen) == 14 and keys == sorted(keys, reverse=True)
+
+        statuses, _ = history_page('H-1', types=(STATUS,), actor='Иван')
+        assert [entry.title for entry in statuses] == ['Этап 5', 'Этап 3', 'Этап 1']
+        audits, _ = history_page('H-1', types=(AUDIT,), date_from=datetime(2024, 5, 1), date_to=datetime(2024, 5, 1))
+        assert len(audits) == 7 and all(entry.actor == 'admin' for entry in audits)
+        assert history_page('H-1', date_from=datetime(2024, 5, 2))[0] == []
+
+
+def test_history_view_paginates_with_bounded_queries(app, database, query_counter):
+    """Проверяет, что страница истории читает фиксированное число строк и выводит ссылку на продолжение."""
+    from datetime import datetime, timedelta
+    from app.models.models import AuditLog
+    with app.test_request_context():
+        _create_route_with_parts('Изделие HV', ['HV-1'])
+        admin = User.query.filter_by(username='admin').first()
+        database.session.add_all([AuditLog(part_id='HV-1', user_id=admin.id, action='Редактирование',
+                                           timestamp=datetime(2024, 1, 1) + timedelta(minutes=i)) for i in range(120)])
+        database.session.commit()
+        guest = app.test_client()
+        with query_counter() as statements:
+            response = guest.get(url_for('main.history', part_id='HV-1', limit=50))
+        html = response.get_data(as_text=True)
+        assert response.status_code == 200 and len(statements) == 2
+        assert html.count('⚙ Редактирование') == 50
+        assert 'before=' in html and 'Более ранние записи' in html
+
+        filtered = guest.get(url_for('main.history', part_id='HV-1', type='status')).get_data(as_text=True)
+        assert 'История пуста' in filtered
+
+
+# === 17. Тесты журнала аудита ===
+
+def test_audit_log_keyset_pages_both_directions(app, database):
+    """Проверяет переходы по журналу вперед и назад по курсору, фильтры и примерный подсчет."""
+    from datetime import datetime, timedelta
+    from app.models.models import AuditLog
+    from app.audit import audit_log_page, audit_filter_conditions, approximate_count
+    with app.test_request_context():
+        admin = User.query.filter_by(username='admin').first()
+        start = datetime(2024, 3, 1)
+        database.session.add_all([
+            AuditLog(user_id=admin.id, action='Создание' if i % 3 else 'Удаление', part_id=f'AL-{i % 2}',
+                     timestamp=start + timedelta(minutes=i // 2))
+            for i in range(11)
+        ])
+        database.session.commit()
+        expected = [log.id for log in AuditLog.query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc())]
+
+        pages, before = [], None
+        while True:
+            logs, has_newer, has_older = audit_log_page([], before=before, limit=4)
+            pages.append(logs)
+            assert has_newer == (before is not None)
+            if not has_older:
+                break
+            before = (logs[-1].timestamp, logs[-1].id)
+        assert [log.id for page in pages for log in page] == expected
+        # Обратный переход со второй страницы возвращает первую
+        first = pages[1][0]
+        logs, has_newer, has_older = audit_log_page([], after=(first.timestamp, first.id), limit=4)
+        assert [log.id for log in logs] == [log.id for log in pages[0]] and not has_newer and has_older
+
+        conditions = audit_filter_conditions(action='Удаление', part_id='AL-0')
+        logs, _, _ = audit_log_page(conditions)
+        assert [log.id for log in logs] == [log_id for log_id in expected
+                                            if (log_id - 1) % 3 == 0 and (log_id - 1) % 2 == 0]
+        assert approximate_count(conditions) == (len(logs), True)
+        assert approximate_count([]) == (11, False)
+
+
+def test_audit_log_view_filters_with_fixed_queries(app, client, database, query_counter):
+    """Проверяет страницу журнала: фильтр по действию, ссылки на курсор, без запросов на каждую строку."""
+    from datetime import datetime, timedelta
+    from app.models.models import AuditLog
+    with app.test_request_context():
+        admin = User.query.filter_by(username='admin').first()
+        admin.can_view_audit_log = True
+        database.session.add_all([AuditLog(user_id=admin.id, action='Редактирование', part_id=f'AV-{i}',
+                                           timestamp=datetime(2024, 1, 1) + timedelta(minutes=i)) for i in range(60)])
+        database.session.commit()
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        with query_counter() as statements:
+            html = client.get(url_for('admin.audit_log')).get_data(as_text=True)
+        assert 'Старее' in html and 'before=' in html and 'AV-59' in html and 'AV-34' not in html
+        # Пользователь сессии, страница, подсчет, список пользователей - без N+1 по строкам
+        assert len(statements) <= 5
+
+        filtered = client.get(url_for('admin.audit_log', action='Редактирование', part_id='AV-7')).get_data(as_text=True)
+        assert 'AV-7<' in filtered and 'AV-59' not in filtered and 'Найдено записей: 1.' in filtered
+        client.get(url_for('admin.logout'))
+
+
+def test_audit_writer_records_synchronously_in_tests(app, database):
+    """Проверяет, что в синхронном режиме запись журнала видна сразу после действия."""
+    from app.models.models import AuditLog
+    guest = app.test_client()
+    with app.test_request_context():
+        guest.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        guest.get(url_for('admin.logout'))
+        actions = [log.action for log in AuditLog.query.order_by(AuditLog.id)]
+    assert actions == ['Вход в систему', 'Выход из системы']
+
+
+def test_audit_writer_flushes_batches_in_background(tmp_path):
+    """Проверяет фоновую запись пакетами и запись остатка очереди при остановке."""
+    from app import create_app, db
+    from app.audit import audit_writer
+    from app.models.models import AuditLog
+    from config import TestingConfig
+
+    class AsyncAuditConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'audit.db'}"
+        AUDIT_SYNCHRONOUS = False
+        AUDIT_BATCH_SIZE = 50
+        AUDIT_FLUSH_INTERVAL = 0.05
+
+    app = create_app(AsyncAuditConfig)
+    with app.app_context():
+        db.create_all()
+        admin = User(username='admin', role='admin')
+        admin.set_password('password123')
+        db.session.add(admin)
+        db.session.commit()
+        admin_id = admin.id
+
+    inserts = []
+    from sqlalchemy import event
+    with app.app_context():
+        engine = db.engine
+    listener = lambda conn, cursor, statement, *args: inserts.append(statement) if statement.startswith('INSERT INTO "AuditLogs"') else None
+    event.listen(engine, 'before_cursor_execute', listener)
+    try:
+        with app.app_context():
+            for i in range(120):
+                audit_writer.record(admin_id, 'Редактирование', f'Запись {i}')
+            audit_queue = app.extensions['audit_writer']
+            assert audit_queue.thread is not None
+        audit_queue.shutdown()
+    finally:
+        event.remove(engine, 'before_cursor_execute', listener)
+
+    with app.app_context():
+        details = [log.details for log in AuditLog.query.order_by(AuditLog.id)]
+        db.session.remove()
+    assert details == [f'Запись {i}' for i in range(120)]
+    assert audit_queue.queue.empty() and len(inserts) < 120
+
+    # После остановки очереди (завершение процесса) запись идет сразу, без потока
+    with app.app_context():
+        audit_writer.record(admin_id, 'Выход из системы', 'После остановки')
+        assert audit_queue.thread is None and audit_queue.queue.empty()
+        assert AuditLog.query.filter_by(details='После остановки').count() == 1
+        db.session.remove()
+
+
+# === 18. Тесты архива журнала аудита ===
+
+def test_archive_audit_logs_moves_old_rows_to_monthly_files(app, database, tmp_path, monkeypatch):
+    """Проверяет перенос старых записей в месячные файлы, указатель по детали и чтение архива."""
+    from datetime import datetime
+    from app.models.models import Part, AuditLog, AuditArchiveIndex, User
+    from app.audit_archive import archive_audit_logs, archived_entries, archived_entry_count
+    monkeypatch.setitem(app.config, 'AUDIT_ARCHIVE_FOLDER', str(tmp_path))
+    with app.app_context():
+        admin_id = User.query.filter_by(username='admin').one().id
+        database.session.add_all([Part(part_id='AR-1', product_designation='Изделие А'),
+                                  Part(part_id='AR-2', product_designation='Изделие А')])
+        database.session.add_all([
+            AuditLog(user_id=admin_id, part_id='AR-1', action='Создание', details='Январь', timestamp=datetime(2024, 1, 5)),
+            AuditLog(user_id=admin_id, part_id='AR-1', action='Редактирование', details='Февраль', timestamp=datetime(2024, 2, 7)),
+            AuditLog(user_id=admin_id, part_id='AR-2', action='Создание', details='Другая деталь', timestamp=datetime(2024, 2, 8)),
+            AuditLog(user_id=admin_id, action='Вход в систему', timestamp=datetime(2024, 2, 9)),
+            AuditLog(user_id=admin_id, part_id='AR-1', action='Редактирование', details='Свежая', timestamp=datetime(2024, 4, 1)),
+        ])
+        database.session.commit()
+
+        # Маленькая порция проверяет перенос в несколько транзакций
+        assert archive_audit_logs(datetime(2024, 3, 1), chunk_size=2) == 4
+        assert [log.details for log in AuditLog.query] == ['Свежая']
+        assert sorted(path.name for path in tmp_path.iterdir()) == ['audit-2024-01.jsonl.gz', 'audit-2024-02.jsonl.gz']
+        index = {(row.part_id, row.month): row.entries for row in AuditArchiveIndex.query}
+        assert index == {('AR-1', '2024-01'): 1, ('AR-1', '2024-02'): 1, ('AR-2', '2024-02'): 1, ('', '2024-02'): 1}
+        assert archived_entry_count('AR-1') == 2
+        entries = archived_entries('AR-1')
+        assert [(entry.details, entry.actor) for entry in entries] == [('Февраль', 'admin'), ('Январь', 'admin')]
+
+        # Повторный перенос дописывает файлы и увеличивает счетчики указателя
+        database.session.add(AuditLog(user_id=admin_id, part_id='AR-1', action='Удаление', details='Еще январь',
+                                      timestamp=datetime(2024, 1, 20)))
+        database.session.commit()
+        assert archive_audit_logs(datetime(2024, 3, 1)) == 1
+        assert archived_entry_count('AR-1') == 3
+        assert [entry.details for entry in archived_entries('AR-1')] == ['Февраль', 'Еще январь', 'Январь']
+
+        with app.test_request_context():
+            page = app.test_client().get(url_for('main.history', part_id='AR-1')).get_data(as_text=True)
+            assert 'перенесены в архив' in page and 'Свежая' in page and 'Февраль' not in page
+            archive = app.test_client().get(url_for('main.history', part_id='AR-1', archive=1)).get_data(as_text=True)
+            assert 'Февраль' in archive and 'Еще январь' in archive and 'Свежая' not in archive
+
+
+def test_archive_audit_command_and_part_delete(app, client, database, tmp_path, monkeypatch):
+    """Проверяет команду 'flask archive-audit' и удаление детали вместе с ее журналом и указателем архива."""
+    from datetime import datetime, timedelta
+    from app.models.models import Part, AuditLog, AuditArchiveIndex, User
+    monkeypatch.setitem(app.config, 'AUDIT_ARCHIVE_FOLDER', str(tmp_path))
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').one()
+        admin.can_delete_parts = True
+        admin_id = admin.id
+        database.session.add(Part(part_id='AR-3', product_designation='Изделие Б'))
+        database.session.add_all([
+            AuditLog(user_id=admin_id, part_id='AR-3', action='Создание', timestamp=datetime.utcnow() - timedelta(days=40)),
+            AuditLog(user_id=admin_id, part_id='AR-3', action='Редактирование', timestamp=datetime.utcnow()),
+        ])
+        database.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['archive-audit', '--older-than-days', '30'])
+    assert 'Перенесено в архив записей журнала аудита: 1' in result.output
+
+    with app.test_request_context():
+        client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+        client.post(url_for('admin.delete_part', part_id='AR-3'))
+        assert database.session.get(Part, 'AR-3') is None
+        assert AuditLog.query.filter_by(part_id='AR-3').count() == 0
+        assert AuditArchiveIndex.query.filter_by(part_id='AR-3').count() == 0
+        client.get(url_for('admin.logout'))
+
+
+
+def test_archive_audit_rerun_after_interruption_does_not_duplicate(app, database, tmp_path, monkeypatch):
+    """Проверяет, что повторный перенос после сбоя не дописывает в архив уже записанную порцию."""
+    import gzip
+    import pytest
+    from datetime import datetime
+    from app import audit_archive
+    from app.models.models import AuditLog, AuditArchiveIndex, User
+    monkeypatch.setitem(app.config, 'AUDIT_ARCHIVE_FOLDER', str(tmp_path))
+    with app.app_context():
+        admin_id = User.query.filter_by(username='admin').one().id
+        database.session.add_all([AuditLog(user_id=admin_id, part_id='AR-4', action='Редактирование',
+                                           details=f'Запись {day}', timestamp=datetime(2024, 1, day))
+                                  for day in range(1, 6)])
+        database.session.commit()
+
+        # Порция дописана в файл, но транзакция с удалением строк не зафиксирована
+        def interrupted(counts):
+            raise RuntimeError('сбой переноса')
+        with monkeypatch.context() as patch:
+            patch.setattr(audit_archive, '_add_to_index', interrupted)
+            with pytest.raises(RuntimeError):
+                audit_archive.archive_audit_logs(datetime(2024, 2, 1), chunk_size=3)
+        database.session.rollback()
+        assert AuditLog.query.count() == 5
+
+        # Повторный запуск с меньшей порцией: прерванный диапазон разбивается на две порции
+        assert audit_archive.archive_audit_logs(datetime(2024, 2, 1), chunk_size=2) == 5
+        with gzip.open(audit_archive.archive_path('2024-01'), 'rt', encoding='utf-8') as f:
+            assert len(f.readlines()) == 5
+        assert [row.entries for row in AuditArchiveIndex.query] == [5]
+        assert [entry.details for entry in audit_archive.archived_entries('AR-4')] == \
+            [f'Запись {day}' for day in range(5, 0, -1)]
+        assert [path.name for path in tmp_path.iterdir()] == ['audit-2024-01.jsonl.gz']
+
+# === 19. Тесты отчета по длительности этапов ===
+
+def test_stage_duration_report_percentiles_and_filters(app, client, database):
+    """Проверяет длительности этапов по LAG, перцентили и фильтры по маршруту и периоду."""
+    from datetime import datetime, timedelta
+    from app.models.models import StatusHistory
+    from app.reports import stage_duration_report, format_duration
+    with app.app_context():
+        route = _create_route_with_parts('Изделие Д', [f'SD-{i}' for i in range(1, 21)])
+        start = datetime(2024, 5, 1, 8, 0)
+        for i in range(1, 21):
+            # Этап 2 детали SD-i занимает i часов после этапа 1
+            database.session.add_all([
+                StatusHistory(part_id=f'SD-{i}', status='Test Stage 1', operator_name='Оператор', timestamp=start),
+                StatusHistory(part_id=f'SD-{i}', status='Test Stage 2', operator_name='Оператор',
+                              timestamp=start + timedelta(hours=i)),
+            ])
+        database.session.commit()
+
+        (row,) = stage_duration_report()
+        assert (row.route_name, row.stage, row.count) == (route.name, 'Test Stage 2', 20)
+        assert row.min_seconds == 3600 and row.median_seconds == 10 * 3600
+        assert row.p95_seconds == 19 * 3600 and round(row.avg_seconds) == 37800
+        assert format_duration(row.p95_seconds) == '19:00:00' and format_duration(90061) == '1 д 01:01:01'
+
+        # Этапы, завершенные 2 мая, считаются от этапа 1 (1 мая), который вне периода
+        (row,) = stage_duration_report(date_from=datetime(2024, 5, 2), date_to=datetime(2024, 5, 2))
+        assert row.count == 5 and row.min_seconds == 16 * 3600
+        assert stage_duration_report(route_template_id=route.id + 1) == []
+
+        with app.test_request_context():
+            client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+            admin = User.query.filter_by(username='admin').one()
+            admin.can_view_reports = True
+            database.session.commit()
+            page = client.get(url_for('admin.report_stage_duration', route_id=route.id)).get_data(as_text=True)
+            assert 'Test Stage 2' in page and '10:00:00' in page and '19:00:00' in page
+            client.get(url_for('admin.logout'))
+
+
+# === 20. Тесты дневной сводки этапов ===
+
+def test_daily_stats_follow_confirm_cancel_and_delete(app, client, database):
+    """Проверяет инкрементальную дневную сводку: она совпадает с полной перестройкой и питает отчеты."""
+    from datetime import datetime, date
+    from app.models.models import StatusHistory, DailyStageStats
+    from app.scanning import confirm_part_stage, confirm_stages_batch
+    from app.daily_stats import rebuild_daily_stats
+    from app.reports import operator_performance, stage_throughput, daily_output
+
+    def snapshot():
+        return {(row.day, row.operator_name, row.stage): row.completed for row in DailyStageStats.query}
+
+    with app.app_context():
+        _create_route_with_parts('Изделие С', ['DS-1', 'DS-2', 'DS-3'])
+        confirm_part_stage('DS-1', 'Test Stage 1', 'Иванов', timestamp=datetime(2024, 6, 3, 9, 0))
+        confirm_part_stage('DS-2', 'Test Stage 1', 'Иванов', timestamp=datetime(2024, 6, 3, 17, 0))
+        confirm_stages_batch([
+            {'part_id': 'DS-1', 'stage': 'Test Stage 2', 'operator': 'Петров', 'client_timestamp': '2024-06-04T10:00:00'},
+            {'part_id': 'DS-3', 'stage': 'Test Stage 1', 'operator': 'Петров', 'client_timestamp': '2024-06-04T11:00:00'},
+            {'part_id': 'DS-3', 'stage': 'Test Stage 2', 'operator': 'Петров', 'client_timestamp': '2024-06-04T12:00:00'},
+        ], 'Не указан')
+        assert snapshot() == {(date(2024, 6, 3), 'Иванов', 'Test Stage 1'): 2,
+                              (date(2024, 6, 4), 'Петров', 'Test Stage 2'): 2,
+                              (date(2024, 6, 4), 'Петров', 'Test Stage 1'): 1}
+
+        admin = User.query.filter_by(username='admin').one()
+        admin.can_edit_parts = admin.can_delete_parts = admin.can_view_reports = True
+        database.session.commit()
+        cancelled = StatusHistory.query.filter_by(part_id='DS-2').one().id
+        with app.test_request_context():
+            client.post(url_for('admin.login'), data={'username': 'admin', 'password': 'password123'})
+            client.post(url_for('admin.cancel_stage', history_id=cancelled))
+            client.post(url_for('admin.delete_part', part_id='DS-3'))
+            incremental = snapshot()
+            assert incremental == {(date(2024, 6, 3), 'Иванов', 'Test Stage 1'): 1,
+                                   (date(2024, 6, 4), 'Петров', 'Test Stage 2'): 1}
+            assert rebuild_daily_stats() == 2 and snapshot() == incremental
+
+            assert [tuple(row) for row in operator_performance()] == [('Иванов', 1), ('Петров', 1)]
+            # Дата "по" включается в период целиком
+            june_3 = datetime(2024, 6, 3)
+            assert [tuple(row) for row in operator_performance(date_to=june_3)] == [('Иванов', 1)]
+            assert [tuple(row) for row in stage_throughput(date_from=datetime(2024, 6, 4))] == [('Test Stage 2', 1)]
+            assert [tuple(row) for row in daily_output()] == [(date(2024, 6, 3), 1), (date(2024, 6, 4), 1)]
+
+            page = client.get(url_for('admin.report_stage_throughput', date_from='2024-06-01')).get_data(as_text=True)
+            assert '2024-06-04' in page and 'Test Stage 2' in page
+            page = client.get(url_for('admin.report_operator_performance', date_to='2024-06-03')).get_data(as_text=True)
+            assert 'Иванов' in page and 'Петров' not in page
+            client.get(url_for('admin.logout'))
+
+    result = app.test_cli_runner().invoke(args=['rebuild-daily-stats'])
+    assert 'Дневная сводка этапов перестроена: 2 строк.' in result.output